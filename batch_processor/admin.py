@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import AudioFile, Transcript, SpeakerMap
+from .models import AudioFile, Transcript, SpeakerMap, ProcessingJob
 
 @admin.register(SpeakerMap)
 class SpeakerMapAdmin(admin.ModelAdmin):
@@ -15,3 +15,9 @@ class AudioFileAdmin(admin.ModelAdmin):
 class TranscriptAdmin(admin.ModelAdmin):
     list_display = ('audio', 'created_at')
     filter_horizontal = ('speaker_mapping',)
+
+@admin.register(ProcessingJob)
+class ProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ('audio', 'status', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('audio__title', 'error_message')
@@ -0,0 +1,67 @@
+"""
+Word timings from the ASR Document, kept with the Transcript.
+
+Rev.ai returns a time for every word. They are read from the JSON dump of
+the batchalign Document (the same dump the ASR cache stores) and saved per
+utterance, so forced alignment can reuse them instead of starting from text.
+"""
+
+import re
+
+# Tokens that are punctuation rather than words, as in the forced-alignment output
+PUNCTUATION = ".,;:!?\"'()[]{}"
+_NON_WORD = re.compile(r"[^\w']+")
+
+def _token_time(token):
+    """(start_ms, end_ms) of a serialised token, or None"""
+    time = token.get('time')
+    if isinstance(time, (list, tuple)) and len(time) == 2 and None not in time:
+        return time[0], time[1]
+    if token.get('start_ms') is not None and token.get('end_ms') is not None:
+        return token['start_ms'], token['end_ms']
+    return None
+
+def asr_word_timings(document_json):
+    """
+    [{'text', 'start', 'end', 'words': [[word, start, end], ...]}, ...] per
+    utterance (times in seconds) from a Document dumped with model_dump(mode='json')
+    """
+    utterances = []
+    for item in (document_json or {}).get('content', []):
+        tokens = item.get('content') if isinstance(item, dict) else None
+        if not isinstance(tokens, list):
+            tokens = item.get('tokens') if isinstance(item, dict) else None
+        if not isinstance(tokens, list):
+            continue  # Not an utterance (headers, comments)
+
+        words = []
+        for token in tokens:
+            if not isinstance(token, dict) or not token.get('text') or token['text'].strip() in PUNCTUATION:
+                continue
+            time = _token_time(token)
+            if time is not None:
+                words.append([token['text'], time[0] / 1000.0, time[1] / 1000.0])
+        if not words:
+            continue
+        utterances.append({
+            'text': ' '.join(word for word, _, _ in words),
+            'start': words[0][1],
+            'end': max(end for _, _, end in words),
+            'words': words,
+        })
+    return utterances
+
+def prior_key(text):
+    """Case- and punctuation-insensitive form of an utterance, for matching ASR utterances to transcript lines"""
+    return ' '.join(_NON_WORD.sub(' ', (text or '').lower()).split())
+
+def timings_consistent(utterance):
+    """Whether an ASR utterance's word times are usable as alignment as they are"""
+    previous_start = None
+    for _, start, end in utterance['words']:
+        if end <= start or start < utterance['start'] or end > utterance['end']:
+            return False
+        if previous_start is not None and start < previous_start:
+            return False
+        previous_start = start
+    return True
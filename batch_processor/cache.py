@@ -0,0 +1,139 @@
+"""
+Durable, size-bounded caches for expensive results.
+
+Entries are compressed JSON files in BATCHALIGN_CACHE_DIR, outside MEDIA_ROOT,
+so they survive clear_cache and delete_file. Every read touches the file's
+mtime, and writes evict the least recently used entries once the directory
+grows past its byte budget.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import zlib
+from functools import lru_cache
+
+from django.conf import settings
+
+logger = logging.getLogger('batch_processor')
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file on disk, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+@lru_cache(maxsize=None)
+def batchalign_version():
+    """Installed batchalign version, part of every cache key so upgrades never serve stale results"""
+    try:
+        from importlib.metadata import version
+        return version('batchalign')
+    except Exception:
+        return 'unknown'
+
+class DiskCache:
+    """Size-bounded LRU cache of JSON values, shared by every process using the same directory"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts):
+        """Build a cache key from its components"""
+        return hashlib.sha256('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json.z")
+
+    def get(self, key):
+        """Return the cached value, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # Mark as recently used
+            return json.loads(zlib.decompress(data))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, zlib.error) as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            self.delete(key)
+            return None
+
+    def set(self, key, value):
+        """Store a JSON-serialisable value, then evict old entries if over budget"""
+        data = zlib.compress(json.dumps(value).encode('utf-8'))
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.json.z'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                pass
+        logger.info(f"Evicted {removed} entries from cache {self.directory}")
+        return removed
+
+@lru_cache(maxsize=None)
+def asr_cache():
+    """Cache of ASR results, keyed by asr_cache_key"""
+    return DiskCache(os.path.join(settings.BATCHALIGN_CACHE_DIR, 'asr'), settings.BATCHALIGN_ASR_CACHE_MAX_BYTES)
+
+def asr_cache_key(content_hash, lang, engine):
+    return DiskCache.make_key('asr', content_hash, lang, engine, batchalign_version())
+
+# CHAT time bullets (\x15start_end\x15) change with every alignment and are not part of the text
+_BULLET = re.compile('\x15[^\x15]*\x15')
+
+def normalized_text_hash(text):
+    """SHA-256 of transcript text with time bullets removed and whitespace collapsed line by line"""
+    lines = (' '.join(_BULLET.sub(' ', line).split()) for line in (text or '').splitlines())
+    return hashlib.sha256('\n'.join(line for line in lines if line).encode('utf-8')).hexdigest()
+
+@lru_cache(maxsize=None)
+def alignment_cache():
+    """Cache of forced-alignment word timestamps, keyed by alignment_cache_key"""
+    return DiskCache(os.path.join(settings.BATCHALIGN_CACHE_DIR, 'alignment'), settings.BATCHALIGN_ALIGNMENT_CACHE_MAX_BYTES)
+
+def alignment_cache_key(audio_hash, text_hash, engine, lang):
+    return DiskCache.make_key('fa', audio_hash, text_hash, engine, lang, batchalign_version())
@@ -0,0 +1,152 @@
+"""
+Single-pass parsing of CHAT transcripts.
+
+parse_chat() reads a CHAT string once into a JSON-serialisable dict, which
+Transcript keeps in `chat_parsed` (see Transcript.parsed_chat) until its
+chat_content changes:
+
+    headers       {'Languages': 'eng', 'Media': 'talk, audio', ...}, first occurrence of each
+    participants  [{'id': 'MOT', 'name': 'Mother'}, ...] from @Participants
+    ids           the @ID lines, verbatim
+    header_end    character offset where the header block (the leading @ lines) ends
+    utterances    [{'speaker', 'text', 'start_ms', 'end_ms'}, ...] from the * tiers,
+                  continuation lines joined and time bullets taken out of the text
+    speakers      the speaker codes of the utterances, in order of appearance
+
+map_speakers() produces the speaker-mapped output that Transcript stores as
+its download rendition (see Transcript.mapped_chat_bytes).
+"""
+
+import hashlib
+import json
+import re
+
+# Bumped when the parsed form changes, so stored forms are rebuilt
+PARSE_VERSION = 2
+
+_BULLET = re.compile(r'\x15(\d+)_(\d+)\x15')
+
+def _participants(value):
+    participants = []
+    for part in value.split(','):
+        words = part.split()
+        if words:
+            participants.append({'id': words[0], 'name': ' '.join(words[1:])})
+    return participants
+
+def _logical_lines(content):
+    """(offset, line) for each line of `content`, with tab continuation lines joined onto the line they continue"""
+    offset = 0
+    current = None
+    for raw_line in (content or '').split('\n'):
+        line = raw_line.rstrip('\r')
+        if line.startswith('\t') and current is not None and current[1].strip():
+            current[1] += ' ' + line.strip()
+        else:
+            if current is not None:
+                yield tuple(current)
+            current = [offset, line]
+        offset += len(raw_line) + 1
+    if current is not None:
+        yield tuple(current)
+
+def parse_chat(content):
+    parsed = {
+        'version': PARSE_VERSION,
+        'headers': {},
+        'participants': [],
+        'ids': [],
+        'header_end': 0,
+        'utterances': [],
+        'speakers': [],
+    }
+    headers = parsed['headers']
+    utterances = parsed['utterances']
+    seen_speakers = set()
+    in_header = True
+
+    # Wrapped headers (a long @Participants, say) stay inside the header block
+    for line_start, line in _logical_lines(content):
+        if line.startswith('@'):
+            name, _, value = line[1:].partition(':')
+            value = value.strip()
+            if name == 'ID':
+                parsed['ids'].append(line)
+            elif name == 'Participants' and not parsed['participants']:
+                parsed['participants'] = _participants(value)
+            headers.setdefault(name, value)
+            continue
+
+        if in_header and line.strip():
+            in_header = False
+            parsed['header_end'] = line_start
+
+        if line.startswith('*') and ':' in line:
+            speaker, _, text = line[1:].partition(':')
+            speaker = speaker.strip()
+            utterances.append({'speaker': speaker, 'text': text.strip(), 'start_ms': None, 'end_ms': None})
+            if speaker and speaker not in seen_speakers:
+                seen_speakers.add(speaker)
+                parsed['speakers'].append(speaker)
+
+    if in_header:
+        parsed['header_end'] = len(content or '')
+
+    # Time bullets, once the continuation lines are joined
+    for utterance in utterances:
+        bullets = _BULLET.findall(utterance['text'])
+        if bullets:
+            utterance['start_ms'] = int(bullets[0][0])
+            utterance['end_ms'] = int(bullets[-1][1])
+            utterance['text'] = ' '.join(_BULLET.sub(' ', utterance['text']).split())
+    return parsed
+
+def speaker_codes(parsed):
+    """Speakers from @Participants when present, otherwise from the utterance tiers"""
+    codes = [participant['id'] for participant in parsed['participants']]
+    return codes or list(parsed['speakers'])
+
+def speaker_info(parsed):
+    """{code: {'role', 'display_name'}} for the speakers of a CHAT upload"""
+    info = {participant['id']: {'role': participant['id'], 'display_name': participant['name']}
+            for participant in parsed['participants'] if participant['name']}
+    if not info:
+        info = {speaker: {'role': '', 'display_name': speaker} for speaker in parsed['speakers']}
+    return info
+
+def rewrite_header(content, parsed, participants_line, id_lines):
+    """
+    Replace the @Participants line and the @ID lines of `content` (the first
+    @ID line becomes `id_lines`, the others are dropped), along with their
+    continuation lines. Only the header block is split; the utterances are
+    carried over as they are.
+    """
+    header_end = parsed['header_end']
+    updated_lines = []
+    ids_written = False
+    replacing = False  # Whether the line being continued was replaced
+    for line in content[:header_end].split('\n'):
+        if line.startswith('\t') and replacing:
+            continue
+        replacing = line.startswith(('@Participants:', '@ID:'))
+        if line.startswith('@Participants:'):
+            updated_lines.append(participants_line)
+        elif line.startswith('@ID:'):
+            if not ids_written:
+                updated_lines.extend(id_lines)
+                ids_written = True
+        else:
+            updated_lines.append(line)
+    return '\n'.join(updated_lines) + content[header_end:]
+
+def map_speakers(content, mapping):
+    """`content` with the code of every *CODE: speaker tier replaced per `mapping`, in one pass"""
+    mapping = {code: role for code, role in mapping.items() if code != role}
+    if not mapping:
+        return content
+    codes = '|'.join(re.escape(code) for code in mapping)
+    return re.sub(rf'^\*({codes}):', lambda match: f"*{mapping[match.group(1)]}:", content, flags=re.M)
+
+def mapping_key(mapping):
+    """Fingerprint of a speaker mapping, recorded with the rendition built from it"""
+    return hashlib.sha256(json.dumps(sorted(mapping.items())).encode('utf-8')).hexdigest()
@@ -0,0 +1,127 @@
+"""
+Speaker clustering of diarization window embeddings.
+
+The number of speakers is estimated from the data (eigengap of the cosine
+affinity matrix) unless the caller fixes it or gives a distance threshold.
+Full pairwise clustering costs O(n^2) memory, so past
+BATCHALIGN_CLUSTER_FULL_LIMIT windows only a sample is clustered and every
+window is then assigned to the nearest centroid in fixed-size chunks,
+keeping memory flat however long the recording is.
+"""
+
+import logging
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger('batch_processor')
+
+# Rows per matrix product when assigning windows to centroids
+_ASSIGN_CHUNK = 8192
+
+def normalize(embeddings):
+    """L2-normalise rows so dot products are cosine similarities"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-8)
+
+def estimate_num_speakers(embeddings, min_speakers=1, max_speakers=8, neighbours=None):
+    """
+    Estimate the speaker count from the largest eigengap of the normalised
+    Laplacian of a pruned cosine affinity graph. `embeddings` must be normalised.
+    """
+    n = len(embeddings)
+    if n <= min_speakers:
+        return max(1, n)
+
+    affinity = np.clip(embeddings @ embeddings.T, 0.0, 1.0)
+
+    # Keep each window's strongest neighbours only, so cross-speaker similarity doesn't blur the spectrum
+    neighbours = neighbours or max(5, n // 10)
+    if neighbours < n:
+        cutoff = np.partition(affinity, n - neighbours, axis=1)[:, n - neighbours][:, None]
+        affinity = np.where(affinity >= cutoff, affinity, 0.0)
+        affinity = np.maximum(affinity, affinity.T)
+
+    degree = affinity.sum(axis=1)
+    inv_sqrt = 1.0 / np.sqrt(np.maximum(degree, 1e-8))
+    laplacian = np.eye(n) - inv_sqrt[:, None] * affinity * inv_sqrt[None, :]
+    eigenvalues = np.linalg.eigvalsh(laplacian)
+
+    max_speakers = min(max_speakers, n - 1)
+    gaps = np.diff(eigenvalues[:max_speakers + 1])
+    # gaps[k - 1] is the gap after the k-th smallest eigenvalue, i.e. evidence for k clusters
+    candidates = gaps[min_speakers - 1:max_speakers]
+    if len(candidates) == 0:
+        return min_speakers
+    return int(np.argmax(candidates)) + min_speakers
+
+def _agglomerative(embeddings, num_speakers=None, distance_threshold=None):
+    from sklearn.cluster import AgglomerativeClustering
+
+    if num_speakers is not None and num_speakers <= 1:
+        return np.zeros(len(embeddings), dtype=np.int64)
+    clustering = AgglomerativeClustering(
+        n_clusters=num_speakers,
+        distance_threshold=distance_threshold if num_speakers is None else None,
+        metric="cosine",
+        linkage="average"
+    )
+    return clustering.fit_predict(embeddings)
+
+def centroids_of(embeddings, labels):
+    """Normalised mean embedding of each label, in label order"""
+    unique = np.unique(labels)
+    return unique, normalize(np.vstack([embeddings[labels == label].mean(axis=0) for label in unique]))
+
+def assign_to_centroids(embeddings, centroids):
+    """Index of the most similar centroid for every row, computed chunk by chunk"""
+    labels = np.empty(len(embeddings), dtype=np.int64)
+    for start in range(0, len(embeddings), _ASSIGN_CHUNK):
+        chunk = normalize(embeddings[start:start + _ASSIGN_CHUNK])
+        labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+def cluster_speakers(embeddings, num_speakers=None, distance_threshold=None,
+                     min_speakers=None, max_speakers=None, full_limit=None, sample_size=None, seed=0):
+    """
+    Assign a speaker label (0..k-1) to every embedding.
+    A fixed `num_speakers` wins over `distance_threshold`; with neither,
+    the count is estimated by eigengap within [min_speakers, max_speakers].
+    """
+    min_speakers = min_speakers or settings.BATCHALIGN_MIN_SPEAKERS
+    max_speakers = max_speakers or settings.BATCHALIGN_MAX_SPEAKERS
+    full_limit = full_limit or settings.BATCHALIGN_CLUSTER_FULL_LIMIT
+    sample_size = min(sample_size or settings.BATCHALIGN_CLUSTER_SAMPLE_SIZE, full_limit)
+
+    n = len(embeddings)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if n == 1:
+        return np.zeros(1, dtype=np.int64)
+
+    if n <= full_limit:
+        sample = normalize(embeddings)
+    else:
+        # Cluster an evenly spread random sample; the rest are assigned to its centroids below
+        rng = np.random.default_rng(seed)
+        sample = normalize(embeddings[np.sort(rng.choice(n, size=sample_size, replace=False))])
+        logger.info(f"Clustering a sample of {sample_size} of {n} windows")
+
+    if num_speakers is None and distance_threshold is None:
+        num_speakers = estimate_num_speakers(sample, min_speakers, max_speakers)
+        logger.info(f"Estimated {num_speakers} speakers")
+    if num_speakers is not None:
+        num_speakers = max(1, min(num_speakers, len(sample)))
+
+    sample_labels = _agglomerative(sample, num_speakers, distance_threshold)
+    if n <= full_limit:
+        labels = sample_labels
+    else:
+        _, centroids = centroids_of(sample, sample_labels)
+        labels = assign_to_centroids(embeddings, centroids)
+
+    # Renumber so labels are 0..k-1 in order of first appearance
+    _, first_seen, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    order = np.argsort(np.argsort(first_seen))
+    return order[inverse]
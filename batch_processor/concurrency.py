@@ -0,0 +1,69 @@
+"""
+Per-host concurrency cap shared by every worker process on this machine.
+
+Each host gets a fixed number of lock files; holding an exclusive flock on one
+of them is holding one submission slot. Locks are released by the kernel when
+a process dies, so a crashed worker never leaks a slot.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to a per-process cap
+    fcntl = None
+
+logger = logging.getLogger('batch_processor')
+
+_local_semaphores = {}
+_local_semaphores_lock = threading.Lock()
+
+def _lock_dir():
+    path = getattr(settings, 'BATCHALIGN_LOCK_DIR', None) or os.path.join(tempfile.gettempdir(), 'batchalign_locks')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+@contextmanager
+def _local_slot(host, limit):
+    with _local_semaphores_lock:
+        semaphore = _local_semaphores.setdefault(host, threading.BoundedSemaphore(limit))
+    with semaphore:
+        yield
+
+@contextmanager
+def host_slot(host, limit=None, poll_interval=0.5):
+    """Block until one of the `limit` submission slots for `host` is free, and hold it"""
+    limit = max(1, limit or settings.BATCHALIGN_ASR_MAX_PER_HOST)
+
+    if fcntl is None:
+        with _local_slot(host, limit):
+            yield
+        return
+
+    lock_dir = _lock_dir()
+    waited = False
+    while True:
+        for slot in range(limit):
+            fd = os.open(os.path.join(lock_dir, f"{host}.{slot}.lock"), os.O_CREAT | os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                continue
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+            return
+        if not waited:
+            logger.info(f"All {limit} slots for {host} are busy, waiting")
+            waited = True
+        time.sleep(poll_interval)
@@ -0,0 +1,139 @@
+"""
+DB-backed job queue for transcription.
+
+Uploads only create a ProcessingJob row; the actual Rev.ai round trip runs in
+the worker processes started by `python manage.py run_workers`, so request
+latency no longer depends on the length of the recording.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import ProcessingJob, Transcript
+
+logger = logging.getLogger('batch_processor')
+
+# ASR engine used for uploads, and the remote host it submits to (for the per-host concurrency cap)
+ASR_ENGINE = "rev"
+ASR_HOST = "api.rev.ai"
+
+def worker_name():
+    """Identify the current worker thread as host:pid:thread"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+def enqueue_transcription(audio, lang="eng", batch_id=None):
+    """Queue an AudioFile for transcription and return the new job"""
+    job = ProcessingJob.objects.create(audio=audio, lang=lang, batch_id=batch_id)
+    logger.info(f"Queued transcription job {job.id} for {audio.title}")
+    return job
+
+def claim_next_job(worker=None):
+    """
+    Atomically claim the oldest queued job.
+    The conditional UPDATE guarantees that only one worker wins each job,
+    even when several processes poll the table at the same time.
+    """
+    worker = worker or worker_name()
+    while True:
+        job = ProcessingJob.objects.filter(status='QUEUED').order_by('created_at', 'id').first()
+        if job is None:
+            return None
+        claimed = ProcessingJob.objects.filter(id=job.id, status='QUEUED').update(
+            status='RUNNING',
+            worker=worker,
+            started_at=timezone.now()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+        # Another worker took it first, try the next one
+
+def requeue_stale_jobs():
+    """Put jobs left RUNNING by a crashed worker back in the queue"""
+    count = ProcessingJob.objects.filter(status='RUNNING').update(status='QUEUED', worker='', started_at=None)
+    if count:
+        logger.warning(f"Requeued {count} stale running jobs")
+    return count
+
+def save_transcript(audio, raw_content, chat_content, diarization_data, asr_words=None):
+    """Create or update the transcript of an AudioFile with freshly processed content"""
+    transcript, _ = Transcript.objects.update_or_create(
+        audio=audio,
+        defaults={
+            'raw_content': raw_content,
+            'chat_content': chat_content,
+            'diarization_data': diarization_data,
+            'asr_words': asr_words
+        }
+    )
+    return transcript
+
+def run_job(job):
+    """Run a claimed job to completion, recording DONE or FAILED on the row"""
+    # Imported here so the queue can be used without loading batchalign
+    from .views import process_audio
+
+    try:
+        audio = job.audio
+        if not audio.audio_file:
+            raise ValueError("Audio file not found")
+
+        raw_content, chat_content, diarization_data, speakers, asr_words = process_audio(
+            audio.audio_file.path, lang=job.lang, content_hash=audio.content_hash
+        )
+        if not (raw_content and chat_content):
+            raise ValueError("Audio processing failed. Please make sure your Rev.ai API key is set up correctly.")
+
+        transcript = save_transcript(audio, raw_content, chat_content, diarization_data, asr_words)
+        logger.info(f"Job {job.id} produced transcript {transcript.id} with speakers: {speakers}")
+
+        job.status = 'DONE'
+        job.error_message = None
+    except Exception as e:
+        logger.exception(f"Job {job.id} failed: {e}")
+        job.status = 'FAILED'
+        job.error_message = str(e)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error_message', 'finished_at'])
+    return job.status == 'DONE'
+
+def work_forever(poll_interval, stop_event=None, sources=None):
+    """
+    Claim and run jobs until `stop_event` is set, sleeping while every queue is empty.
+    `sources` is a list of (claim, run) pairs polled in order; transcription jobs by default.
+    """
+    sources = sources or [(claim_next_job, run_job)]
+    name = worker_name()
+    try:
+        while stop_event is None or not stop_event.is_set():
+            for claim, run in sources:
+                job = claim(name)
+                if job is not None:
+                    run(job)
+                    break
+            else:
+                time.sleep(poll_interval)
+    finally:
+        connection.close()
+
+def run_threads(threads, poll_interval, stop_event=None, sources=None):
+    """
+    Run `threads` job loops in this process.
+    ASR jobs spend nearly all their time waiting on Rev.ai, so several
+    submissions per process keep a batch moving; host_slot bounds the total.
+    """
+    workers = [
+        threading.Thread(target=work_forever, args=(poll_interval, stop_event, sources), name=f"worker-{i}", daemon=True)
+        for i in range(max(1, threads))
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
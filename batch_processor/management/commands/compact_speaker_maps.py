@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+
+from batch_processor.models import SpeakerMap, Transcript
+
+
+class Command(BaseCommand):
+    help = "Remove duplicate and orphaned SpeakerMap rows left behind by earlier speaker mapping saves"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report what would be removed")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        # Per transcript, keep the newest mapping of each speaker
+        duplicates = 0
+        newest_first = Prefetch('speaker_mapping', queryset=SpeakerMap.objects.order_by('-id'))
+        transcripts = Transcript.objects.only('id').prefetch_related(newest_first)
+        for transcript in transcripts.iterator(chunk_size=500):
+            seen = set()
+            stale = []
+            for speaker_map in transcript.speaker_mapping.all():
+                if speaker_map.original_id in seen:
+                    stale.append(speaker_map.id)
+                seen.add(speaker_map.original_id)
+            duplicates += len(stale)
+            if stale and not dry_run:
+                with transaction.atomic():
+                    transcript.speaker_mapping.remove(*stale)
+
+        # Rows no transcript refers to any more
+        orphans = SpeakerMap.objects.filter(transcript=None)
+        orphan_count = orphans.count()
+        if not dry_run:
+            orphans.delete()
+
+        verb = "Would remove" if dry_run else "Removed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {duplicates} duplicate speaker mappings and {orphan_count} orphaned SpeakerMap rows"))
@@ -0,0 +1,117 @@
+import multiprocessing
+import signal
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+QUEUES = ('transcription', 'alignment')
+
+
+def job_sources(queues):
+    """(claim, run) pairs for the named queues, in the order given"""
+    from batch_processor.jobs import claim_next_job, run_job
+    from forced_alignment.tasks import claim_next_task, run_task
+
+    available = {
+        'transcription': (claim_next_job, run_job),
+        'alignment': (claim_next_task, run_task),
+    }
+    return [available[queue] for queue in queues]
+
+
+def worker_main(poll_interval, threads, warmup=False, queues=QUEUES):
+    """Entry point of a worker process: claim and run queued jobs until terminated"""
+    # Spawned processes start from a clean interpreter, so Django has to be set up again
+    import django
+    django.setup()
+
+    from batch_processor.jobs import run_threads
+    from batch_processor.model_registry import warm_up
+    from forced_alignment.parallel import fa_processes, pool_ready, shutdown_pool
+
+    def stop(signum, frame):
+        shutdown_pool()  # Its processes are ours to stop
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent handles Ctrl+C and terminates us
+    signal.signal(signal.SIGTERM, stop)
+
+    if warmup:
+        warm_up()
+        if 'alignment' in queues and fa_processes() > 1:
+            pool_ready()
+
+    run_threads(threads, poll_interval, sources=job_sources(queues))
+
+
+def start_worker(ctx, target=worker_main, args=()):
+    """
+    Start a worker process. Workers are not daemonic, so they can run the
+    alignment process pool; the command terminates them on shutdown.
+    """
+    process = ctx.Process(target=target, args=args, daemon=False)
+    process.start()
+    return process
+
+
+class Command(BaseCommand):
+    help = "Start a pool of worker processes that run queued transcription jobs and alignment tasks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.BATCHALIGN_WORKERS,
+                            help="Number of worker processes")
+        parser.add_argument('--threads', type=int, default=settings.BATCHALIGN_ASR_CONCURRENCY,
+                            help="Concurrent jobs per worker process")
+        parser.add_argument('--poll-interval', type=float, default=settings.BATCHALIGN_JOB_POLL_INTERVAL,
+                            help="Seconds to wait between polls when the queue is empty")
+        parser.add_argument('--warmup', action='store_true',
+                            help="Load BATCHALIGN_WARMUP_MODELS and BATCHALIGN_WARMUP_PIPELINES when each worker starts")
+        parser.add_argument('--queues', default=','.join(QUEUES),
+                            help="Comma-separated queues to serve, from: " + ', '.join(QUEUES))
+        parser.add_argument('--requeue-stale', action='store_true',
+                            help="Requeue jobs left running by a previous pool before starting")
+
+    def handle(self, *args, **options):
+        from batch_processor.jobs import requeue_stale_jobs
+        from forced_alignment.tasks import requeue_stale_tasks
+
+        queues = [queue.strip() for queue in options['queues'].split(',') if queue.strip()]
+        unknown = set(queues) - set(QUEUES)
+        if unknown or not queues:
+            raise CommandError(f"Unknown queues: {', '.join(sorted(unknown)) or '(none given)'}")
+
+        if options['requeue_stale']:
+            if 'transcription' in queues:
+                requeue_stale_jobs()
+            if 'alignment' in queues:
+                requeue_stale_tasks()
+
+        # Children must not inherit open database connections
+        connections.close_all()
+
+        ctx = multiprocessing.get_context('spawn')
+        worker_args = (options['poll_interval'], options['threads'], options['warmup'], queues)
+        processes = []
+        for _ in range(max(1, options['workers'])):
+            processes.append(start_worker(ctx, args=worker_args))
+
+        self.stdout.write(self.style.SUCCESS(f"Started {len(processes)} workers with {options['threads']} threads each, press Ctrl+C to stop"))
+        try:
+            while True:
+                for i, process in enumerate(processes):
+                    if not process.is_alive():
+                        self.stderr.write(f"Worker {process.pid} exited with code {process.exitcode}, restarting")
+                        processes[i] = start_worker(ctx, args=worker_args)
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping workers")
+        finally:
+            # Workers are not daemonic, so they have to be stopped here in every case
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
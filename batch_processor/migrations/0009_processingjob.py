@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_processor', '0008_transcript_format'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lang', models.CharField(default='eng', max_length=10)),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], db_index=True, default='QUEUED', max_length=20)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('worker', models.CharField(blank=True, default='', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('audio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='batch_processor.audiofile')),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_processor', '0009_processingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='batch_id',
+            field=models.CharField(blank=True, db_index=True, max_length=36, null=True),
+        ),
+    ]
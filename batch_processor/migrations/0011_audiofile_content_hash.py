@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:02
+
+import hashlib
+import os
+
+from django.db import migrations, models
+
+
+def hash_existing_uploads(apps, schema_editor):
+    """Backfill content_hash for files uploaded before hashing existed"""
+    AudioFile = apps.get_model('batch_processor', 'AudioFile')
+    for audio in AudioFile.objects.filter(content_hash__isnull=True).exclude(audio_file=''):
+        try:
+            path = audio.audio_file.path
+        except (ValueError, NotImplementedError):
+            continue
+        if not os.path.isfile(path):
+            continue
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        audio.content_hash = digest.hexdigest()
+        audio.save(update_fields=['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_processor', '0010_processingjob_batch_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audiofile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(hash_existing_uploads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_processor', '0011_audiofile_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcript',
+            name='asr_words',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_processor', '0012_transcript_asr_words'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcript',
+            name='chat_parsed',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
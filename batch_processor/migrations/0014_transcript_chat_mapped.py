@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_processor', '0013_transcript_chat_parsed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcript',
+            name='chat_mapped',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transcript',
+            name='chat_mapped_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batch_processor', '0014_transcript_chat_mapped'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='audiofile',
+            index=models.Index(fields=['-uploaded_at', '-id'], name='audiofile_newest_first'),
+        ),
+    ]
@@ -0,0 +1,192 @@
+"""
+Process-wide registry of loaded models.
+
+Loading a torch model costs seconds and a large allocation, so each model is
+loaded at most once per worker process and shared by every request after
+that. Loads are lazy and thread-safe: concurrent callers asking for the same
+model wait for a single load, while different models load independently.
+With a memory budget, the least recently used models are dropped once the
+loaded footprint exceeds it.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger('batch_processor')
+
+DEFAULT_EMBEDDING_MODEL = "speechbrain/spkrec-ecapa-voxceleb"
+
+def _current_rss():
+    """Resident memory of this process in bytes (peak RSS where the current value is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except Exception:
+        return 0
+
+def _parameter_bytes(model):
+    """Bytes held by the parameters and buffers of any torch modules inside `model`"""
+    try:
+        import torch
+    except ImportError:
+        return 0
+
+    if isinstance(model, torch.nn.Module):
+        modules = [model]
+    else:
+        # Wrappers such as PretrainedSpeakerEmbedding keep their network in an attribute
+        modules = [value for value in getattr(model, '__dict__', {}).values() if isinstance(value, torch.nn.Module)]
+
+    total = 0
+    for module in modules:
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+class ModelRegistry:
+    """Lazily loads models by key and keeps them until evicted under `max_bytes` (0 keeps everything)"""
+
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self._models = OrderedDict()
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key, loader):
+        """Return the model stored under `key`, calling `loader()` the first time it is needed"""
+        model = self._models.get(key)
+        if model is not None:
+            self._record_hit(key)
+            return model
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._record_hit(key)
+                return model
+
+            logger.info(f"Loading model {key}")
+            rss_before = _current_rss()
+            started = time.perf_counter()
+            model = loader()
+            load_seconds = time.perf_counter() - started
+
+            with self._lock:
+                self._models[key] = model
+                self._stats[key] = {
+                    'key': key,
+                    'load_seconds': round(load_seconds, 3),
+                    'parameter_bytes': _parameter_bytes(model),
+                    'rss_delta_bytes': max(0, _current_rss() - rss_before),
+                    'loaded_at': time.time(),
+                    'hits': 0,
+                }
+                self._evict(keep=key)
+            logger.info(f"Loaded model {key} in {load_seconds:.2f}s")
+            return model
+
+    def _record_hit(self, key):
+        with self._lock:
+            if key in self._stats:
+                self._stats[key]['hits'] += 1
+                self._models.move_to_end(key)
+
+    def _footprint(self, key):
+        stat = self._stats[key]
+        return max(stat['parameter_bytes'], stat['rss_delta_bytes'])
+
+    def _evict(self, keep):
+        """Drop least recently used models until the budget is met; `keep` stays. Call with _lock held."""
+        if not self.max_bytes:
+            return
+        total = sum(self._footprint(key) for key in self._models)
+        for key in list(self._models):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._footprint(key)
+            del self._models[key]
+            del self._stats[key]
+            logger.info(f"Evicted model {key} to stay within {self.max_bytes} bytes")
+
+    def is_loaded(self, key):
+        return key in self._models
+
+    def stats(self):
+        """Load time and memory footprint of every loaded model"""
+        with self._lock:
+            return [dict(stat) for stat in self._stats.values()]
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._stats.clear()
+
+registry = ModelRegistry(max_bytes=getattr(settings, 'BATCHALIGN_MODEL_MEMORY_BUDGET', 0))
+
+def default_device():
+    import torch
+    return torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+def get_embedding_model(name=DEFAULT_EMBEDDING_MODEL, device=None):
+    """Shared pyannote speaker embedding model for this process"""
+    device = device or default_device()
+
+    def load():
+        from pyannote.audio.pipelines.speaker_verification import PretrainedSpeakerEmbedding
+        return PretrainedSpeakerEmbedding(name, device=device)
+
+    return registry.get(('embedding', name, str(device)), load)
+
+def get_pipeline(pipeline_str, lang, **overrides):
+    """
+    Shared batchalign pipeline for (pipeline string, language, engine overrides),
+    so engine weights are loaded once per process instead of once per task
+    """
+    key = ('pipeline', pipeline_str, lang, tuple(sorted(overrides.items())))
+
+    def load():
+        from batchalign.pipelines.dispatch import dispatch_pipeline
+        return dispatch_pipeline(pipeline_str, lang, **overrides)
+
+    return registry.get(key, load)
+
+def parse_pipeline_spec(spec):
+    """'fa:eng:wav2vec_fa' -> ('fa', 'eng', {'fa': 'wav2vec_fa'}); the override is optional"""
+    parts = spec.split(':')
+    pipeline_str, lang = parts[0], parts[1] if len(parts) > 1 and parts[1] else 'eng'
+    overrides = {pipeline_str: parts[2]} if len(parts) > 2 and parts[2] else {}
+    return pipeline_str, lang, overrides
+
+def warm_up(names=None, pipelines=None):
+    """Load the given embedding models and batchalign pipelines now rather than on the first request"""
+    names = getattr(settings, 'BATCHALIGN_WARMUP_MODELS', []) if names is None else names
+    pipelines = getattr(settings, 'BATCHALIGN_WARMUP_PIPELINES', []) if pipelines is None else pipelines
+    for name in names:
+        try:
+            get_embedding_model(name)
+        except Exception as e:
+            logger.error(f"Could not warm up model {name}: {e}")
+    for spec in pipelines:
+        try:
+            pipeline_str, lang, overrides = parse_pipeline_spec(spec)
+            get_pipeline(pipeline_str, lang, **overrides)
+        except Exception as e:
+            logger.error(f"Could not warm up pipeline {spec}: {e}")
@@ -11,7 +11,9 @@
 
 # This code will evolve as we build the application step by step.
 
-from django.db import models
+from django.db import connections, models, transaction
+
+from .segments import bounds_index
 
 # Step 1: Define models
 
@@ -26,6 +28,7 @@ class AudioFile(models.Model):
     title = models.CharField(max_length=200)
     audio_file = models.FileField(upload_to='uploads/', blank=True, null=True)
     input_folder = models.CharField(max_length=500, blank=True, null=True)  # Renamed for clarity
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)  # SHA-256 of the uploaded bytes
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -34,12 +37,19 @@ class AudioFile(models.Model):
     def is_batch_upload(self):
         return bool(self.input_folder)
 
+    class Meta:
+        indexes = [models.Index(fields=['-uploaded_at', '-id'], name='audiofile_newest_first')]
+
 class Transcript(models.Model):
     audio = models.OneToOneField(AudioFile, on_delete=models.CASCADE, related_name='transcript')
     raw_content = models.TextField(blank=True, null=True)  # Original Rev.ai output
     chat_content = models.TextField(blank=True, default='')  # CHAT format with default empty string
     diarization_data = models.JSONField(blank=True, null=True)  # Pyannote diarization output
     missing_segments = models.JSONField(blank=True, null=True)  # Segments with no ASR text
+    asr_words = models.JSONField(blank=True, null=True)  # Rev.ai word times per utterance, a prior for forced alignment
+    chat_parsed = models.JSONField(blank=True, null=True, editable=False)  # parse_chat() of chat_content, see parsed_chat()
+    chat_mapped = models.BinaryField(blank=True, null=True, editable=False)  # Speaker-mapped chat_content (UTF-8), see mapped_chat_bytes()
+    chat_mapped_key = models.CharField(max_length=64, blank=True, default='', editable=False)  # mapping_key() it was built with
     speaker_mapping = models.ManyToManyField(SpeakerMap, blank=True)  # Link to speaker mappings
     created_at = models.DateTimeField(auto_now_add=True)
     pyannote_processed = models.BooleanField(default=False)  # Track if Pyannote has processed this file
@@ -48,12 +58,95 @@ class Transcript(models.Model):
     def __str__(self):
         return f"Transcript for {self.audio.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_chat_content = instance.__dict__.get('chat_content')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # A changed chat_content makes the stored parse and mapped rendition stale
+        if self.chat_content != getattr(self, '_loaded_chat_content', None) and (
+                self.chat_parsed is not None or self.chat_mapped is not None):
+            self.chat_parsed = None
+            self.chat_mapped = None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'chat_parsed', 'chat_mapped'}
+        super().save(*args, **kwargs)
+        self._loaded_chat_content = self.chat_content
+
+    def parsed_chat(self):
+        """chat_content parsed once by chat.parse_chat, stored until chat_content changes"""
+        from .chat import PARSE_VERSION, parse_chat
+        if self.chat_parsed is None or self.chat_parsed.get('version') != PARSE_VERSION:
+            self.chat_parsed = parse_chat(self.chat_content)
+            if self.pk:
+                Transcript.objects.filter(pk=self.pk).update(chat_parsed=self.chat_parsed)
+        return self.chat_parsed
+
+    def set_speaker_mapping(self, mapping):
+        """
+        Make the transcript's SpeakerMaps exactly `mapping` ({original_id: chat_role}),
+        in one transaction: rows are updated in place, missing ones bulk-created, and
+        rows of speakers no longer mapped (or duplicates of a speaker) removed
+        """
+        with transaction.atomic():
+            keep = {}
+            stale = []
+            rows = list(self.speaker_mapping.order_by('-id'))
+            # Counted on the link table: counting within the relation above only ever sees this transcript
+            links = Transcript.speaker_mapping.through.objects.filter(speakermap_id__in=[row.id for row in rows])
+            num_transcripts = dict(links.values('speakermap_id').annotate(n=models.Count('id')).values_list('speakermap_id', 'n'))
+            for speaker_map in rows:
+                role = mapping.get(speaker_map.original_id)
+                # Rows shared with another transcript are only kept if they already say the same
+                reusable = num_transcripts.get(speaker_map.id, 0) <= 1 or speaker_map.chat_role == role
+                if role is not None and reusable and speaker_map.original_id not in keep:
+                    keep[speaker_map.original_id] = speaker_map
+                else:
+                    stale.append(speaker_map.id)
+            
+            changed = []
+            for original_id, role in mapping.items():
+                speaker_map = keep.get(original_id)
+                if speaker_map is not None and speaker_map.chat_role != role:
+                    speaker_map.chat_role = role
+                    changed.append(speaker_map)
+            SpeakerMap.objects.bulk_update(changed, ['chat_role'])
+            
+            missing = [SpeakerMap(original_id=original_id, chat_role=role)
+                       for original_id, role in mapping.items() if original_id not in keep]
+            if connections[SpeakerMap.objects.db].features.can_return_rows_from_bulk_insert:
+                created = SpeakerMap.objects.bulk_create(missing)
+            else:
+                # Without RETURNING, bulk_create leaves the primary keys that add() needs unset
+                for speaker_map in missing:
+                    speaker_map.save()
+                created = missing
+            self.speaker_mapping.add(*created)
+            
+            if stale:
+                self.speaker_mapping.remove(*stale)
+                SpeakerMap.objects.filter(id__in=stale, transcript=None).delete()
+
+    def mapped_chat_bytes(self):
+        """
+        The CHAT content with speaker mappings applied, as UTF-8. Built in one pass
+        and stored; rebuilt only after chat_content or the mappings change.
+        """
+        from .chat import map_speakers, mapping_key
+        mapping = {sm.original_id: sm.chat_role for sm in self.speaker_mapping.all()}
+        key = mapping_key(mapping)
+        if self.chat_mapped is None or self.chat_mapped_key != key:
+            self.chat_mapped = map_speakers(self.chat_content, mapping).encode('utf-8')
+            self.chat_mapped_key = key
+            if self.pk:
+                Transcript.objects.filter(pk=self.pk).update(chat_mapped=self.chat_mapped, chat_mapped_key=key)
+        return bytes(self.chat_mapped)
+
     def get_chat_content(self):
         """Returns the CHAT format content with proper speaker mappings"""
-        content = self.chat_content
-        for speaker in self.speaker_mapping.all():
-            content = content.replace(f"*{speaker.original_id}:", f"*{speaker.chat_role}:")
-        return content
+        return self.mapped_chat_bytes().decode('utf-8')
     
     def get_missing_segments(self):
         """Returns a list of time segments where there is diarization but no ASR text"""
@@ -68,6 +161,7 @@ class Transcript(models.Model):
             
         timeline = []
         speaker_map = {sm.original_id: sm.chat_role for sm in self.speaker_mapping.all()}
+        missing = bounds_index(self.missing_segments)
         
         for segment in self.diarization_data:
             mapped_speaker = speaker_map.get(segment['speaker'], segment['speaker'])
@@ -75,8 +169,7 @@ class Transcript(models.Model):
                 'start': segment['start'],
                 'end': segment['end'],
                 'speaker': mapped_speaker,
-                'has_text': not any(ms['start'] == segment['start'] and ms['end'] == segment['end'] 
-                                  for ms in (self.missing_segments or []))
+                'has_text': (segment['start'], segment['end']) not in missing
             })
         
         return timeline
@@ -154,6 +247,31 @@ class Transcript(models.Model):
         
         return segments
 
+class ProcessingJob(models.Model):
+    """A queued transcription of an uploaded AudioFile, run by the worker pool (see run_workers)"""
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    audio = models.ForeignKey(AudioFile, on_delete=models.CASCADE, related_name='jobs')
+    lang = models.CharField(max_length=10, default='eng')
+    batch_id = models.CharField(max_length=36, blank=True, null=True, db_index=True)  # Groups the files of one batch upload
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='QUEUED', db_index=True)
+    error_message = models.TextField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True, default='')  # Worker that claimed the job
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job {self.id} for {self.audio.title} - {self.status}"
+
+    class Meta:
+        ordering = ['created_at']
+
 # Step 2: Set up views and forms to handle single file and batch uploads (next steps).
 # Step 3: Create test cases for models.
 
@@ -0,0 +1,145 @@
+"""
+Canonical decoded audio shared by every processing stage.
+
+Each upload is decoded once into a 16 kHz mono 16-bit WAV kept next to the
+media (`<dir>/pcm/<upload name>/<stem>.wav`, so tools that name things after
+the file stem still see the original stem). Diarization and forced alignment
+read that file; in-process consumers memory-map it and take slices instead of
+decoding and resampling the upload again. ASR is sent the upload itself.
+"""
+
+import logging
+import os
+import shutil
+import threading
+import wave
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger('batch_processor')
+
+PCM_SAMPLE_RATE = 16000
+# The wave module always writes a plain 44-byte RIFF header for PCM
+_HEADER_BYTES = 44
+# Audio decoded either side of a block so resampling sees past its edges
+_RESAMPLE_CONTEXT_SECONDS = 0.05
+
+def pcm_path(audio_path):
+    """Location of the canonical PCM file for an upload"""
+    directory, name = os.path.split(audio_path)
+    stem = os.path.splitext(name)[0]
+    return os.path.join(directory, 'pcm', name, f"{stem}.wav")
+
+def iter_audio_blocks(audio_path, block_seconds, target_rate):
+    """
+    Decode a file block by block as mono float32 arrays at target_rate.
+    Each block is resampled with a little of the audio either side of it, which
+    is then trimmed off, so the blocks join up as if the whole file had been
+    resampled at once rather than with filter edges at every block boundary.
+    """
+    import math
+    import torchaudio
+
+    source_rate = torchaudio.info(audio_path).sample_rate
+    # Input frames that make a whole number of output frames, so trimmed blocks abut exactly
+    unit = source_rate // math.gcd(source_rate, target_rate)
+    frames_per_block = max(1, math.ceil(block_seconds * source_rate / unit)) * unit
+    context = math.ceil(_RESAMPLE_CONTEXT_SECONDS * source_rate / unit) * unit if source_rate != target_rate else 0
+    offset = 0
+    while True:
+        start = max(0, offset - context)
+        waveform, sample_rate = torchaudio.load(audio_path, frame_offset=start,
+                                                num_frames=offset - start + frames_per_block + context)
+        frames = min(frames_per_block, waveform.shape[1] - (offset - start))
+        if frames <= 0:
+            break
+        mono = waveform.mean(dim=0)
+        if sample_rate != target_rate:
+            mono = torchaudio.functional.resample(mono, sample_rate, target_rate)
+            first = (offset - start) * target_rate // sample_rate
+            mono = mono[first:first + math.ceil(frames * target_rate / sample_rate)]
+        else:
+            mono = mono[offset - start:offset - start + frames]
+        yield mono.numpy().astype(np.float32, copy=False)
+        offset += frames
+        if frames < frames_per_block:
+            break
+
+def _is_current(path, audio_path):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(audio_path)
+
+def write_pcm(path, blocks):
+    """Write float32 blocks in [-1, 1] as a 16 kHz mono 16-bit WAV, atomically"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        with wave.open(tmp_path, 'wb') as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(PCM_SAMPLE_RATE)
+            for block in blocks:
+                out.writeframes((np.clip(block, -1.0, 1.0) * 32767).astype('<i2').tobytes())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+def prepare_pcm(audio_path):
+    """
+    Decode `audio_path` into its canonical PCM file unless an up-to-date one
+    exists, and return the PCM path. The upload is decoded block by block,
+    so memory does not grow with the length of the recording.
+    """
+    path = pcm_path(audio_path)
+    if _is_current(path, audio_path):
+        return path
+    logger.info(f"Decoding {audio_path} to {PCM_SAMPLE_RATE} Hz mono PCM")
+    return write_pcm(path, iter_audio_blocks(audio_path, settings.BATCHALIGN_STREAMING_BLOCK_SECONDS, PCM_SAMPLE_RATE))
+
+def remove_pcm(audio_path):
+    """Delete the canonical PCM file of an upload, if there is one"""
+    shutil.rmtree(os.path.dirname(pcm_path(audio_path)), ignore_errors=True)
+
+class PcmAudio:
+    """Read-only, memory-mapped view of a canonical PCM file"""
+
+    def __init__(self, path):
+        with wave.open(path, 'rb') as source:
+            if (source.getnchannels(), source.getsampwidth(), source.getframerate()) != (1, 2, PCM_SAMPLE_RATE):
+                raise ValueError(f"{path} is not {PCM_SAMPLE_RATE} Hz mono 16-bit PCM")
+            num_samples = source.getnframes()
+        self.path = path
+        self.sample_rate = PCM_SAMPLE_RATE
+        if num_samples == 0:
+            self.samples = np.zeros(0, dtype='<i2')
+        else:
+            self.samples = np.memmap(path, dtype='<i2', mode='r', offset=_HEADER_BYTES, shape=(num_samples,))
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    def slice(self, start=0.0, end=None):
+        """Zero-copy int16 view of [start, end) seconds"""
+        first = min(max(0, int(start * self.sample_rate)), len(self.samples))
+        last = len(self.samples) if end is None else min(max(first, int(end * self.sample_rate)), len(self.samples))
+        return self.samples[first:last]
+
+    def read(self, start=0.0, end=None):
+        """Samples of [start, end) seconds as float32 in [-1, 1]"""
+        return self.slice(start, end).astype(np.float32) / 32768.0
+
+    def blocks(self, block_seconds):
+        """float32 blocks of at most block_seconds, for streaming consumers"""
+        step = max(1, int(block_seconds * self.sample_rate))
+        for first in range(0, len(self.samples), step):
+            yield self.samples[first:first + step].astype(np.float32) / 32768.0
+
+def open_pcm(audio_path):
+    """Prepare (if needed) and memory-map the canonical PCM of an upload"""
+    return PcmAudio(prepare_pcm(audio_path))
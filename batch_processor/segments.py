@@ -0,0 +1,54 @@
+"""
+Interval utilities for time segments (dicts with 'start' and 'end').
+
+Matching diarization windows against ASR utterances used to compare every
+pair; here both lists are sorted once and swept together, so the cost is
+O((N + M) log M) plus the handful of segments actually overlapping.
+"""
+
+import heapq
+
+def match_overlapping(targets, sources, min_overlap_ratio=0.5):
+    """
+    For each target segment, find the source segment covering more than
+    `min_overlap_ratio` of the target's duration. When several qualify, the
+    earliest-starting source wins, as with a linear scan of sorted sources.
+    Returns a list aligned with `targets` holding the matched source index or None.
+    """
+    matches = [None] * len(targets)
+    if not targets or not sources:
+        return matches
+
+    source_order = sorted(range(len(sources)), key=lambda i: (sources[i]['start'], i))
+    target_order = sorted(range(len(targets)), key=lambda i: targets[i]['start'])
+
+    active = []  # Heap of (end, rank, source index) for sources that started before the current target ends
+    next_source = 0
+    for target_index in target_order:
+        target = targets[target_index]
+        start, end = target['start'], target['end']
+        duration = end - start
+        if duration <= 0:
+            continue
+
+        while next_source < len(source_order) and sources[source_order[next_source]]['start'] < end:
+            source_index = source_order[next_source]
+            heapq.heappush(active, (sources[source_index]['end'], next_source, source_index))
+            next_source += 1
+
+        # Targets come in start order, so sources ending before this one starts can never match again
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+
+        best_rank = None
+        for source_end, rank, source_index in active:
+            overlap = min(end, source_end) - max(start, sources[source_index]['start'])
+            if overlap > 0 and overlap / duration > min_overlap_ratio and (best_rank is None or rank < best_rank):
+                best_rank = rank
+                matches[target_index] = source_index
+
+    return matches
+
+def bounds_index(segments):
+    """Set of (start, end) pairs, for constant-time 'is this exact segment listed' checks"""
+    return {(segment['start'], segment['end']) for segment in (segments or [])}
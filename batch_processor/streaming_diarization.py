@@ -0,0 +1,224 @@
+"""
+Streaming, bounded-memory front end for diarization.
+
+The recording is read in fixed-size blocks from its memory-mapped PCM. Each block goes through the
+frame VAD and the sliding-window embedder, then everything except the tail
+needed by the next window is dropped, VAD frames included. Only compact
+per-window results (float32 embeddings and window spans) accumulate, so peak
+memory no longer grows with recording length and each block costs the same.
+
+As in vad.detect_speech, the VAD thresholds are relative to the loud speech
+level of the whole recording. stream_window_embeddings reads that level in a
+first pass over the PCM (counted in a 0.01 dB histogram, so it agrees with the
+in-memory percentile to that resolution). A StreamingDiarizer fed without it
+uses the loudest level seen so far, so speech before a louder passage is judged
+against a lower reference than detect_speech would use.
+"""
+
+import logging
+
+import numpy as np
+from django.conf import settings
+
+from . import vad
+
+logger = logging.getLogger('batch_processor')
+
+class _Growable:
+    """Append-only numpy array with amortised doubling, instead of a list of small arrays"""
+
+    def __init__(self, dtype, width=None):
+        self.dtype = dtype
+        self.width = width
+        self.size = 0
+        self.data = None
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.dtype)
+        if len(values) == 0:
+            return
+        if self.data is None:
+            shape = (max(1024, len(values)),) + values.shape[1:]
+            self.data = np.empty(shape, dtype=self.dtype)
+        needed = self.size + len(values)
+        if needed > len(self.data):
+            grown = np.empty((max(needed, 2 * len(self.data)),) + self.data.shape[1:], dtype=self.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+    def discard(self, count):
+        """Drop the first `count` values"""
+        count = min(count, self.size)
+        if count <= 0:
+            return
+        self.size -= count
+        self.data[:self.size] = self.data[count:count + self.size]
+
+    def array(self):
+        if self.data is None:
+            shape = (0, self.width) if self.width else (0,)
+            return np.zeros(shape, dtype=self.dtype)
+        return self.data[:self.size]
+
+# Resolution and range of the histogram the recording-wide reference level is read from
+_LEVEL_BIN_DB = 0.01
+_LEVEL_RANGE_DB = (-130.0, 10.0)
+
+def _frame_levels(pending, block, hop, sample_rate):
+    """
+    Log-energy of the whole, non-overlapping hop frames of pending + block, so
+    levels do not depend on where blocks are cut. Returns (energy_db, new pending).
+    """
+    samples = np.concatenate((pending, block))
+    usable = len(samples) - len(samples) % hop
+    if usable == 0:
+        return np.zeros(0, dtype=np.float32), samples
+    hop_seconds = hop / sample_rate
+    energy_db, _ = vad.frame_log_energy(samples[:usable], sample_rate, hop_seconds, hop_seconds)
+    return energy_db, samples[usable:]
+
+def recording_reference_level(blocks, sample_rate, percentile=99.0):
+    """vad.reference_level of the frames of a whole recording, read block by block"""
+    hop = max(1, int(round(vad.DEFAULT_HOP_LENGTH * sample_rate)))
+    low, high = _LEVEL_RANGE_DB
+    counts = np.zeros(int(round((high - low) / _LEVEL_BIN_DB)), dtype=np.int64)
+    pending = np.zeros(0, dtype=np.float32)
+    for block in blocks:
+        energy_db, pending = _frame_levels(pending, np.asarray(block, dtype=np.float32), hop, sample_rate)
+        bins = np.clip(((energy_db - low) / _LEVEL_BIN_DB).astype(np.int64), 0, len(counts) - 1)
+        counts += np.bincount(bins, minlength=len(counts))
+    total = int(counts.sum())
+    if total == 0:
+        return 0.0
+    # The bin holding the value np.percentile would interpolate around
+    rank = percentile / 100.0 * (total - 1)
+    index = int(np.searchsorted(np.cumsum(counts), rank, side='right'))
+    return float(low + (index + 0.5) * _LEVEL_BIN_DB)
+
+class StreamingDiarizer:
+    """
+    Feed mono blocks at `sample_rate`, then call finish(). Results are the
+    windows with enough speech (starts, ends in seconds) and their embeddings.
+    Without `reference_db` (see recording_reference_level) the VAD reference
+    is the loudest level fed so far.
+    """
+
+    def __init__(self, embed, sample_rate, window=3.0, step=1.5, min_speech_ratio=0.2, reference_db=None):
+        # `embed(samples, windows)` returns (embeddings, kept indices) for (start, end) windows in seconds into `samples`
+        self.embed = embed
+        self.sample_rate = sample_rate
+        self.window = window
+        self.step = step
+        self.min_speech_ratio = min_speech_ratio
+
+        self.hop = max(1, int(round(vad.DEFAULT_HOP_LENGTH * sample_rate)))
+        self.hop_seconds = self.hop / sample_rate
+        # Window decisions wait this long after the window ends, so gap bridging cannot still change them
+        self.lookahead = vad.DEFAULT_MIN_SILENCE + self.hop_seconds
+
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_start = 0  # Sample index of buffer[0]
+        self.total_samples = 0
+        self.vad_pending = np.zeros(0, dtype=np.float32)  # Samples not yet forming a whole VAD frame
+        self.fixed_reference = reference_db is not None
+        self.reference_db = reference_db
+        self.vad_state = False
+        self.mask = _Growable(np.bool_)
+        self.mask_start = 0  # Frame number of the first frame still in `mask`
+        self.next_window = 0
+        # Speech regions are only needed from this long before the next window: smoothing
+        # bridges gaps under min_silence and drops regions under min_speech, nothing older matters
+        self.mask_history = vad.DEFAULT_MIN_SILENCE + vad.DEFAULT_MIN_SPEECH + self.hop_seconds
+
+        self.starts = _Growable(np.float64)
+        self.ends = _Growable(np.float64)
+        self.embeddings = None
+
+    def _update_vad(self, block):
+        energy_db, self.vad_pending = _frame_levels(self.vad_pending, block, self.hop, self.sample_rate)
+        if len(energy_db) == 0:
+            return
+        if not self.fixed_reference:
+            block_reference = vad.reference_level(energy_db)
+            self.reference_db = block_reference if self.reference_db is None else max(self.reference_db, block_reference)
+        mask = vad.hysteresis(energy_db, self.reference_db - vad.DEFAULT_ONSET_DB,
+                              self.reference_db - vad.DEFAULT_OFFSET_DB, initial_state=self.vad_state)
+        self.vad_state = bool(mask[-1])
+        self.mask.extend(mask)
+
+    def _process_windows(self, final=False):
+        duration = self.total_samples / self.sample_rate
+        vad_time = (self.mask_start + self.mask.size) * self.hop_seconds
+
+        # Same window grid as vad.sliding_windows, released once the VAD has run far enough past each window
+        last_start = max(duration - self.step, 0.0)
+        ready_starts = []
+        while True:
+            start = self.next_window * self.step
+            if start >= last_start:
+                break
+            if not final and start + self.window + self.lookahead > vad_time:
+                break
+            ready_starts.append(start)
+            self.next_window += 1
+
+        if ready_starts:
+            window_starts = np.asarray(ready_starts)
+            window_ends = np.minimum(window_starts + self.window, duration)
+            speech_starts, speech_ends = vad.smooth_regions(
+                *vad.mask_to_regions(self.mask.array(), self.hop_seconds, first_frame=self.mask_start))
+            coverage = vad.speech_coverage(speech_starts, speech_ends, window_starts, window_ends)
+            keep = coverage > self.min_speech_ratio * (window_ends - window_starts)
+            self._embed_windows(window_starts[keep], window_ends[keep])
+
+        # Drop audio and VAD frames that no future window needs
+        keep_from = min(int(self.next_window * self.step * self.sample_rate), self.total_samples)
+        if keep_from > self.buffer_start:
+            self.buffer = self.buffer[keep_from - self.buffer_start:].copy()
+            self.buffer_start = keep_from
+        keep_frames_from = min(int((self.next_window * self.step - self.mask_history) / self.hop_seconds),
+                               self.mask_start + self.mask.size)
+        if keep_frames_from > self.mask_start:
+            self.mask.discard(keep_frames_from - self.mask_start)
+            self.mask_start = keep_frames_from
+
+    def _embed_windows(self, window_starts, window_ends):
+        if len(window_starts) == 0:
+            return
+        offset = self.buffer_start / self.sample_rate
+        windows = [(start - offset, end - offset) for start, end in zip(window_starts, window_ends)]
+        embeddings, kept = self.embed(self.buffer, windows)
+        if len(kept) == 0:
+            return
+        if self.embeddings is None:
+            self.embeddings = _Growable(np.float32, width=embeddings.shape[1])
+        self.embeddings.extend(embeddings)
+        self.starts.extend(window_starts[np.asarray(kept, dtype=np.int64)])
+        self.ends.extend(window_ends[np.asarray(kept, dtype=np.int64)])
+
+    def feed(self, block):
+        block = np.asarray(block, dtype=np.float32)
+        self.buffer = np.concatenate((self.buffer, block))
+        self.total_samples += len(block)
+        self._update_vad(block)
+        self._process_windows()
+
+    def finish(self):
+        """Evaluate the remaining windows and return (starts, ends, embeddings)"""
+        self._process_windows(final=True)
+        embeddings = self.embeddings.array() if self.embeddings is not None else np.zeros((0, 0), dtype=np.float32)
+        return self.starts.array(), self.ends.array(), embeddings
+
+def stream_window_embeddings(pcm, embed, block_seconds=None, **window_options):
+    """Run StreamingDiarizer over a PcmAudio block by block"""
+    block_seconds = block_seconds or settings.BATCHALIGN_STREAMING_BLOCK_SECONDS
+    # First pass for the level of the whole recording, as detect_speech uses
+    reference_db = recording_reference_level(pcm.blocks(block_seconds), pcm.sample_rate)
+    diarizer = StreamingDiarizer(embed, pcm.sample_rate, reference_db=reference_db, **window_options)
+    for block in pcm.blocks(block_seconds):
+        diarizer.feed(block)
+    starts, ends, embeddings = diarizer.finish()
+    logger.info(f"Streamed {pcm.duration:.1f}s of audio into {len(starts)} speech windows")
+    return starts, ends, embeddings
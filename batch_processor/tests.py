@@ -1,12 +1,23 @@
 #Haozhe Ma 2024-Dec-11
 
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 import os
+import shutil
+import tempfile
+
+def use_temp_media(test):
+    """Store the uploads of `test` in a temporary MEDIA_ROOT, removed when it finishes"""
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory, True)
+    media = override_settings(MEDIA_ROOT=directory)
+    media.enable()
+    test.addCleanup(media.disable)
 
 class UploadAudioViewTest(TestCase):
     def setUp(self):
         self.client = Client()
+        use_temp_media(self)
 
     def test_single_file_upload(self):
         with open("test.mp3", "wb") as f:
@@ -33,4 +44,573 @@ class UploadAudioViewTest(TestCase):
         os.remove("test_batch/test2.wav")
         os.rmdir("test_batch")
         self.assertEqual(response.status_code, 200)
-        self.assertIn("message", response.json())
\ No newline at end of file
+        self.assertIn("message", response.json())
+
+    def test_chat_file_upload(self):
+        from .models import Transcript
+        chat = "@UTF8\n@Begin\n@Participants:\tMOT Mother, CHI Child\n*MOT:\thello .\n*CHI:\thi .\n@End\n"
+        for name in ("session.cha", "session_no_extension.txt"):
+            content = chat.replace("hello", name).encode("utf-8")
+            response = self.client.post("/upload/", {"audio_file": SimpleUploadedFile(name, content)}).json()
+            self.assertEqual(response["status"], "success", response)
+            self.assertEqual(response["speakers"], ["MOT", "CHI"])
+            transcript = Transcript.objects.get(id=response["transcript_id"])
+            self.assertEqual(transcript.chat_content, content.decode("utf-8"))
+
+class ProcessingJobQueueTest(TestCase):
+    def setUp(self):
+        from .models import AudioFile
+        self.audio = AudioFile.objects.create(title="queued.mp3")
+
+    def test_claim_next_job_is_exclusive(self):
+        from .jobs import enqueue_transcription, claim_next_job
+        first = enqueue_transcription(self.audio)
+        second = enqueue_transcription(self.audio)
+
+        claimed = claim_next_job("worker-a")
+        self.assertEqual(claimed.id, first.id)
+        self.assertEqual(claimed.status, "RUNNING")
+        self.assertEqual(claimed.worker, "worker-a")
+
+        self.assertEqual(claim_next_job("worker-b").id, second.id)
+        self.assertIsNone(claim_next_job("worker-c"))
+
+    def test_job_status_endpoint(self):
+        from .jobs import enqueue_transcription
+        job = enqueue_transcription(self.audio)
+        response = self.client.get(f"/jobs/{job.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["job_status"], "queued")
+
+    def test_batch_status_endpoint(self):
+        from .jobs import enqueue_transcription
+        first = enqueue_transcription(self.audio, batch_id="batch-1")
+        enqueue_transcription(self.audio, batch_id="batch-1")
+        first.status = "FAILED"
+        first.error_message = "Processing failed"
+        first.save()
+
+        data = self.client.get("/jobs/batch/batch-1/").json()
+        self.assertEqual(data["counts"]["failed"], 1)
+        self.assertEqual(data["counts"]["queued"], 1)
+        self.assertFalse(data["finished"])
+        self.assertEqual(data["jobs"][0]["message"], "Processing failed")
+
+
+class HostSlotTest(TestCase):
+    def test_slots_cap_concurrent_holders(self):
+        import threading
+        from .concurrency import host_slot
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def hold():
+            with host_slot("test-host", limit=2, poll_interval=0.01):
+                with lock:
+                    active.append(1)
+                    peak.append(len(active))
+                threading.Event().wait(0.05)
+                with lock:
+                    active.pop()
+
+        threads = [threading.Thread(target=hold) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(max(peak), 2)
+
+
+class ContentHashDedupTest(TestCase):
+    def setUp(self):
+        use_temp_media(self)
+
+    def test_renamed_recording_is_not_processed_again(self):
+        first = self.client.post("/upload/", {"audio_file": SimpleUploadedFile("a.mp3", b"same audio")}).json()
+        second = self.client.post("/upload/", {"audio_file": SimpleUploadedFile("b.mp3", b"same audio")}).json()
+        self.assertEqual(first["audio_id"], second["audio_id"])
+        self.assertEqual(first["job_id"], second["job_id"])
+
+    def test_same_name_different_content_is_kept_apart(self):
+        first = self.client.post("/upload/", {"audio_file": SimpleUploadedFile("a.mp3", b"first audio")}).json()
+        second = self.client.post("/upload/", {"audio_file": SimpleUploadedFile("a.mp3", b"other audio")}).json()
+        self.assertNotEqual(first["audio_id"], second["audio_id"])
+
+
+class ProcessAudioTest(TestCase):
+    def test_missing_api_key_returns_no_results(self):
+        import shutil
+        import tempfile
+        from unittest import mock
+        from django.test import override_settings
+        from .cache import asr_cache
+        from .views import process_audio
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        asr_cache.cache_clear()
+        self.addCleanup(asr_cache.cache_clear)
+        environ = {key: value for key, value in os.environ.items() if key != "REV_API_KEY"}
+        with override_settings(BASE_DIR=directory, BATCHALIGN_CACHE_DIR=directory), \
+                mock.patch.dict(os.environ, environ, clear=True):
+            result = process_audio(os.path.join(directory, "talk.wav"), content_hash="0" * 64)
+        self.assertEqual(result, (None, None, None, None, None))
+
+
+class DiskCacheTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from .cache import DiskCache
+        self.directory = tempfile.mkdtemp()
+        self.cache = DiskCache(self.directory, max_bytes=10 ** 6)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        key = self.cache.make_key("asr", "abc", "eng", "rev", "1.0")
+        self.assertIsNone(self.cache.get(key))
+        self.cache.set(key, {"chat_content": "@Begin"})
+        self.assertEqual(self.cache.get(key), {"chat_content": "@Begin"})
+
+    def test_evicts_least_recently_used(self):
+        import os
+        import time
+        self.cache.set("old", {"data": os.urandom(400).hex()})
+        self.cache.set("new", {"data": os.urandom(400).hex()})
+        old_time = time.time() - 100
+        os.utime(os.path.join(self.directory, "old.json.z"), (old_time, old_time))
+        self.cache.max_bytes = os.path.getsize(os.path.join(self.directory, "new.json.z")) + 1
+        self.cache.evict()
+        self.assertIsNone(self.cache.get("old"))
+        self.assertIsNotNone(self.cache.get("new"))
+
+    def test_normalized_text_hash_ignores_bullets_and_spacing(self):
+        from .cache import normalized_text_hash
+        aligned = "*PAR:\thello   world . \x151000_2000\x15\n\n*INV:\tok ."
+        plain = "*PAR: hello world .\n*INV: ok ."
+        self.assertEqual(normalized_text_hash(aligned), normalized_text_hash(plain))
+        self.assertNotEqual(normalized_text_hash(plain), normalized_text_hash("*PAR: hello there ."))
+
+
+class ModelRegistryTest(TestCase):
+    def test_loads_each_model_once(self):
+        import threading
+        from .model_registry import ModelRegistry
+        registry = ModelRegistry()
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return object()
+
+        threads = [threading.Thread(target=registry.get, args=("model", loader)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        stats = registry.stats()
+        self.assertEqual(stats[0]["key"], "model")
+        self.assertEqual(stats[0]["hits"], 7)
+
+    def test_evicts_least_recently_used_past_budget(self):
+        from .model_registry import ModelRegistry, parse_pipeline_spec
+        registry = ModelRegistry()
+        for key in ("a", "b", "c"):
+            registry.get(key, object)
+            registry._stats[key].update(parameter_bytes=40, rss_delta_bytes=0)
+        registry.get("a", object)  # "b" is now the least recently used
+
+        registry.max_bytes = 100
+        registry._evict(keep="c")
+
+        self.assertTrue(registry.is_loaded("c"))
+        self.assertTrue(registry.is_loaded("a"))
+        self.assertFalse(registry.is_loaded("b"))
+        self.assertEqual(parse_pipeline_spec("fa:eng:wav2vec_fa"), ("fa", "eng", {"fa": "wav2vec_fa"}))
+
+
+class VadTest(TestCase):
+    def make_signal(self, sample_rate=16000):
+        import numpy as np
+        rng = np.random.default_rng(0)
+        # 1s silence, 2s speech-like noise, 0.1s pause, 1s speech, 2s silence
+        parts = [0.001, 0.5, 0.001, 0.5, 0.001]
+        lengths = [1.0, 2.0, 0.1, 1.0, 2.0]
+        return np.concatenate([
+            rng.normal(0, amplitude, int(length * sample_rate)) for amplitude, length in zip(parts, lengths)
+        ]).astype(np.float32)
+
+    def test_detects_and_merges_speech_regions(self):
+        from .vad import detect_speech
+        starts, ends = detect_speech(self.make_signal(), 16000)
+        self.assertEqual(len(starts), 1)  # The short pause is bridged
+        self.assertAlmostEqual(starts[0], 1.0, delta=0.05)
+        self.assertAlmostEqual(ends[0], 4.1, delta=0.05)
+
+    def test_hysteresis_holds_state_between_thresholds(self):
+        import numpy as np
+        from .vad import hysteresis
+        energy = np.array([0, 10, 5, 5, -1, 5])
+        self.assertEqual(hysteresis(energy, onset=8, offset=0).tolist(), [False, True, True, True, False, False])
+
+    def test_speech_windows(self):
+        from .vad import speech_windows
+        window_starts, _ = speech_windows([1.0], [4.1], duration=7.1)
+        self.assertEqual(window_starts.tolist(), [0.0, 1.5, 3.0])
+
+
+class StreamingDiarizerTest(TestCase):
+    def embed(self, samples, windows):
+        import numpy as np
+        # Stand-in embedding: the mean absolute amplitude of each window
+        rows = [[np.abs(samples[int(start * 16000):int(end * 16000)]).mean(), 1.0] for start, end in windows]
+        return np.asarray(rows, dtype=np.float32), list(range(len(windows)))
+
+    def run_stream(self, signal, block_samples):
+        from .streaming_diarization import StreamingDiarizer
+        diarizer = StreamingDiarizer(self.embed, 16000)
+        self.peak_buffer = self.peak_mask = 0
+        for start in range(0, len(signal), block_samples):
+            diarizer.feed(signal[start:start + block_samples])
+            self.peak_buffer = max(self.peak_buffer, len(diarizer.buffer))
+            self.peak_mask = max(self.peak_mask, diarizer.mask.size)
+        return diarizer, diarizer.finish()
+
+    def test_block_size_does_not_change_results(self):
+        import numpy as np
+        signal = np.tile(VadTest().make_signal(), 3)
+        _, (starts, ends, embeddings) = self.run_stream(signal, len(signal))
+        _, (block_starts, block_ends, block_embeddings) = self.run_stream(signal, 16000 * 2 + 7)
+        self.assertGreater(len(starts), 0)
+        self.assertEqual(starts.tolist(), block_starts.tolist())
+        self.assertEqual(ends.tolist(), block_ends.tolist())
+        np.testing.assert_allclose(embeddings, block_embeddings, rtol=1e-5)
+
+    def test_buffer_stays_bounded(self):
+        import numpy as np
+        signal = np.tile(VadTest().make_signal(), 10)
+        self.run_stream(signal, 16000)
+        # Only the tail needed by the next window is kept, not the whole recording
+        self.assertLess(self.peak_buffer, 16000 * 6)
+        self.assertLess(self.peak_mask, 100 * 6)
+
+    def test_reference_level_covers_the_whole_recording(self):
+        import types
+        import numpy as np
+        from . import vad
+        from .streaming_diarization import recording_reference_level, stream_window_embeddings
+        rng = np.random.default_rng(0)
+        # Quiet talk for 6s, then loud talk 35 dB up: only the loud part is speech relative to the whole
+        signal = np.concatenate([rng.normal(0, 0.01, 16000 * 6), rng.normal(0, 0.5, 16000 * 6)]).astype(np.float32)
+        energy_db, _ = vad.frame_log_energy(signal, 16000, 0.01, 0.01)
+        blocks = lambda seconds: (signal[i:i + int(seconds * 16000)] for i in range(0, len(signal), int(seconds * 16000)))
+        self.assertAlmostEqual(recording_reference_level(blocks(2), 16000), vad.reference_level(energy_db), delta=0.01)
+
+        pcm = types.SimpleNamespace(sample_rate=16000, duration=len(signal) / 16000, blocks=blocks)
+        starts, _, _ = stream_window_embeddings(pcm, self.embed, block_seconds=2)
+        expected, _ = vad.speech_windows(*vad.detect_speech(signal, 16000), len(signal) / 16000)
+        self.assertEqual(starts.tolist(), expected.tolist())
+        self.assertGreaterEqual(starts.min(), 3.0)
+
+        # Fed without it, the quiet start is judged against its own level
+        _, (running_starts, _, _) = self.run_stream(signal, 16000 * 2)
+        self.assertLess(running_starts.min(), 3.0)
+
+
+class PcmAudioTest(TestCase):
+    def setUp(self):
+        import tempfile
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.directory)
+
+    def test_round_trip_and_zero_copy_slices(self):
+        import numpy as np
+        from .pcm import PcmAudio, pcm_path, write_pcm
+        path = pcm_path(os.path.join(self.directory, "talk.mp3"))
+        self.assertTrue(path.endswith(os.path.join("pcm", "talk.mp3", "talk.wav")))
+
+        signal = np.linspace(-0.5, 0.5, 16000 * 3, dtype=np.float32)
+        write_pcm(path, [signal[:20000], signal[20000:]])
+        pcm = PcmAudio(path)
+
+        self.assertEqual(len(pcm), len(signal))
+        self.assertAlmostEqual(pcm.duration, 3.0)
+        window = pcm.slice(1.0, 2.0)
+        self.assertEqual(len(window), 16000)
+        self.assertTrue(np.shares_memory(window, pcm.samples))
+        np.testing.assert_allclose(pcm.read(1.0, 2.0), signal[16000:32000], atol=1e-4)
+        self.assertEqual(sum(len(block) for block in pcm.blocks(0.7)), len(signal))
+
+
+    def test_blocks_are_resampled_without_edges(self):
+        import importlib.util
+        import wave
+        import numpy as np
+        from .pcm import iter_audio_blocks
+        if importlib.util.find_spec("torchaudio") is None:
+            self.skipTest("torchaudio is not installed")
+        import torch
+        import torchaudio
+
+        rate = 44100
+        t = np.arange(int(rate * 2.3)) / rate
+        signal = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+        path = os.path.join(self.directory, "tone.wav")
+        with wave.open(path, "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(rate)
+            out.writeframes((signal * 32767).astype("<i2").tobytes())
+
+        whole = torchaudio.functional.resample(torchaudio.load(path)[0].mean(dim=0), rate, 16000).numpy()
+        blocks = np.concatenate(list(iter_audio_blocks(path, 0.3, 16000)))
+        self.assertEqual(len(blocks), len(whole))
+        np.testing.assert_allclose(blocks, whole, atol=1e-5)
+
+class SegmentMatchingTest(TestCase):
+    def brute_force(self, targets, sources):
+        ordered = sorted(range(len(sources)), key=lambda i: (sources[i]['start'], i))
+        matches = []
+        for target in targets:
+            duration = target['end'] - target['start']
+            match = None
+            for i in ordered:
+                overlap = min(target['end'], sources[i]['end']) - max(target['start'], sources[i]['start'])
+                if overlap > 0 and overlap / duration > 0.5:
+                    match = i
+                    break
+            matches.append(match)
+        return matches
+
+    def test_matches_linear_scan(self):
+        import random
+        from .segments import match_overlapping
+        rng = random.Random(1)
+        targets = [{'start': s, 'end': s + 3000} for s in range(0, 600000, 1500)]
+        sources = []
+        for _ in range(300):
+            start = rng.randrange(0, 600000)
+            sources.append({'start': start, 'end': start + rng.randrange(200, 8000)})
+        self.assertEqual(match_overlapping(targets, sources), self.brute_force(targets, sources))
+
+
+class SpeakerClusteringTest(TestCase):
+    def make_embeddings(self, speakers, per_speaker, seed=0):
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        centres = rng.normal(size=(speakers, 192))
+        rows = [centre + 0.6 * rng.normal(size=(per_speaker, 192)) for centre in centres]
+        return np.vstack(rows).astype(np.float32), np.repeat(np.arange(speakers), per_speaker)
+
+    def assertSamePartition(self, labels, truth):
+        pairs = set(zip(labels.tolist(), truth.tolist()))
+        self.assertEqual(len(pairs), len(set(truth.tolist())))
+
+    def test_estimates_speaker_count(self):
+        from .clustering import cluster_speakers
+        embeddings, truth = self.make_embeddings(3, 60)
+        labels = cluster_speakers(embeddings)
+        self.assertEqual(len(set(labels.tolist())), 3)
+        self.assertSamePartition(labels, truth)
+
+    def test_fixed_speaker_count(self):
+        from .clustering import cluster_speakers
+        embeddings, _ = self.make_embeddings(3, 40)
+        self.assertEqual(len(set(cluster_speakers(embeddings, num_speakers=2).tolist())), 2)
+
+    def test_large_inputs_cluster_a_sample(self):
+        from .clustering import cluster_speakers
+        embeddings, truth = self.make_embeddings(4, 500)
+        labels = cluster_speakers(embeddings, full_limit=300, sample_size=200)
+        self.assertSamePartition(labels, truth)
+
+
+class ReclusterTest(TestCase):
+    def setUp(self):
+        use_temp_media(self)
+
+    def test_recluster_from_cached_embeddings(self):
+        import numpy as np
+        from .models import AudioFile, Transcript
+        from .views_pyannote import save_window_embeddings
+
+        audio = AudioFile.objects.create(title="talk.wav", audio_file=SimpleUploadedFile("talk.wav", b"audio"))
+        rng = np.random.default_rng(0)
+        centres = rng.normal(size=(2, 192))
+        embeddings = np.vstack([centres[i % 2] + 0.3 * rng.normal(size=192) for i in range(20)])
+        starts = [i * 1.5 for i in range(20)]
+        save_window_embeddings(audio.audio_file.path, embeddings, starts, [s + 3.0 for s in starts])
+
+        transcript = Transcript.objects.create(
+            audio=audio,
+            diarization_data=[{'start': int(s * 1000), 'end': int((s + 3.0) * 1000), 'speaker': 'SPEAKER_0', 'text': ''} for s in starts],
+            missing_segments=[{'id': 'a', 'start': 1500, 'end': 4500, 'speaker': 'SPEAKER_0', 'text': ''}]
+        )
+
+        data = self.client.post(f"/transcript/{transcript.id}/recluster/", {"num_speakers": 2}, content_type="application/json").json()
+        self.assertTrue(data["success"], data)
+        self.assertEqual(data["num_speakers"], 2)
+        transcript.refresh_from_db()
+        self.assertEqual(transcript.missing_segments[0]["speaker"], transcript.diarization_data[1]["speaker"])
+        self.assertNotEqual(transcript.diarization_data[0]["speaker"], transcript.diarization_data[1]["speaker"])
+
+
+class ChatParseTest(TestCase):
+    CHAT = (
+        "@UTF8\n@Begin\n@Languages:\teng\n@Participants:\tPAR0 Participant, PAR1 Participant\n"
+        "@ID:\teng|corpus|PAR0|||||Participant|||\n@ID:\teng|corpus|PAR1|||||Participant|||\n"
+        "*PAR0:\thello there . \x150_1200\x15\n%mor:\tco|hello adv|there .\n"
+        "*PAR1:\thow are\n\tyou ? \x151500_2600\x15\n@End"
+    )
+
+    def test_parse_once(self):
+        from .chat import parse_chat, speaker_codes, speaker_info
+        parsed = parse_chat(self.CHAT)
+        self.assertEqual(parsed["headers"]["Languages"], "eng")
+        self.assertEqual(len(parsed["ids"]), 2)
+        self.assertEqual(speaker_codes(parsed), ["PAR0", "PAR1"])
+        self.assertEqual(speaker_info(parsed)["PAR1"], {"role": "PAR1", "display_name": "Participant"})
+        self.assertEqual(parsed["utterances"][1], {"speaker": "PAR1", "text": "how are you ?", "start_ms": 1500, "end_ms": 2600})
+        self.assertTrue(self.CHAT[parsed["header_end"]:].startswith("*PAR0:"))
+
+    def test_mapping_rewrites_header_and_refreshes_parse(self):
+        from .models import AudioFile, Transcript
+        audio = AudioFile.objects.create(title="talk.cha")
+        transcript = Transcript.objects.create(audio=audio, chat_content=self.CHAT)
+        self.assertEqual(transcript.parsed_chat()["speakers"], ["PAR0", "PAR1"])
+
+        response = self.client.post(f"/update-speaker-mapping/{transcript.id}/",
+                                    {"speaker_mapping": {"PAR0": "MOT", "PAR1": "CHI"}}, content_type="application/json")
+        self.assertEqual(response.json()["status"], "success")
+
+        transcript = Transcript.objects.get(id=transcript.id)
+        self.assertIn("@Participants:\tMOT MOT, CHI CHI\n@ID:\teng|corpus_name|MOT|||||MOT|||\n@ID:\teng|corpus_name|CHI", transcript.chat_content)
+        self.assertTrue(transcript.chat_content.endswith("you ? \x151500_2600\x15\n@End"))
+        self.assertIsNone(transcript.chat_parsed)
+        self.assertEqual([p["id"] for p in transcript.parsed_chat()["participants"]], ["MOT", "CHI"])
+
+    def test_wrapped_participants_header(self):
+        from .chat import parse_chat, rewrite_header
+        content = (
+            "@UTF8\n@Begin\n@Participants:\tPAR0 Participant,\n\tPAR1 Participant\n"
+            "@ID:\teng|corpus|PAR0|||||Participant|||\n@ID:\teng|corpus|PAR1|||||Participant|||\n"
+            "*PAR0:\thello .\n*PAR1:\thi .\n@End"
+        )
+        parsed = parse_chat(content)
+        self.assertEqual([p["id"] for p in parsed["participants"]], ["PAR0", "PAR1"])
+        self.assertEqual(len(parsed["ids"]), 2)
+        self.assertTrue(content[parsed["header_end"]:].startswith("*PAR0:"))
+
+        rewritten = rewrite_header(content, parsed, "@Participants:\tMOT Mother, CHI Child",
+                                   ["@ID:\teng|corpus_name|MOT|||||Mother|||", "@ID:\teng|corpus_name|CHI|||||Child|||"])
+        self.assertEqual(rewritten, (
+            "@UTF8\n@Begin\n@Participants:\tMOT Mother, CHI Child\n"
+            "@ID:\teng|corpus_name|MOT|||||Mother|||\n@ID:\teng|corpus_name|CHI|||||Child|||\n"
+            "*PAR0:\thello .\n*PAR1:\thi .\n@End"
+        ))
+
+    def test_mapped_rendition_follows_mappings(self):
+        from .chat import map_speakers
+        from .models import AudioFile, SpeakerMap, Transcript
+        self.assertEqual(map_speakers("*PAR1:\thi\n*PAR10:\tyo\n%com:\t*PAR1: quoted", {"PAR1": "MOT", "PAR10": "CHI"}),
+                         "*MOT:\thi\n*CHI:\tyo\n%com:\t*PAR1: quoted")
+
+        transcript = Transcript.objects.create(audio=AudioFile.objects.create(title="talk.cha"), chat_content=self.CHAT)
+        transcript.speaker_mapping.add(SpeakerMap.objects.create(original_id="PAR0", chat_role="MOT"))
+        self.assertIn("*MOT:\thello there", transcript.get_chat_content())
+        self.assertIsNotNone(Transcript.objects.get(id=transcript.id).chat_mapped)
+
+        SpeakerMap.objects.filter(original_id="PAR0").update(chat_role="INV")
+        response = self.client.get(f"/download/{transcript.audio_id}/")
+        self.assertIn(b"*INV:\thello there", response.content)
+
+
+class SpeakerMappingTest(TestCase):
+    def setUp(self):
+        from .models import AudioFile, Transcript
+        self.transcript = Transcript.objects.create(audio=AudioFile.objects.create(title="talk.cha"),
+                                                    chat_content="*PAR0:\thi\n*PAR1:\tho")
+
+    def test_repeated_saves_keep_one_row_per_speaker(self):
+        from .models import SpeakerMap
+        for roles in ({"PAR0": "MOT", "PAR1": "CHI"}, {"PAR0": "MOT", "PAR1": "CHI"}, {"PAR0": "INV", "PAR1": "CHI"}):
+            self.client.post(f"/update-speaker-mapping/{self.transcript.id}/",
+                             {"speaker_mapping": roles}, content_type="application/json")
+        self.assertEqual(SpeakerMap.objects.count(), 2)
+        self.assertEqual(self.transcript.get_chat_content(), "*INV:\thi\n*CHI:\tho")
+
+        self.transcript.set_speaker_mapping({"PAR1": "CHI"})
+        self.assertEqual(list(SpeakerMap.objects.values_list("original_id", flat=True)), ["PAR1"])
+
+    def test_shared_rows_are_not_edited_in_place(self):
+        from .models import AudioFile, SpeakerMap, Transcript
+        other = Transcript.objects.create(audio=AudioFile.objects.create(title="other.cha"),
+                                          chat_content="*PAR0:\tyes\n*PAR1:\tno")
+        shared = SpeakerMap.objects.create(original_id="PAR0", chat_role="MOT")
+        self.transcript.speaker_mapping.add(shared)
+        other.speaker_mapping.add(shared)
+
+        self.transcript.set_speaker_mapping({"PAR0": "INV"})
+        shared.refresh_from_db()
+        self.assertEqual(shared.chat_role, "MOT")
+        self.assertEqual(list(other.speaker_mapping.all()), [shared])
+        self.assertEqual(self.transcript.get_chat_content(), "*INV:\thi\n*PAR1:\tho")
+        self.assertEqual(other.get_chat_content(), "*MOT:\tyes\n*PAR1:\tno")
+
+    def test_backend_without_returning(self):
+        from unittest import mock
+        from django.db import connection
+        from .models import SpeakerMap
+        with mock.patch.object(type(connection.features), "can_return_rows_from_bulk_insert", False):
+            self.transcript.set_speaker_mapping({"PAR0": "MOT", "PAR1": "CHI"})
+        self.assertEqual(sorted(self.transcript.speaker_mapping.values_list("original_id", "chat_role")),
+                         [("PAR0", "MOT"), ("PAR1", "CHI")])
+        self.assertEqual(SpeakerMap.objects.count(), 2)
+
+    def test_compaction_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import SpeakerMap
+        old = SpeakerMap.objects.create(original_id="PAR0", chat_role="MOT")
+        new = SpeakerMap.objects.create(original_id="PAR0", chat_role="INV")
+        self.transcript.speaker_mapping.add(old, new)
+        SpeakerMap.objects.create(original_id="PAR9", chat_role="XXX")
+
+        call_command("compact_speaker_maps", stdout=StringIO())
+        self.assertEqual(list(SpeakerMap.objects.all()), [new])
+        self.assertEqual(self.transcript.get_chat_content(), "*INV:\thi\n*PAR1:\tho")
+
+
+class TranscriptListTest(TestCase):
+    def test_keyset_pages_with_constant_queries(self):
+        from . import views
+        from .models import AudioFile, SpeakerMap, Transcript
+        for i in range(5):
+            audio = AudioFile.objects.create(title=f"session{i}.mp3")
+            transcript = Transcript.objects.create(audio=audio, chat_content="*PAR0:\thi")
+            transcript.speaker_mapping.add(SpeakerMap.objects.create(original_id="PAR0", chat_role="MOT"))
+        AudioFile.objects.create(title="untranscribed.mp3")
+
+        original_page_size = views.TRANSCRIPT_LIST_PAGE_SIZE
+        views.TRANSCRIPT_LIST_PAGE_SIZE = 4
+        self.addCleanup(setattr, views, "TRANSCRIPT_LIST_PAGE_SIZE", original_page_size)
+
+        with self.assertNumQueries(2):
+            first = self.client.get("/transcripts/")
+        self.assertEqual([a.title for a in first.context["audio_files"]],
+                         ["untranscribed.mp3", "session4.mp3", "session3.mp3", "session2.mp3"])
+        self.assertContains(first, "PAR0 → MOT", count=3)
+
+        second = self.client.get("/transcripts/", {"after": first.context["next_cursor"]})
+        self.assertEqual([a.title for a in second.context["audio_files"]], ["session1.mp3", "session0.mp3"])
+        self.assertIsNone(second.context["next_cursor"])
+
+        filtered = self.client.get("/transcripts/", {"q": "SESSION3"})
+        self.assertEqual([a.title for a in filtered.context["audio_files"]], ["session3.mp3"])
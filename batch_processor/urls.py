@@ -4,12 +4,15 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('upload/', views.upload_audio, name='upload_audio'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/batch/<str:batch_id>/', views.batch_status, name='batch_status'),
     path('download-chat/<int:file_id>/', views.download_chat, name='download_chat'),
     path('update-speaker-mapping/<int:transcript_id>/', views.update_speaker_mapping, name='update_speaker_mapping'),
     path('clear-cache/', views.clear_cache, name='clear_cache'),
     path('transcripts/', views.transcript_list, name='transcript_list'),
     path('transcript/<int:transcript_id>/', views.view_transcript, name='view_transcript'),
     path('transcript/<int:transcript_id>/run-pyannote/', views.run_pyannote_diarization, name='run_pyannote_diarization'),
+    path('transcript/<int:transcript_id>/recluster/', views.recluster_diarization, name='recluster_diarization'),
     path('transcript/<int:transcript_id>/update-missing-segment/', views.update_missing_segment, name='update_missing_segment'),
     path('settings/', views.settings_view, name='settings'),
     path('download/<int:file_id>/', views.download_chat, name='download_file'),
@@ -18,6 +21,7 @@ urlpatterns = [
     path('set-hf-token/', views.set_hf_token, name='set_hf_token'),
     path('set-rev-api-key/', views.set_rev_api_key, name='set_rev_api_key'),
     path('get-api-keys/', views.get_api_keys, name='get_api_keys'),
+    path('models/status/', views.model_status, name='model_status'),
     # Add media direct access endpoint
     path('media-direct/<path:file_path>/', views.direct_media_access, name='direct_media_access'),
 ]
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""
+Frame-level energy voice activity detection.
+
+Everything here is vectorised numpy over strided frames, so an hour of
+16 kHz audio is handled in milliseconds. The functions only need a mono
+sample array and its rate, so the diarization, ASR and forced-alignment
+paths can all use them.
+"""
+
+import numpy as np
+
+# Frames are built from non-overlapping hop blocks, so frame_length is rounded to whole hops
+DEFAULT_FRAME_LENGTH = 0.025  # seconds
+DEFAULT_HOP_LENGTH = 0.010  # seconds
+# Thresholds in dB below the reference (loud speech) level; onset > offset gives hysteresis
+DEFAULT_ONSET_DB = 26.0
+DEFAULT_OFFSET_DB = 32.0
+DEFAULT_MIN_SPEECH = 0.25  # seconds, shorter bursts are dropped
+DEFAULT_MIN_SILENCE = 0.30  # seconds, shorter pauses are bridged
+# Samples squared per step when computing block power, bounds temporary memory
+_CHUNK_SAMPLES = 1 << 22
+
+def frame_log_energy(samples, sample_rate, frame_length=DEFAULT_FRAME_LENGTH, hop_length=DEFAULT_HOP_LENGTH):
+    """
+    Log-energy (dB) of strided frames of a mono signal.
+    Returns (energy_db, hop_seconds); frame i starts at i * hop_seconds.
+    """
+    samples = np.asarray(samples)
+    hop = max(1, int(round(hop_length * sample_rate)))
+    blocks_per_frame = max(1, int(round(frame_length / hop_length)))
+    num_blocks = len(samples) // hop
+    if num_blocks == 0:
+        return np.zeros(0, dtype=np.float32), hop / sample_rate
+
+    # Mean power of each hop-sized block, squared in chunks to bound temporary memory
+    power = np.empty(num_blocks, dtype=np.float64)
+    blocks_per_chunk = max(1, _CHUNK_SAMPLES // hop)
+    for first in range(0, num_blocks, blocks_per_chunk):
+        last = min(num_blocks, first + blocks_per_chunk)
+        chunk = samples[first * hop:last * hop].astype(np.float32).reshape(last - first, hop)
+        power[first:last] = np.einsum('ij,ij->i', chunk, chunk) / hop
+
+    # Average neighbouring blocks into overlapping frames
+    if blocks_per_frame > 1:
+        cumulative = np.concatenate(([0.0], np.cumsum(power)))
+        ends = np.minimum(np.arange(num_blocks) + blocks_per_frame, num_blocks)
+        power = (cumulative[ends] - cumulative[:num_blocks]) / (ends - np.arange(num_blocks))
+
+    return (10.0 * np.log10(power + 1e-12)).astype(np.float32), hop / sample_rate
+
+def reference_level(energy_db, percentile=99.0):
+    """Level of loud speech in a signal, robust to isolated peaks"""
+    if len(energy_db) == 0:
+        return 0.0
+    return float(np.percentile(energy_db, percentile))
+
+def hysteresis(energy_db, onset, offset, initial_state=False):
+    """
+    Speech/non-speech state per frame: switch on above `onset`, off below
+    `offset`, and keep the previous state in between. Vectorised by
+    forward-filling the index of the last switching frame.
+    """
+    events = np.zeros(len(energy_db), dtype=np.int8)
+    events[energy_db > onset] = 1
+    events[energy_db < offset] = -1
+
+    last_event = np.where(events != 0, np.arange(len(events)), -1)
+    np.maximum.accumulate(last_event, out=last_event)
+
+    state = np.full(len(events), bool(initial_state))
+    has_event = last_event >= 0
+    state[has_event] = events[last_event[has_event]] > 0
+    return state
+
+def mask_to_regions(mask, hop_seconds, offset=0.0, first_frame=0):
+    """
+    Convert a per-frame boolean mask to (starts, ends) arrays in seconds;
+    `first_frame` is the frame number of mask[0] when it is the tail of a longer mask
+    """
+    padded = np.concatenate(([False], mask, [False]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1]) + first_frame
+    starts = changes[0::2] * hop_seconds + offset
+    ends = changes[1::2] * hop_seconds + offset
+    return starts, ends
+
+def smooth_regions(starts, ends, min_speech=DEFAULT_MIN_SPEECH, min_silence=DEFAULT_MIN_SILENCE):
+    """Bridge pauses shorter than min_silence, then drop regions shorter than min_speech"""
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+    if len(starts) == 0:
+        return starts, ends
+
+    # A region boundary survives only where the gap before the next region is long enough
+    keep_gap = (starts[1:] - ends[:-1]) >= min_silence
+    starts = starts[np.concatenate(([True], keep_gap))]
+    ends = ends[np.concatenate((keep_gap, [True]))]
+
+    long_enough = (ends - starts) >= min_speech
+    return starts[long_enough], ends[long_enough]
+
+def detect_speech(samples, sample_rate, onset_db=DEFAULT_ONSET_DB, offset_db=DEFAULT_OFFSET_DB,
+                  min_speech=DEFAULT_MIN_SPEECH, min_silence=DEFAULT_MIN_SILENCE,
+                  frame_length=DEFAULT_FRAME_LENGTH, hop_length=DEFAULT_HOP_LENGTH, reference_db=None):
+    """
+    Merged speech regions of a mono signal as (starts, ends) arrays in seconds.
+    Thresholds are relative to `reference_db`, which defaults to the loud
+    speech level of this signal.
+    """
+    energy_db, hop_seconds = frame_log_energy(samples, sample_rate, frame_length, hop_length)
+    if reference_db is None:
+        reference_db = reference_level(energy_db)
+    mask = hysteresis(energy_db, reference_db - onset_db, reference_db - offset_db)
+    starts, ends = mask_to_regions(mask, hop_seconds)
+    return smooth_regions(starts, ends, min_speech, min_silence)
+
+def speech_coverage(starts, ends, window_starts, window_ends):
+    """Seconds of speech inside each window, for sorted, non-overlapping speech regions"""
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+    if len(starts) == 0:
+        return np.zeros(len(window_starts))
+
+    lengths = ends - starts
+    cumulative = np.concatenate(([0.0], np.cumsum(lengths)))
+
+    def speech_before(t):
+        # Regions entirely before t, plus the part of the region t falls in
+        k = np.searchsorted(ends, t, side='right')
+        partial = np.zeros_like(t, dtype=np.float64)
+        inside = k < len(starts)
+        partial[inside] = np.clip(t[inside] - starts[k[inside]], 0.0, None)
+        return cumulative[k] + partial
+
+    return speech_before(np.asarray(window_ends, dtype=np.float64)) - speech_before(np.asarray(window_starts, dtype=np.float64))
+
+def sliding_windows(duration, window=3.0, step=1.5):
+    """Start and end times of overlapping fixed-length windows covering [0, duration]"""
+    window_starts = np.arange(0.0, max(duration - step, 0.0), step)
+    window_ends = np.minimum(window_starts + window, duration)
+    return window_starts, window_ends
+
+def speech_windows(starts, ends, duration, window=3.0, step=1.5, min_speech_ratio=0.2):
+    """Sliding windows in which speech covers more than min_speech_ratio of the window"""
+    window_starts, window_ends = sliding_windows(duration, window, step)
+    coverage = speech_coverage(starts, ends, window_starts, window_ends)
+    keep = coverage > min_speech_ratio * (window_ends - window_starts)
+    return window_starts[keep], window_ends[keep]
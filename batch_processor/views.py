@@ -1,10 +1,17 @@
 #Haozhe Ma 2024-Dec-11
 #____________________________
 
-import os, logging, time
+import os, logging, time, uuid, hashlib, tempfile, datetime
 from django.shortcuts import render, redirect
+from django.db.models import Q
 from django.http import JsonResponse, HttpResponse
-from .models import AudioFile, Transcript, SpeakerMap
+from .models import AudioFile, Transcript, SpeakerMap, ProcessingJob
+from .jobs import enqueue_transcription, ASR_HOST, ASR_ENGINE
+from .concurrency import host_slot
+from .cache import asr_cache, asr_cache_key, file_sha256
+from .pcm import remove_pcm
+from .asr_timings import asr_word_timings
+from .chat import parse_chat, rewrite_header, speaker_codes, speaker_info
 from django.core.files.storage import FileSystemStorage
 import batchalign as ba
 import json
@@ -15,6 +22,9 @@ import mimetypes
 
 logger = logging.getLogger('batch_processor')
 
+# Files per page of the transcript list
+TRANSCRIPT_LIST_PAGE_SIZE = 50
+
 def home(request):
     return render(request, 'batch_processor/home.html')
 
@@ -25,15 +35,48 @@ def ensure_media_dir():
     return media_dir
 
 def save_uploaded_file(uploaded_file):
-    """Save uploaded file to MEDIA_ROOT/uploads and return the file path"""
+    """
+    Stream an upload into a temporary file in MEDIA_ROOT/uploads, computing its
+    SHA-256 on the way. Returns (file_path, content_hash).
+    """
     media_dir = ensure_media_dir()
-    file_path = os.path.join(media_dir, uploaded_file.name)
+    digest = hashlib.sha256()
+    fd, file_path = tempfile.mkstemp(dir=media_dir, suffix='.part')
     
-    with open(file_path, 'wb+') as destination:
+    with os.fdopen(fd, 'wb') as destination:
         for chunk in uploaded_file.chunks():
+            digest.update(chunk)
             destination.write(chunk)
     
-    return file_path
+    # Callers still sniff and read the upload itself
+    uploaded_file.seek(0)
+    
+    return file_path, digest.hexdigest()
+
+def store_upload(uploaded_file):
+    """
+    Store an uploaded file unless identical content was uploaded before.
+    Returns (audio, created): the AudioFile holding this content, and whether it is new.
+    """
+    file_path, content_hash = save_uploaded_file(uploaded_file)
+    
+    existing_audio = AudioFile.objects.filter(content_hash=content_hash).first()
+    if existing_audio:
+        os.remove(file_path)
+        logger.info(f"{uploaded_file.name} has the same content as {existing_audio.title} (sha256 {content_hash[:12]})")
+        return existing_audio, False
+    
+    audio = AudioFile(title=uploaded_file.name, content_hash=content_hash)
+    storage = audio.audio_file.storage
+    name = storage.get_available_name(os.path.join('uploads', os.path.basename(uploaded_file.name)))
+    os.replace(file_path, storage.path(name))
+    audio.audio_file.name = name
+    audio.save()
+    return audio, True
+
+def find_active_job(audio):
+    """Return the queued or running transcription job of an AudioFile, if any"""
+    return audio.jobs.filter(status__in=['QUEUED', 'RUNNING']).order_by('created_at').first()
 
 def update_speaker_mapping(request, transcript_id):
     """Handle AJAX requests to update speaker mapping"""
@@ -55,11 +98,9 @@ def update_speaker_mapping(request, transcript_id):
             if not mappings:
                 raise ValueError("No speaker mappings provided in request")
                 
-            # Update or create speaker mappings
-            transcript.speaker_mapping.all().delete()  # Remove old mappings
-            
             # Collect all speakers for header
             participants = []
+            roles = {}
             for original_id, mapping in mappings.items():
                 # Handle both object format and string format
                 if isinstance(mapping, dict):
@@ -70,40 +111,29 @@ def update_speaker_mapping(request, transcript_id):
                     role = mapping
                     display_name = mapping
                 
-                speaker_map = SpeakerMap.objects.create(
-                    original_id=original_id,
-                    chat_role=role
-                )
-                transcript.speaker_mapping.add(speaker_map)
+                roles[original_id] = role
                 participants.append(f"{role} {display_name}")
             
-            # Update the header in chat_content
-            lines = transcript.chat_content.split('\n')
-            updated_lines = []
-            header_updated = {'participants': False, 'ids': False}
+            # Update, create and prune speaker mappings in one go
+            transcript.set_speaker_mapping(roles)
             
-            for line in lines:
-                if line.startswith('@Participants:'):
-                    updated_lines.append('@Participants:\t' + ', '.join(participants))
-                    header_updated['participants'] = True
-                elif line.startswith('@ID:'):
-                    if not header_updated['ids']:
-                        # Add @ID lines for all speakers
-                        for original_id, mapping in mappings.items():
-                            # Handle both object format and string format
-                            if isinstance(mapping, dict):
-                                role = mapping.get('role', '')
-                                display_name = mapping.get('display_name', role)
-                            else:
-                                role = mapping
-                                display_name = mapping
-                                
-                            updated_lines.append(f"@ID:\teng|corpus_name|{role}|||||{display_name}|||")
-                        header_updated['ids'] = True
-                elif not (line.startswith('@ID:') and header_updated['ids']):
-                    updated_lines.append(line)
+            # @ID lines for all speakers
+            id_lines = []
+            for original_id, mapping in mappings.items():
+                # Handle both object format and string format
+                if isinstance(mapping, dict):
+                    role = mapping.get('role', '')
+                    display_name = mapping.get('display_name', role)
+                else:
+                    role = mapping
+                    display_name = mapping
+                id_lines.append(f"@ID:\teng|corpus_name|{role}|||||{display_name}|||")
             
-            transcript.chat_content = '\n'.join(updated_lines)
+            # Update the header in chat_content; only the header block is rewritten
+            transcript.chat_content = rewrite_header(
+                transcript.chat_content, transcript.parsed_chat(),
+                '@Participants:\t' + ', '.join(participants), id_lines
+            )
             transcript.save()
             
             return JsonResponse({
@@ -115,8 +145,21 @@ def update_speaker_mapping(request, transcript_id):
             return JsonResponse({'status': 'error', 'message': str(e)})
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
 
-def process_audio(audio_file_path, lang="eng"):
+def process_audio(audio_file_path, lang="eng", content_hash=None):
+    """
+    Transcribe an audio file with Rev.ai through batchalign.
+    Results are cached by audio content, language, engine and batchalign
+    version, so audio that was transcribed before is never sent again.
+    Returns (raw_content, chat_content, segments, speakers, asr_words).
+    """
     try:
+        cache_key = asr_cache_key(content_hash or file_sha256(audio_file_path), lang, ASR_ENGINE)
+        cached = asr_cache().get(cache_key)
+        if cached:
+            logger.info(f"ASR cache hit for {audio_file_path}")
+            asr_words = cached['asr_words'] if 'asr_words' in cached else asr_word_timings(cached.get('document'))
+            return cached['raw_content'], cached['chat_content'], cached['segments'], cached['speakers'], asr_words
+        
         # Load API keys from environment or .env file
         import os
         from pathlib import Path
@@ -139,7 +182,7 @@ def process_audio(audio_file_path, lang="eng"):
         
         if not rev_api_key:
             logger.error("Rev.ai API key is not set. Please set it in the settings page.")
-            return None, None, None, None
+            return None, None, None, None, None
             
         # Temporarily set environment variables for this process
         os.environ['REV_API_KEY'] = rev_api_key
@@ -152,8 +195,10 @@ def process_audio(audio_file_path, lang="eng"):
         # Create a Batchalign pipeline
         nlp = ba.BatchalignPipeline(asr_engine)
         
-        # Process the audio file
-        doc = nlp(audio_file_path)
+        # Process the audio file, holding one of the submission slots for the ASR host. Rev.ai gets
+        # the upload itself: the shared PCM is for local consumers, and larger and resampled
+        with host_slot(ASR_HOST):
+            doc = nlp(audio_file_path)
         
         # Get both raw transcript and CHAT format
         raw_content = doc.transcript(include_tiers=True, strip=False)
@@ -161,19 +206,36 @@ def process_audio(audio_file_path, lang="eng"):
         # Create CHAT file from the document
         chat_file = ba.CHATFile(doc=doc)
         chat_content = str(chat_file)
+        segments = doc.segments if hasattr(doc, "segments") else None
         
         # Extract speakers from CHAT content since it's properly formatted
         speakers = extract_speakers_from_raw(chat_content)
         if not speakers:  # Fallback to diarization data if no speakers found
-            diarization_data = doc.segments if hasattr(doc, "segments") else []
+            diarization_data = segments or []
             speakers = list(set(seg['speaker'] for seg in diarization_data)) if diarization_data else []
             
         logger.info(f"Extracted {len(speakers)} speakers from audio: {speakers}")
         
-        return raw_content, chat_content, doc.segments if hasattr(doc, "segments") else None, speakers
+        # Keep Rev.ai's word times; forced alignment uses them as a prior
+        document_json = doc.model_dump(mode='json')
+        asr_words = asr_word_timings(document_json)
+        
+        try:
+            asr_cache().set(cache_key, {
+                'document': document_json,
+                'raw_content': raw_content,
+                'chat_content': chat_content,
+                'segments': segments,
+                'speakers': speakers,
+                'asr_words': asr_words
+            })
+        except Exception as e:
+            logger.warning(f"Could not cache ASR result for {audio_file_path}: {e}")
+        
+        return raw_content, chat_content, segments, speakers, asr_words
     except Exception as e:
         logger.error(f"Batchalign processing error: {e}")
-        return None, None, None, None
+        return None, None, None, None, None
 
 def download_chat(request, file_id):
     try:
@@ -183,82 +245,24 @@ def download_chat(request, file_id):
         if not transcript or not transcript.chat_content:
             return JsonResponse({"status": "error", "message": "CHAT format not available"})
         
-        # Create response with CHAT content
-        chat_content = transcript.get_chat_content()  # Get mapped content
-        response = HttpResponse(chat_content, content_type='text/plain')
+        # Send the stored speaker-mapped rendition as it is
+        response = HttpResponse(transcript.mapped_chat_bytes(), content_type='text/plain; charset=utf-8')
         response['Content-Disposition'] = f'attachment; filename="{audio_file.title}.cha"'
         return response
     except AudioFile.DoesNotExist:
         return JsonResponse({"status": "error", "message": "File not found"})
 
 def extract_speakers_from_raw(raw_content):
-    """Extract speakers from raw transcript content"""
-    speakers = set()
-    lines = raw_content.split('\n')
-    
-    logger.debug(f"Extracting speakers from raw content starting with: {lines[:3]}")
-    
-    # First try to get speakers from @Participants line
-    for line in lines:
-        if line.startswith('@Participants:'):
-            logger.debug(f"Found @Participants line: {line}")
-            # Parse participants line (e.g. "@Participants: MOT Mother, CHI Child")
-            parts = line.replace('@Participants:', '').strip().split(',')
-            for part in parts:
-                if part.strip():
-                    speaker = part.strip().split()[0]  # Get first word (e.g. "MOT" from "MOT Mother")
-                    speakers.add(speaker)
-            if speakers:  # If we found speakers in @Participants, use those
-                logger.info(f"Found speakers from @Participants: {list(speakers)}")
-                return list(speakers)
-    
-    # If no @Participants line or no speakers found, try utterance lines
-    for line in lines:
-        if line.startswith('*'):
-            speaker = line.split(':')[0].replace('*', '').strip()
-            if speaker:
-                speakers.add(speaker)
-    
-    logger.info(f"Found speakers from utterances: {list(speakers)}")
-    return list(speakers)
+    """Extract speakers from raw transcript content: @Participants first, otherwise the utterance lines"""
+    speakers = speaker_codes(parse_chat(raw_content))
+    logger.info(f"Found speakers: {speakers}")
+    return speakers
 
-def extract_speakers_from_chat(content):
-    """Extract speakers and their roles from CHAT format content"""
-    speakers_info = {}
-    lines = content.split('\n')
-    
-    logger.debug(f"Extracting speakers from CHAT content starting with: {lines[:3]}")
-    
-    # First get the full participant information
-    for line in lines:
-        if line.startswith('@Participants:'):
-            logger.debug(f"Found @Participants line: {line}")
-            parts = line.replace('@Participants:', '').strip().split(',')
-            for part in parts:
-                if part.strip():
-                    words = part.strip().split()
-                    if len(words) >= 2:
-                        speaker_id = words[0]
-                        display_name = ' '.join(words[1:])
-                        speakers_info[speaker_id] = {
-                            'role': speaker_id,
-                            'display_name': display_name
-                        }
-    
-    # If no @Participants line, try to get speakers from utterance lines
-    if not speakers_info:
-        logger.debug("No @Participants line found, checking utterance lines")
-        for line in lines:
-            if line.startswith('*'):
-                speaker = line.split(':')[0].replace('*', '').strip()
-                if speaker and speaker not in speakers_info:
-                    speakers_info[speaker] = {
-                        'role': '',
-                        'display_name': speaker
-                    }
-    
-    logger.info(f"Extracted speakers info: {speakers_info}")
-    return speakers_info
+def transcript_speakers(transcript):
+    """Speakers of a transcript, from its stored parse of chat_content"""
+    if transcript.chat_content:
+        return speaker_codes(transcript.parsed_chat())
+    return extract_speakers_from_raw(transcript.raw_content or '')
 
 def get_existing_mappings(transcript):
     """Get existing speaker mappings for a transcript"""
@@ -278,31 +282,20 @@ def ensure_chat_content(transcript, doc=None):
                 # Create a new document from raw content
                 doc = ba.Document()
                 # Parse header information
-                header_info = {'participants': {}, 'media': '', 'languages': ['eng']}
-                lines = transcript.raw_content.split('\n')
-                
-                for line in lines:
-                    if line.startswith('@Participants:'):
-                        parts = line.replace('@Participants:', '').strip().split(',')
-                        for part in parts:
-                            if part.strip():
-                                words = part.strip().split()
-                                if len(words) >= 2:
-                                    header_info['participants'][words[0]] = ' '.join(words[1:])
-                    elif line.startswith('@Media:'):
-                        header_info['media'] = line.replace('@Media:', '').strip().split(',')[0]
-                    elif line.startswith('@Languages:'):
-                        header_info['languages'] = [lang.strip() for lang in line.replace('@Languages:', '').strip().split(',')]
+                parsed = parse_chat(transcript.raw_content)
+                headers = parsed['headers']
+                header_info = {
+                    'participants': {p['id']: p['name'] for p in parsed['participants'] if p['name']},
+                    'media': headers.get('Media', '').split(',')[0],
+                    'languages': [lang.strip() for lang in headers['Languages'].split(',')] if 'Languages' in headers else ['eng']
+                }
                 
                 # Add utterances
-                for line in transcript.raw_content.split('\n'):
-                    if line.startswith('*'):
-                        speaker = line.split(':')[0].replace('*', '').strip()
-                        text = ':'.join(line.split(':')[1:]).strip()
-                        doc.add_utterance(ba.Utterance(
-                            text=text,
-                            speaker=speaker
-                        ))
+                for utterance in parsed['utterances']:
+                    doc.add_utterance(ba.Utterance(
+                        text=utterance['text'],
+                        speaker=utterance['speaker']
+                    ))
                 
                 # Update header information
                 doc.metadata.update({
@@ -360,15 +353,13 @@ def upload_audio(request):
             logger.info(f"Processing single file upload: {audio_file.name}")
             
             try:
-                # Check if file with same name exists
-                existing_audio = AudioFile.objects.filter(title=audio_file.name).first()
-                if existing_audio and existing_audio.transcript:
+                # Identical content is only ever processed once, whatever the filename
+                audio, created = store_upload(audio_file)
+                if not created and hasattr(audio, 'transcript'):
                     logger.info(f"Found existing transcript for {audio_file.name}")
-                    transcript = existing_audio.transcript
+                    transcript = audio.transcript
                     ensure_chat_content(transcript)
-                    content_to_parse = transcript.chat_content if transcript.chat_content else transcript.raw_content
-                    logger.debug(f"Content being parsed for speakers: {content_to_parse[:200]}")  # First 200 chars
-                    speakers = extract_speakers_from_raw(content_to_parse)
+                    speakers = transcript_speakers(transcript)
                     logger.info(f"Extracted speakers from existing transcript: {speakers}")
                     existing_mappings = get_existing_mappings(transcript)
                     logger.debug(f"Existing speaker mappings: {existing_mappings}")
@@ -382,6 +373,15 @@ def upload_audio(request):
                         "transcript_id": transcript.id,
                         "message": "Retrieved existing transcript"
                     })
+                
+                active_job = None if created else find_active_job(audio)
+                if active_job:
+                    return JsonResponse({
+                        "status": "queued",
+                        "job_id": active_job.id,
+                        "audio_id": audio.id,
+                        "message": "This recording is already being transcribed"
+                    })
 
                 # Check if it's a CHAT file
                 is_chat = is_chat_file(audio_file)
@@ -391,12 +391,6 @@ def upload_audio(request):
                     # Handle CHAT file upload
                     content = audio_file.read().decode('utf-8')
                     audio_file.seek(0)
-                    speakers_info = extract_speakers_from_chat(content)
-                    logger.info(f"Processing CHAT file with speakers: {list(speakers_info.keys())}")
-                    
-                    # Create new records
-                    audio = AudioFile.objects.create(title=audio_file.name)
-                    audio.audio_file.save(audio_file.name, audio_file, save=True)
                     
                     transcript = Transcript.objects.create(
                         audio=audio,
@@ -404,6 +398,8 @@ def upload_audio(request):
                         chat_content=content,
                         diarization_data=None
                     )
+                    speakers_info = speaker_info(transcript.parsed_chat())
+                    logger.info(f"Processing CHAT file with speakers: {list(speakers_info.keys())}")
                     
                     logger.debug(f"Created transcript with id {transcript.id}")
                     return JsonResponse({
@@ -415,64 +411,16 @@ def upload_audio(request):
                         "transcript_id": transcript.id
                     })
                 else:
-                    # Handle audio file upload
-                    logger.info(f"Processing audio file: {audio_file.name}")
-                    file_path = save_uploaded_file(audio_file)
-                    raw_content, chat_content, diarization_data, speakers = process_audio(file_path)
+                    # Handle audio file upload: hand the stored file to the worker pool
+                    logger.info(f"Queueing audio file: {audio_file.name}")
+                    job = enqueue_transcription(audio)
                     
-                    if raw_content and chat_content:
-                        logger.info(f"Successfully processed audio with speakers: {speakers}")
-                        logger.debug(f"Raw content preview: {raw_content[:200]}")
-                        logger.debug(f"Chat content preview: {chat_content[:200]}")
-                        
-                        # Create default speaker mappings
-                        speaker_mappings = {
-                            speaker: create_default_speaker_mapping(speaker)
-                            for speaker in (speakers or [])
-                        }
-                        logger.debug(f"Created default speaker mappings: {speaker_mappings}")
-                        
-                        if existing_audio:
-                            existing_audio.audio_file.save(audio_file.name, audio_file, save=False)
-                            existing_audio.save()
-                            if hasattr(existing_audio, 'transcript'):
-                                existing_audio.transcript.raw_content = raw_content
-                                existing_audio.transcript.chat_content = chat_content
-                                existing_audio.transcript.diarization_data = diarization_data
-                                existing_audio.transcript.save()
-                                transcript = existing_audio.transcript
-                            else:
-                                transcript = Transcript.objects.create(
-                                    audio=existing_audio, 
-                                    raw_content=raw_content,
-                                    chat_content=chat_content,
-                                    diarization_data=diarization_data
-                                )
-                        else:
-                            audio = AudioFile.objects.create(title=audio_file.name)
-                            audio.audio_file.save(audio_file.name, audio_file, save=True)
-                            transcript = Transcript.objects.create(
-                                audio=audio, 
-                                raw_content=raw_content,
-                                chat_content=chat_content,
-                                diarization_data=diarization_data
-                            )
-                        
-                        logger.debug(f"Created/updated transcript with id {transcript.id}")
-                        return JsonResponse({
-                            "status": "success", 
-                            "raw_content": raw_content,
-                            "chat_content": chat_content,
-                            "speakers": speakers or [],  # Ensure we always send a list
-                            "existing_mappings": speaker_mappings,
-                            "transcript_id": transcript.id
-                        })
-                    else:
-                        logger.error("Audio processing failed - no content generated")
-                        return JsonResponse({
-                            "status": "error", 
-                            "message": "Audio processing failed. Please make sure your Rev.ai API key is set up correctly."
-                        })
+                    return JsonResponse({
+                        "status": "queued",
+                        "job_id": job.id,
+                        "audio_id": audio.id,
+                        "message": "Transcription queued"
+                    })
             except Exception as e:
                 logger.exception(f"Error processing file {audio_file.name}: {str(e)}")
                 return JsonResponse({
@@ -482,16 +430,17 @@ def upload_audio(request):
         
         elif request.FILES.getlist("input_folder"):
             files = request.FILES.getlist("input_folder")
-            logger.info(f"Processing batch upload of {len(files)} files")
+            logger.info(f"Queueing batch upload of {len(files)} files")
+            batch_id = str(uuid.uuid4())
             results = []
             for file in files:
                 try:
-                    # Check for existing file
-                    existing_audio = AudioFile.objects.filter(title=file.name).first()
-                    if existing_audio and existing_audio.transcript:
-                        transcript = existing_audio.transcript
+                    # Check for identical content processed before
+                    audio, created = store_upload(file)
+                    if not created and hasattr(audio, 'transcript'):
+                        transcript = audio.transcript
                         ensure_chat_content(transcript)
-                        speakers = extract_speakers_from_raw(transcript.raw_content)
+                        speakers = transcript_speakers(transcript)
                         results.append({
                             "file": file.name, 
                             "status": "success",
@@ -502,48 +451,16 @@ def upload_audio(request):
                         })
                         continue
                     
-                    # Save and process the file
-                    file_path = save_uploaded_file(file)
-                    raw_content, chat_content, diarization_data, speakers = process_audio(file_path)
-
-                    if raw_content and chat_content:
-                        if existing_audio:
-                            existing_audio.audio_file.save(file.name, file, save=False)
-                            existing_audio.save()
-                            if hasattr(existing_audio, 'transcript'):
-                                existing_audio.transcript.raw_content = raw_content
-                                existing_audio.transcript.chat_content = chat_content
-                                existing_audio.transcript.diarization_data = diarization_data
-                                existing_audio.transcript.save()
-                                transcript = existing_audio.transcript
-                            else:
-                                transcript = Transcript.objects.create(
-                                    audio=existing_audio, 
-                                    raw_content=raw_content,
-                                    chat_content=chat_content,
-                                    diarization_data=diarization_data
-                                )
-                        else:
-                            audio = AudioFile.objects.create(title=file.name)
-                            audio.audio_file.save(file.name, file, save=True)
-                            transcript = Transcript.objects.create(
-                                audio=audio, 
-                                raw_content=raw_content,
-                                chat_content=chat_content,
-                                diarization_data=diarization_data
-                            )
-                        results.append({
-                            "file": file.name, 
-                            "status": "success",
-                            "transcript_id": transcript.id,
-                            "speakers": speakers
-                        })
-                    else:
-                        results.append({
-                            "file": file.name, 
-                            "status": "error",
-                            "message": "Processing failed"
-                        })
+                    # Queue it for the worker pool, unless it is already on its way
+                    job = None if created else find_active_job(audio)
+                    if job is None:
+                        job = enqueue_transcription(audio, batch_id=batch_id)
+                    results.append({
+                        "file": file.name,
+                        "status": "queued",
+                        "job_id": job.id,
+                        "audio_id": audio.id
+                    })
                 except Exception as e:
                     results.append({
                         "file": file.name,
@@ -551,10 +468,70 @@ def upload_audio(request):
                         "message": str(e)
                     })
             
-            return JsonResponse({"status": "batch_completed", "results": results})
+            return JsonResponse({
+                "status": "batch_queued",
+                "batch_id": batch_id,
+                "message": f"Queued {sum(1 for r in results if r['status'] == 'queued')} of {len(files)} files",
+                "results": results
+            })
 
     return render(request, "batch_processor/upload.html")
 
+def job_payload(job):
+    """Describe a transcription job, with the transcript once it is done"""
+    payload = {
+        "job_id": job.id,
+        "audio_id": job.audio_id,
+        "file": job.audio.title,
+        "job_status": job.status.lower(),
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at
+    }
+
+    if job.status == 'FAILED':
+        payload["message"] = job.error_message
+    elif job.status == 'DONE' and hasattr(job.audio, 'transcript'):
+        transcript = job.audio.transcript
+        speakers = transcript_speakers(transcript)
+        existing_mappings = {speaker: create_default_speaker_mapping(speaker) for speaker in speakers}
+        existing_mappings.update(get_existing_mappings(transcript))
+        payload.update({
+            "raw_content": transcript.raw_content,
+            "chat_content": transcript.chat_content,
+            "speakers": speakers,
+            "existing_mappings": existing_mappings,
+            "transcript_id": transcript.id
+        })
+    return payload
+
+def job_status(request, job_id):
+    """Report the state of a transcription job: queued, running, done or failed"""
+    try:
+        job = ProcessingJob.objects.select_related('audio').get(id=job_id)
+    except ProcessingJob.DoesNotExist:
+        return JsonResponse({"status": "error", "message": "Job not found"})
+
+    return JsonResponse({"status": "success", **job_payload(job)})
+
+def batch_status(request, batch_id):
+    """Report every job of a batch upload; finished files are returned as soon as they complete"""
+    jobs = list(ProcessingJob.objects.filter(batch_id=batch_id).select_related('audio').order_by('id'))
+    if not jobs:
+        return JsonResponse({"status": "error", "message": "Batch not found"})
+
+    counts = {status.lower(): 0 for status, _ in ProcessingJob.STATUS_CHOICES}
+    for job in jobs:
+        counts[job.status.lower()] += 1
+
+    return JsonResponse({
+        "status": "success",
+        "batch_id": batch_id,
+        "counts": counts,
+        "finished": counts['done'] + counts['failed'] == len(jobs),
+        "jobs": [job_payload(job) for job in jobs]
+    })
+
 def clear_cache(request):
     """Clear all processed files and their data"""
     if request.method == "POST":
@@ -584,10 +561,52 @@ def clear_cache(request):
         "message": "Invalid request method"
     })
 
+def list_cursor(audio):
+    """Opaque keyset position of an AudioFile in the newest-first list, as <uploaded_at in µs>-<id>"""
+    micros = (audio.uploaded_at - datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)) // datetime.timedelta(microseconds=1)
+    return f"{micros}-{audio.id}"
+
+def parse_list_cursor(cursor):
+    """(uploaded_at, id) of a list_cursor, or None when it is missing or malformed"""
+    try:
+        micros, audio_id = (int(part) for part in cursor.split('-'))
+    except (AttributeError, ValueError):
+        return None
+    return datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(microseconds=micros), audio_id
+
 def transcript_list(request):
-    """View to list all processed audio files and their transcripts"""
-    audio_files = AudioFile.objects.all().order_by('-uploaded_at')
-    return render(request, 'batch_processor/list_files.html', {'audio_files': audio_files})
+    """
+    View to list processed audio files and their transcripts, newest first.
+    Pages are keyset-paginated on (uploaded_at, id) with ?after=<cursor>, and
+    ?q= filters by file name, so each page costs the same however many files
+    there are. Only the columns the table shows are loaded.
+    """
+    query = request.GET.get('q', '').strip()
+    audio_files = (
+        AudioFile.objects
+        .select_related('transcript')
+        .only('id', 'title', 'uploaded_at', 'transcript__id', 'transcript__audio_id')
+        .prefetch_related('transcript__speaker_mapping')
+        .order_by('-uploaded_at', '-id')
+    )
+    if query:
+        audio_files = audio_files.filter(title__icontains=query)
+    
+    position = parse_list_cursor(request.GET.get('after'))
+    if position:
+        uploaded_at, audio_id = position
+        audio_files = audio_files.filter(Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=audio_id))
+    
+    # One row more than a page tells whether there is a next page
+    page = list(audio_files[:TRANSCRIPT_LIST_PAGE_SIZE + 1])
+    next_cursor = list_cursor(page[TRANSCRIPT_LIST_PAGE_SIZE - 1]) if len(page) > TRANSCRIPT_LIST_PAGE_SIZE else None
+    
+    return render(request, 'batch_processor/list_files.html', {
+        'audio_files': page[:TRANSCRIPT_LIST_PAGE_SIZE],
+        'query': query,
+        'next_cursor': next_cursor,
+        'is_first_page': position is None
+    })
 
 def view_transcript(request, transcript_id):
     """View to display a transcript with audio player"""
@@ -609,14 +628,9 @@ def view_transcript(request, transcript_id):
         # 2. Get speakers from existing speaker mappings
         speakers.update(sm.original_id for sm in transcript.speaker_mapping.all())
             
-        # 3. Extract speakers from transcript content
+        # 3. Speakers of the utterance lines ("*MOT:"), from the stored parse
         if transcript.chat_content:
-            # Look for lines like "*MOT:" in the CHAT format
-            for line in transcript.chat_content.split('\n'):
-                if line.startswith('*') and ':' in line:
-                    speaker = line[1:line.index(':')].strip()
-                    if speaker:
-                        speakers.add(speaker)
+            speakers.update(transcript.parsed_chat()['speakers'])
         
         # Convert to sorted list and create JSON
         speakers_list = sorted(list(speakers))
@@ -975,6 +989,51 @@ def run_pyannote_diarization(request, transcript_id):
         logger.exception(f"Error processing audio with Pyannote: {e}")
         return JsonResponse({'success': False, 'message': str(e)})
 
+def model_status(request):
+    """Report load time and memory footprint of the models loaded in this process"""
+    from .model_registry import registry
+    return JsonResponse({'status': 'success', 'pid': os.getpid(), 'models': registry.stats()})
+
+def recluster_diarization(request, transcript_id):
+    """Re-cluster the speakers of a Pyannote diarization from its cached window embeddings"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Only POST method is allowed'})
+    
+    try:
+        from .views_pyannote import recluster_transcript
+        
+        data = json.loads(request.body or '{}')
+        num_speakers = data.get('num_speakers')
+        distance_threshold = data.get('distance_threshold')
+        
+        transcript = Transcript.objects.select_related('audio').get(id=transcript_id)
+        if not transcript.audio.audio_file:
+            return JsonResponse({'success': False, 'message': 'Audio file not found'})
+        
+        diarization_data, missing_segments = recluster_transcript(
+            transcript,
+            num_speakers=int(num_speakers) if num_speakers else None,
+            distance_threshold=float(distance_threshold) if distance_threshold else None
+        )
+        
+        transcript.diarization_data = diarization_data
+        transcript.missing_segments = missing_segments
+        transcript.save()
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'Speakers re-clustered successfully',
+            'num_speakers': len({segment['speaker'] for segment in diarization_data}),
+            'diarization_count': len(diarization_data),
+            'missing_segments_count': len(missing_segments)
+        })
+        
+    except Transcript.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'Transcript not found'})
+    except Exception as e:
+        logger.exception(f"Error re-clustering speakers: {e}")
+        return JsonResponse({'success': False, 'message': str(e)})
+
 def get_hf_token():
     """Get Hugging Face token from environment or .env file"""
     import os
@@ -1067,11 +1126,14 @@ def delete_file(request, file_id):
         try:
             audio_file = AudioFile.objects.get(id=file_id)
             
-            # Delete the physical file if it exists
+            # Delete the physical file, its decoded PCM and its cached embeddings if they exist
             if audio_file.audio_file:
                 try:
-                    if os.path.exists(audio_file.audio_file.path):
-                        os.remove(audio_file.audio_file.path)
+                    from .views_pyannote import embeddings_path
+                    for path in (audio_file.audio_file.path, embeddings_path(audio_file.audio_file.path)):
+                        if os.path.exists(path):
+                            os.remove(path)
+                    remove_pcm(audio_file.audio_file.path)
                 except Exception as e:
                     logger.warning(f"Failed to delete physical file: {e}")
             
@@ -1,15 +1,190 @@
+import logging
+import os
+
+from django.conf import settings
+
+from .model_registry import get_embedding_model
+from .vad import detect_speech, speech_windows
+from .segments import match_overlapping
+from .clustering import cluster_speakers
+from .pcm import open_pcm
+
+logger = logging.getLogger('batch_processor')
+
+def extract_embeddings(embedding_model, waveform, sample_rate, windows, batch_size=None):
+    """
+    Embed each (start, end) window of an in-memory mono waveform.
+    The audio is resampled once to the model rate, windows are sliced from
+    it without touching the file again, and they go through the model in
+    mini-batches. Shorter windows are zero-padded and masked.
+    Returns (embeddings, kept): an (n, dim) array and the indices of the
+    windows it covers.
+    """
+    import numpy as np
+    import torch
+    import torchaudio
+
+    batch_size = batch_size or settings.BATCHALIGN_EMBEDDING_BATCH_SIZE
+    model_rate = getattr(embedding_model, 'sample_rate', sample_rate)
+    if model_rate != sample_rate:
+        waveform = torchaudio.functional.resample(waveform, sample_rate, model_rate)
+    num_samples = waveform.shape[-1]
+
+    embeddings = []
+    kept = []
+    for batch_start in range(0, len(windows), batch_size):
+        batch_windows = windows[batch_start:batch_start + batch_size]
+        bounds = [
+            (min(int(start * model_rate), num_samples), min(int(end * model_rate), num_samples))
+            for start, end in batch_windows
+        ]
+        max_len = max(end - start for start, end in bounds)
+        if max_len <= 0:
+            continue
+
+        chunks = torch.zeros(len(bounds), 1, max_len, dtype=waveform.dtype)
+        masks = torch.zeros(len(bounds), max_len)
+        for i, (start, end) in enumerate(bounds):
+            chunks[i, 0, :end - start] = waveform[0, start:end]
+            masks[i, :end - start] = 1.0
+
+        try:
+            batch_embeddings = np.asarray(embedding_model(chunks, masks=masks))
+        except Exception as e:
+            logger.error(f"Error extracting embeddings for windows {batch_start}-{batch_start + len(bounds)}: {e}")
+            continue
+
+        # Windows too short for the model come back as NaN rows
+        valid = ~np.isnan(batch_embeddings).any(axis=1)
+        embeddings.append(batch_embeddings[valid])
+        kept.extend(batch_start + i for i in np.flatnonzero(valid))
+
+    if not embeddings:
+        return np.zeros((0, 0), dtype=np.float32), []
+    return np.vstack(embeddings).astype(np.float32), kept
+
+def embeddings_path(audio_path):
+    """Sidecar file holding the per-window embeddings of a recording, next to the media"""
+    return f"{audio_path}.embeddings.npz"
+
+def save_window_embeddings(audio_path, embeddings, starts, ends):
+    """Persist window embeddings (float32) and their exact spans in seconds, for re-clustering later"""
+    import numpy as np
+    path = embeddings_path(audio_path)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, embeddings=np.asarray(embeddings, dtype=np.float32),
+             starts=np.asarray(starts, dtype=np.float64), ends=np.asarray(ends, dtype=np.float64))
+    os.replace(tmp_path, path)
+
+def load_window_embeddings(audio_path):
+    """Return (embeddings, starts, ends) saved by save_window_embeddings, or None"""
+    import numpy as np
+    path = embeddings_path(audio_path)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return data['embeddings'], data['starts'], data['ends']
+
+def recluster_transcript(transcript, num_speakers=None, distance_threshold=None):
+    """
+    Relabel the speakers of an existing Pyannote diarization from the cached
+    window embeddings, without decoding audio or running the model again.
+    Window times are unchanged, so the ASR text matches and missing segments
+    stay valid; only speaker labels move. Returns (diarization_data, missing_segments).
+    """
+    cached = load_window_embeddings(transcript.audio.audio_file.path)
+    if cached is None:
+        raise ValueError("No cached embeddings for this recording. Run Pyannote diarization first.")
+    embeddings, starts, ends = cached
+
+    diarization_data = transcript.diarization_data or []
+    window_starts = [int(start * 1000) for start in starts]
+    if len(diarization_data) != len(window_starts) or any(
+            segment['start'] != start for segment, start in zip(diarization_data, window_starts)):
+        raise ValueError("Cached embeddings do not match the current diarization. Run Pyannote diarization again.")
+
+    labels = cluster_speakers(embeddings, num_speakers=num_speakers, distance_threshold=distance_threshold)
+
+    speaker_by_bounds = {}
+    for segment, label in zip(diarization_data, labels):
+        segment['speaker'] = f"SPEAKER_{label}"
+        speaker_by_bounds[(segment['start'], segment['end'])] = segment['speaker']
+
+    missing_segments = transcript.missing_segments or []
+    for segment in missing_segments:
+        segment['speaker'] = speaker_by_bounds.get((segment.get('start'), segment.get('end')), segment.get('speaker', ''))
+
+    return diarization_data, missing_segments
+
+def _streamed_embeddings(pcm, embedding_model):
+    """Window embeddings of a long recording, read and embedded one block at a time"""
+    import torch
+    from .streaming_diarization import stream_window_embeddings
+
+    def embed(samples, windows):
+        return extract_embeddings(embedding_model, torch.from_numpy(samples).unsqueeze(0), pcm.sample_rate, windows)
+
+    starts, ends, embeddings = stream_window_embeddings(pcm, embed)
+    if len(starts) == 0:
+        # Nothing passed the VAD; embed plain 3 second windows instead, like the in-memory path
+        starts, ends, embeddings = stream_window_embeddings(pcm, embed, step=3.0, min_speech_ratio=-1.0)
+    segments = [{'start': float(start), 'end': float(end)} for start, end in zip(starts, ends)]
+    return embeddings, segments
+
+def _in_memory_embeddings(pcm, embedding_model):
+    """Window embeddings of a recording loaded into memory in one piece"""
+    import torch
+    import numpy as np
+    from pyannote.core import Segment
+
+    # The canonical PCM is already mono at 16 kHz
+    logger.info(f"Loading audio file: {pcm.path}")
+    waveform = torch.from_numpy(pcm.read()).unsqueeze(0)
+    sample_rate = pcm.sample_rate
+    
+    # Perform voice activity detection
+    logger.info("Performing voice activity detection")
+    
+    # Frame-level energy VAD over the whole signal, then keep the 3 second
+    # windows (1.5 second hop) that are at least 20% speech
+    samples = waveform[0].numpy()
+    speech_starts, speech_ends = detect_speech(samples, sample_rate)
+    duration = waveform.shape[1] / sample_rate
+    window_starts, window_ends = speech_windows(speech_starts, speech_ends, duration)
+    segments = [
+        {'segment': Segment(float(start), float(end)), 'start': float(start), 'end': float(end)}
+        for start, end in zip(window_starts, window_ends)
+    ]
+    
+    logger.info(f"Found {len(segments)} speech segments")
+    
+    # If no segments found, create some default ones
+    if len(segments) == 0:
+        step = 3.0
+        for start in np.arange(0, duration, step):
+            end = start + step
+            if end > duration:
+                end = duration
+            segments.append({
+                'segment': Segment(start, end),
+                'start': start,
+                'end': end
+            })
+        logger.info(f"Created {len(segments)} default segments")
+    
+    # Extract embeddings from the waveform already in memory, in mini-batches
+    embeddings, kept = extract_embeddings(
+        embedding_model, waveform, sample_rate,
+        [(segment_info['start'], segment_info['end']) for segment_info in segments]
+    )
+    return embeddings, [segments[i] for i in kept]
+
 def process_with_pyannote(audio_path, hf_token, transcript):
     """Process audio file with Pyannote for diarization using direct approach without pipeline"""
     try:
         import os
         import torch
         import uuid
-        import numpy as np
-        import torchaudio
-        from pyannote.audio import Audio
-        from pyannote.core import Segment
-        from pyannote.audio.pipelines.speaker_verification import PretrainedSpeakerEmbedding
-        from sklearn.cluster import AgglomerativeClustering
         
         # Set HF_TOKEN for Pyannote to use
         os.environ['HF_TOKEN'] = hf_token
@@ -18,24 +193,9 @@ def process_with_pyannote(audio_path, hf_token, transcript):
         device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         logger.info(f"Using device for Pyannote: {device}")
         
-        # Load audio file
-        logger.info(f"Loading audio file: {audio_path}")
-        waveform, sample_rate = torchaudio.load(audio_path)
-        
-        # Convert to mono if stereo
-        if waveform.shape[0] > 1:
-            waveform = torch.mean(waveform, dim=0, keepdim=True)
-        
-        # Initialize audio processor
-        audio = Audio(sample_rate=sample_rate)
-        
-        # Create embedding model
+        # Get the embedding model, loaded once per process by the registry
         try:
-            logger.info("Loading embedding model")
-            embedding_model = PretrainedSpeakerEmbedding(
-                "speechbrain/spkrec-ecapa-voxceleb",
-                device=device
-            )
+            embedding_model = get_embedding_model(device=device)
         except Exception as e:
             logger.error(f"Error loading embedding model: {e}")
             raise ValueError(
@@ -45,85 +205,30 @@ def process_with_pyannote(audio_path, hf_token, transcript):
                 "3. Have entered the token correctly in the settings page"
             )
         
-        # Perform voice activity detection
-        logger.info("Performing voice activity detection")
-        
-        # Use a simple energy-based VAD as a fallback
-        energy = torch.norm(waveform, dim=0)
-        threshold = 0.05 * torch.max(energy)
-        speech_frames = energy > threshold
-        
-        # Create segments from contiguous speech frames
-        segments = []
-        duration = waveform.shape[1] / sample_rate
-        segment_length = 3.0  # seconds
-        
-        # Create overlapping segments
-        for start in torch.arange(0, duration - segment_length/2, segment_length/2):
-            end = start + segment_length
-            if end > duration:
-                end = duration
-            
-            start_frame = int(start * sample_rate)
-            end_frame = int(end * sample_rate)
-            
-            # Check if there's speech in this segment
-            segment_speech = speech_frames[start_frame:end_frame]
-            if segment_speech.numel() > 0 and torch.sum(segment_speech) > 0.2 * segment_speech.numel():
-                segments.append({
-                    'segment': Segment(float(start), float(end)),
-                    'start': float(start),
-                    'end': float(end)
-                })
-        
-        logger.info(f"Found {len(segments)} speech segments")
-        
-        # If no segments found, create some default ones
-        if len(segments) == 0:
-            step = 3.0
-            for start in np.arange(0, duration, step):
-                end = start + step
-                if end > duration:
-                    end = duration
-                segments.append({
-                    'segment': Segment(start, end),
-                    'start': start,
-                    'end': end
-                })
-            logger.info(f"Created {len(segments)} default segments")
-        
-        # Extract embeddings from segments
-        embeddings = []
-        valid_segments = []
-        
-        for segment_info in segments:
-            segment = segment_info['segment']
-            try:
-                segment_waveform = audio.crop(audio_path, segment)
-                embedding = embedding_model(segment_waveform)
-                embeddings.append(embedding)
-                valid_segments.append(segment_info)
-            except Exception as e:
-                logger.error(f"Error extracting embedding for segment {segment}: {e}")
-                # Skip problematic segments
+        # Read the shared 16 kHz mono PCM; long recordings are streamed block by block so memory stays flat
+        pcm = open_pcm(audio_path)
+        if pcm.duration >= settings.BATCHALIGN_STREAMING_MIN_SECONDS:
+            logger.info(f"Streaming {pcm.duration:.0f}s of audio from {pcm.path}")
+            embeddings, valid_segments = _streamed_embeddings(pcm, embedding_model)
+        else:
+            embeddings, valid_segments = _in_memory_embeddings(pcm, embedding_model)
         
-        if len(embeddings) == 0:
+        if len(valid_segments) == 0:
             raise ValueError("No valid speech segments found in the audio")
-            
-        # Stack embeddings for clustering
-        embeddings = np.vstack(embeddings)
-        
-        # Estimate number of speakers (use min of 2, max of 5)
-        num_speakers = min(max(2, int(len(valid_segments) / 15)), 5)
-        logger.info(f"Estimating {num_speakers} speakers")
         
-        # Cluster the embeddings
-        clustering = AgglomerativeClustering(
-            n_clusters=num_speakers,
-            affinity="cosine",
-            linkage="average"
-        )
-        labels = clustering.fit_predict(embeddings)
+        # Keep the embeddings so the speakers can be re-clustered without redoing all this
+        try:
+            save_window_embeddings(
+                audio_path, embeddings,
+                [segment_info['start'] for segment_info in valid_segments],
+                [segment_info['end'] for segment_info in valid_segments]
+            )
+        except Exception as e:
+            logger.warning(f"Could not cache window embeddings for {audio_path}: {e}")
+            
+        # Cluster the embeddings; the speaker count is estimated from the data
+        labels = cluster_speakers(embeddings)
+        logger.info(f"Clustered {len(valid_segments)} windows into {len(set(labels.tolist()))} speakers")
         
         # Create diarization data
         diarization_data = []
@@ -157,39 +262,19 @@ def process_with_pyannote(audio_path, hf_token, transcript):
         # Find missing segments (diarization segments with no matching ASR text)
         missing_segments = []
         
-        for dia_segment in diarization_data:
-            # Check if this segment has a corresponding ASR segment
-            start_time = dia_segment['start']
-            end_time = dia_segment['end']
-            has_match = False
-            
-            # Find if any ASR segment overlaps significantly with this diarization segment
-            for asr_segment in asr_segments:
-                asr_start = asr_segment['start']
-                asr_end = asr_segment['end']
-                
-                # Calculate overlap
-                overlap_start = max(start_time, asr_start)
-                overlap_end = min(end_time, asr_end)
-                overlap = max(0, overlap_end - overlap_start)
-                
-                # Segment duration
-                segment_duration = end_time - start_time
-                
-                # If significant overlap (more than 50%), consider it a match
-                if overlap > 0 and (overlap / segment_duration) > 0.5:
-                    has_match = True
-                    # Copy ASR text to diarization segment
-                    if 'text' in asr_segment and asr_segment['text'].strip():
-                        dia_segment['text'] = asr_segment['text']
-                    break
-            
-            # If no match, add to missing segments
-            if not has_match:
+        # Match every diarization segment to an ASR segment overlapping more than 50% of it
+        matches = match_overlapping(diarization_data, asr_segments, min_overlap_ratio=0.5)
+        
+        for dia_segment, match in zip(diarization_data, matches):
+            if match is not None:
+                # Copy ASR text to diarization segment
+                dia_segment['text'] = asr_segments[match]['text']
+            else:
+                # If no match, add to missing segments
                 missing_segments.append({
                     'id': str(uuid.uuid4()),
-                    'start': start_time,
-                    'end': end_time,
+                    'start': dia_segment['start'],
+                    'end': dia_segment['end'],
                     'speaker': dia_segment['speaker'],
                     'text': ''  # Empty text that can be filled by user
                 })
@@ -134,6 +134,52 @@ mimetypes.add_type("audio/mpeg", ".mp3", True)
 mimetypes.add_type("audio/wav", ".wav", True)
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Background transcription workers (started with `python manage.py run_workers`)
+BATCHALIGN_WORKERS = int(os.environ.get('BATCHALIGN_WORKERS', 2))
+BATCHALIGN_JOB_POLL_INTERVAL = float(os.environ.get('BATCHALIGN_JOB_POLL_INTERVAL', 2.0))
+# Concurrent ASR jobs per worker process, and the cap on simultaneous submissions to one ASR host
+BATCHALIGN_ASR_CONCURRENCY = int(os.environ.get('BATCHALIGN_ASR_CONCURRENCY', 4))
+BATCHALIGN_ASR_MAX_PER_HOST = int(os.environ.get('BATCHALIGN_ASR_MAX_PER_HOST', 8))
+
+# Models loaded at process start by `run_workers --warmup` or BATCHALIGN_WARMUP=1 under WSGI
+BATCHALIGN_WARMUP_MODELS = [
+    name for name in os.environ.get('BATCHALIGN_WARMUP_MODELS', 'speechbrain/spkrec-ecapa-voxceleb').split(',') if name
+]
+# batchalign pipelines to preload, as pipeline:lang[:engine], e.g. "fa:eng:wav2vec_fa"
+BATCHALIGN_WARMUP_PIPELINES = [
+    spec for spec in os.environ.get('BATCHALIGN_WARMUP_PIPELINES', '').split(',') if spec
+]
+# Memory budget in bytes for loaded models and pipelines; least recently used ones are dropped past it (0 = no limit)
+BATCHALIGN_MODEL_MEMORY_BUDGET = int(os.environ.get('BATCHALIGN_MODEL_MEMORY_BUDGET', 0))
+
+# Diarization windows embedded per forward pass
+BATCHALIGN_EMBEDDING_BATCH_SIZE = int(os.environ.get('BATCHALIGN_EMBEDDING_BATCH_SIZE', 32))
+# Recordings longer than this (seconds) are diarized block by block with bounded memory; 0 streams everything
+BATCHALIGN_STREAMING_MIN_SECONDS = float(os.environ.get('BATCHALIGN_STREAMING_MIN_SECONDS', 1800))
+BATCHALIGN_STREAMING_BLOCK_SECONDS = float(os.environ.get('BATCHALIGN_STREAMING_BLOCK_SECONDS', 60))
+
+# Speaker clustering: speaker-count bounds for estimation, and the window count past which
+# only a sample is clustered and the remaining windows are assigned to its centroids
+BATCHALIGN_MIN_SPEAKERS = int(os.environ.get('BATCHALIGN_MIN_SPEAKERS', 1))
+BATCHALIGN_MAX_SPEAKERS = int(os.environ.get('BATCHALIGN_MAX_SPEAKERS', 8))
+BATCHALIGN_CLUSTER_FULL_LIMIT = int(os.environ.get('BATCHALIGN_CLUSTER_FULL_LIMIT', 2000))
+BATCHALIGN_CLUSTER_SAMPLE_SIZE = int(os.environ.get('BATCHALIGN_CLUSTER_SAMPLE_SIZE', 1500))
+
+# Parallel forced alignment: pool processes (0 = one per BATCHALIGN_FA_THREADS_PER_PROCESS cores, 1 = off),
+# torch threads in each, and the longest stretch of audio aligned as one chunk (seconds)
+BATCHALIGN_FA_PROCESSES = int(os.environ.get('BATCHALIGN_FA_PROCESSES', 0))
+BATCHALIGN_FA_THREADS_PER_PROCESS = int(os.environ.get('BATCHALIGN_FA_THREADS_PER_PROCESS', 2))
+BATCHALIGN_FA_CHUNK_SECONDS = float(os.environ.get('BATCHALIGN_FA_CHUNK_SECONDS', 300))
+# Incremental re-alignment: audio margin (seconds) around each edited run, and the share of
+# changed utterances above which a full alignment is run instead
+BATCHALIGN_FA_INCREMENTAL_MARGIN = float(os.environ.get('BATCHALIGN_FA_INCREMENTAL_MARGIN', 0.5))
+BATCHALIGN_FA_INCREMENTAL_MAX_CHANGED = float(os.environ.get('BATCHALIGN_FA_INCREMENTAL_MAX_CHANGED', 0.5))
+
+# Durable result caches, kept outside MEDIA_ROOT so they survive clearing uploads
+BATCHALIGN_CACHE_DIR = os.environ.get('BATCHALIGN_CACHE_DIR', os.path.join(BASE_DIR, 'cache'))
+BATCHALIGN_ASR_CACHE_MAX_BYTES = int(os.environ.get('BATCHALIGN_ASR_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+BATCHALIGN_ALIGNMENT_CACHE_MAX_BYTES = int(os.environ.get('BATCHALIGN_ALIGNMENT_CACHE_MAX_BYTES', 512 * 1024 ** 2))
+
 # Logging Configuration
 LOGGING = {
     'version': 1,
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'batchalign_app.settings')
 
 application = get_wsgi_application()
+
+# Optionally load the diarization models before the first request is served
+if os.environ.get('BATCHALIGN_WARMUP', '').lower() in ('1', 'true', 'yes'):
+    from batch_processor.model_registry import warm_up
+    warm_up()
@@ -3,7 +3,7 @@ from .models import ForcedAlignmentTask
 
 @admin.register(ForcedAlignmentTask)
 class ForcedAlignmentTaskAdmin(admin.ModelAdmin):
-    list_display = ('original_transcript', 'status', 'engine_used', 'created_at', 'updated_at')
-    list_filter = ('status', 'engine_used')
+    list_display = ('original_transcript', 'status', 'stage', 'engine_used', 'worker', 'created_at', 'updated_at')
+    list_filter = ('status', 'stage', 'engine_used')
     search_fields = ('original_transcript__audio__title', 'error_message')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'started_at', 'finished_at')
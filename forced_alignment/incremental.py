@@ -0,0 +1,128 @@
+"""
+Incremental re-alignment against a previous completed task.
+
+The utterance texts of the new document are diffed against those recorded
+by the baseline task. Unchanged utterances keep their word timings; each run
+of edited or inserted utterances is re-aligned on its own, inside the audio
+between the unchanged utterances around it (plus a margin), and the new
+words are spliced into the previous word_timestamps.
+
+The ASR word timings of a transcript serve as a baseline in the same way:
+utterances whose ASR timings are consistent are used as they are, and only
+the others are aligned, each within the gap its timed neighbours leave.
+"""
+
+import difflib
+import logging
+
+from django.conf import settings
+
+from batch_processor.asr_timings import prior_key, timings_consistent
+
+logger = logging.getLogger(__name__)
+
+def normalize_utterance(text):
+    return ' '.join((text or '').split())
+
+def utterance_text(utterance):
+    """Plain text of a batchalign Utterance, from its tokens"""
+    return normalize_utterance(' '.join(token.text for token in getattr(utterance, 'tokens', None) or [] if token.text))
+
+def diff_utterances(old_texts, new_texts):
+    """
+    Returns (reused, changed): reused maps a new utterance index to the old
+    index it is identical to, changed lists new indices that need aligning
+    """
+    reused = {}
+    changed = []
+    matcher = difflib.SequenceMatcher(a=old_texts, b=new_texts, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            reused.update({j1 + k: i1 + k for k in range(j2 - j1)})
+        elif tag in ('replace', 'insert'):
+            changed.extend(range(j1, j2))
+    return reused, changed
+
+def contiguous_runs(indices):
+    """[1, 2, 3, 7, 8] -> [[1, 2, 3], [7, 8]]"""
+    runs = []
+    for index in sorted(indices):
+        if runs and runs[-1][-1] == index - 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return runs
+
+def word_bounds_by_utterance(word_timestamps):
+    """utterance_id -> (first start, last end) in seconds, from stored word timestamps"""
+    bounds = {}
+    for word in word_timestamps or []:
+        start, end = bounds.get(word['utterance_id'], (word['start'], word['end']))
+        bounds[word['utterance_id']] = (min(start, word['start']), max(end, word['end']))
+    return bounds
+
+def run_window(run, reused, old_bounds, num_new, margin, duration=None):
+    """
+    Audio window (start, end) in seconds for a run of changed utterances: from the
+    end of the nearest reused utterance before it to the start of the nearest after it
+    """
+    start = 0.0
+    for index in range(run[0] - 1, -1, -1):
+        bound = old_bounds.get(reused.get(index, -1) + 1)  # utterance_id is 1-based
+        if bound:
+            start = bound[1]
+            break
+    end = duration
+    for index in range(run[-1] + 1, num_new):
+        bound = old_bounds.get(reused.get(index, -1) + 1)
+        if bound:
+            end = bound[0]
+            break
+    start = max(0.0, start - margin)
+    if end is not None:
+        end = end + margin if duration is None else min(duration, end + margin)
+    return start, end
+
+def splice(old_words, reused, new_words):
+    """Previous words of reused utterances (renumbered) plus the re-aligned words, in time order"""
+    old_to_new = {old + 1: new + 1 for new, old in reused.items()}
+    words = [dict(word, utterance_id=old_to_new[word['utterance_id']])
+             for word in old_words or [] if word['utterance_id'] in old_to_new]
+    words.extend(new_words)
+    words.sort(key=lambda word: word['start'])
+    return words
+
+def plan_incremental(baseline, new_texts):
+    """
+    (reused, runs) for re-aligning against `baseline`, or None when a full
+    alignment is the better choice (no usable baseline or too much changed)
+    """
+    if baseline is None or baseline.status != 'COMPLETED' or not baseline.utterance_texts:
+        return None
+    reused, changed = diff_utterances(baseline.utterance_texts, new_texts)
+    if new_texts and len(changed) > settings.BATCHALIGN_FA_INCREMENTAL_MAX_CHANGED * len(new_texts):
+        logger.info(f"{len(changed)} of {len(new_texts)} utterances changed, running a full alignment instead")
+        return None
+    return reused, contiguous_runs(changed)
+
+def plan_from_asr(asr_words, new_texts):
+    """
+    (reused, runs, words) for aligning against a transcript's ASR word timings,
+    where `words` are the ASR timings as word_timestamps, or None when there is
+    no usable prior (no timings, no text, or too little of the text matches them)
+    """
+    if not asr_words or not new_texts:
+        return None
+    reused, changed = diff_utterances([prior_key(utterance['text']) for utterance in asr_words],
+                                      [prior_key(text) for text in new_texts])
+    # Text matches but the times don't hold together: align it, still within its neighbours
+    for new, old in list(reused.items()):
+        if not timings_consistent(asr_words[old]):
+            del reused[new]
+            changed.append(new)
+    if new_texts and len(changed) > settings.BATCHALIGN_FA_INCREMENTAL_MAX_CHANGED * len(new_texts):
+        logger.info(f"Only {len(reused)} of {len(new_texts)} utterances match the ASR timings, running a full alignment instead")
+        return None
+    words = [{'word': word, 'start': start, 'end': end, 'utterance_id': index + 1}
+             for index, utterance in enumerate(asr_words) for word, start, end in utterance['words']]
+    return reused, contiguous_runs(changed), words
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forced_alignment', '0004_alter_forcedalignmenttask_title'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forcedalignmenttask',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='forcedalignmenttask',
+            name='stage',
+            field=models.CharField(choices=[('QUEUED', 'Queued'), ('PREPARING', 'Preparing audio'), ('READING_TRANSCRIPT', 'Reading transcript'), ('LOADING_ENGINE', 'Loading alignment engine'), ('ALIGNING', 'Aligning'), ('SAVING', 'Saving results'), ('DONE', 'Done')], default='QUEUED', max_length=30),
+        ),
+        migrations.AddField(
+            model_name='forcedalignmenttask',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='forcedalignmenttask',
+            name='utterances_aligned',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='forcedalignmenttask',
+            name='utterances_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='forcedalignmenttask',
+            name='worker',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
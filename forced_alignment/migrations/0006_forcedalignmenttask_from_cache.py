@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forced_alignment', '0005_alignment_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forcedalignmenttask',
+            name='from_cache',
+            field=models.BooleanField(default=False),
+        ),
+    ]
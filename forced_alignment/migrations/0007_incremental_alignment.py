@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forced_alignment', '0006_forcedalignmenttask_from_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forcedalignmenttask',
+            name='baseline_task',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='incremental_tasks', to='forced_alignment.forcedalignmenttask'),
+        ),
+        migrations.AddField(
+            model_name='forcedalignmenttask',
+            name='utterance_texts',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,83 @@
+import struct
+
+import numpy as np
+from django.db import migrations, models
+
+# A frozen copy of the b'WTS1' format of forced_alignment.timings.WordTimings as of this
+# migration, so later changes to that module cannot change what the migration reads or writes
+_HEADER = struct.Struct('<4sII')
+_DTYPES = ('<f4', '<f4', '<i4', '<i4')  # starts, ends, utterance_ids, word_index
+
+
+def pack(words):
+    """WTS1 blob of a list of {"word", "start", "end", "utterance_id"} dicts, sorted by start"""
+    words = sorted(words or [], key=lambda word: word['start'])
+    vocabulary = []
+    interned = {}
+    for word in words:
+        if word['word'] not in interned:
+            interned[word['word']] = len(vocabulary)
+            vocabulary.append(word['word'])
+    arrays = (
+        [word['start'] for word in words],
+        [word['end'] for word in words],
+        [word.get('utterance_id') or 0 for word in words],
+        [interned[word['word']] for word in words],
+    )
+    parts = [_HEADER.pack(b'WTS1', len(words), len(vocabulary))]
+    parts.extend(np.asarray(values, dtype=dtype).tobytes() for values, dtype in zip(arrays, _DTYPES))
+    parts.append('\0'.join(vocabulary).encode('utf-8'))
+    return b''.join(parts)
+
+
+def unpack(data):
+    """Word dicts of a WTS1 blob, times rounded to milliseconds"""
+    data = bytes(data)
+    magic, count, vocabulary_size = _HEADER.unpack_from(data)
+    if magic != b'WTS1':
+        raise ValueError("Not a word timings blob")
+    offset = _HEADER.size
+    arrays = []
+    for dtype in _DTYPES:
+        arrays.append(np.frombuffer(data, dtype=dtype, count=count, offset=offset).tolist())
+        offset += 4 * count
+    vocabulary = data[offset:].decode('utf-8').split('\0') if vocabulary_size else []
+    starts, ends, utterance_ids, word_index = arrays
+    return [
+        {'word': vocabulary[index], 'start': round(start, 3), 'end': round(end, 3), 'utterance_id': utterance_id}
+        for index, start, end, utterance_id in zip(word_index, starts, ends, utterance_ids)
+    ]
+
+
+def pack_word_timestamps(apps, schema_editor):
+    ForcedAlignmentTask = apps.get_model('forced_alignment', 'ForcedAlignmentTask')
+    for task in ForcedAlignmentTask.objects.exclude(word_timestamps=None).iterator():
+        task.word_timings = pack(task.word_timestamps)
+        task.save(update_fields=['word_timings'])
+
+
+def unpack_word_timings(apps, schema_editor):
+    ForcedAlignmentTask = apps.get_model('forced_alignment', 'ForcedAlignmentTask')
+    for task in ForcedAlignmentTask.objects.exclude(word_timings=None).iterator():
+        task.word_timestamps = unpack(task.word_timings)
+        task.save(update_fields=['word_timestamps'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forced_alignment', '0007_incremental_alignment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forcedalignmenttask',
+            name='word_timings',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(pack_word_timestamps, unpack_word_timings),
+        migrations.RemoveField(
+            model_name='forcedalignmenttask',
+            name='word_timestamps',
+        ),
+    ]
@@ -8,6 +8,15 @@ class ForcedAlignmentTask(models.Model):
         ('COMPLETED', 'Completed'),
         ('FAILED', 'Failed'),
     ]
+    STAGE_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('PREPARING', 'Preparing audio'),
+        ('READING_TRANSCRIPT', 'Reading transcript'),
+        ('LOADING_ENGINE', 'Loading alignment engine'),
+        ('ALIGNING', 'Aligning'),
+        ('SAVING', 'Saving results'),
+        ('DONE', 'Done'),
+    ]
     ENGINE_CHOICES = [
         ('WHISPER', 'WhisperFA'),
         ('WAV2VEC', 'Wave2VecFA'),
@@ -26,8 +35,8 @@ class ForcedAlignmentTask(models.Model):
     # Title for the alignment task
     title = models.CharField(max_length=255, default="Untitled Alignment")
     
-    # Stores the word-level timestamps
-    word_timestamps = models.JSONField(null=True, blank=True)
+    # Stores the word-level timestamps as compact parallel arrays (see timings.py)
+    word_timings = models.BinaryField(null=True, blank=True)
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     engine_used = models.CharField(max_length=20, choices=ENGINE_CHOICES, default='AUTO')
@@ -35,6 +44,22 @@ class ForcedAlignmentTask(models.Model):
     # To store any error messages if the alignment fails
     error_message = models.TextField(null=True, blank=True)
     
+    # Progress reported by the worker running the task
+    stage = models.CharField(max_length=30, choices=STAGE_CHOICES, default='QUEUED')
+    utterances_total = models.PositiveIntegerField(default=0)
+    utterances_aligned = models.PositiveIntegerField(default=0)
+    worker = models.CharField(max_length=255, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Whether word_timestamps came from the alignment cache rather than a model run
+    from_cache = models.BooleanField(default=False)
+    
+    # Incremental re-alignment: the completed task whose timings are reused for unchanged utterances,
+    # and the utterance texts of this task, in order, for later tasks to diff against
+    baseline_task = models.ForeignKey('self', on_delete=models.SET_NULL, related_name='incremental_tasks',
+                                      blank=True, null=True)
+    utterance_texts = models.JSONField(null=True, blank=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -49,6 +74,36 @@ class ForcedAlignmentTask(models.Model):
         elif self.original_transcript:
             return self.original_transcript.audio.audio_file.url
         return None
+    
+    def timings(self):
+        """The stored WordTimings, or None when the task has no alignment yet"""
+        from .timings import WordTimings
+        if not self.word_timings:
+            return None
+        if getattr(self, '_timings_source', None) is not self.word_timings:
+            self._timings = WordTimings.from_bytes(self.word_timings)
+            self._timings_source = self.word_timings
+        return self._timings
+    
+    @property
+    def word_timestamps(self):
+        """All words as {"word", "start", "end", "utterance_id"} dicts; use timings() for ranges"""
+        timings = self.timings()
+        return timings.to_dicts() if timings is not None else None
+    
+    @word_timestamps.setter
+    def word_timestamps(self, words):
+        from .timings import WordTimings
+        self.word_timings = WordTimings.from_dicts(words).to_bytes() if words is not None else None
+    
+    @property
+    def elapsed_seconds(self):
+        """Seconds since a worker picked the task up, up to when it finished"""
+        if not self.started_at:
+            return None
+        from django.utils import timezone
+        end = self.finished_at or timezone.now()
+        return round((end - self.started_at).total_seconds(), 1)
 
     class Meta:
         ordering = ['-created_at']
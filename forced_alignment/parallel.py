@@ -0,0 +1,159 @@
+"""
+Parallel forced alignment for long recordings on CPU-only machines.
+
+A batchalign Document is split at utterance boundaries into chunks covering
+at most BATCHALIGN_FA_CHUNK_SECONDS of audio. Each chunk is a sub-document
+with the same media, aligned in a long-lived process pool whose workers keep
+their pipeline warm and use a fixed number of torch threads, so the cores
+are shared instead of oversubscribed. Utterance times are absolute, so the
+aligned utterances are put back in their original order unchanged.
+
+The pool is started from run_workers processes, which are therefore not
+daemonic (daemonic processes may not have children) and stop the pool
+themselves when terminated.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def utterance_bounds(utterance):
+    """(start_ms, end_ms) of an utterance, or None when it has no timing yet"""
+    alignment = getattr(utterance, 'alignment', None)
+    if alignment and alignment[0] is not None and alignment[1] is not None:
+        return alignment[0], alignment[1]
+    start, end = getattr(utterance, 'start_ms', None), getattr(utterance, 'end_ms', None)
+    if start is not None and end is not None:
+        return start, end
+    return None
+
+def plan_chunks(bounds, max_seconds):
+    """
+    Group consecutive utterances into chunks spanning at most `max_seconds`.
+    `bounds` holds (start_ms, end_ms) or None per utterance; untimed utterances
+    stay with the chunk before them. Returns lists of utterance indices.
+    """
+    max_ms = max_seconds * 1000
+    chunks = []
+    current = []
+    chunk_start = None
+    for index, bound in enumerate(bounds):
+        if bound is not None:
+            if chunk_start is not None and bound[1] - chunk_start > max_ms:
+                chunks.append(current)
+                current = []
+                chunk_start = None
+            if chunk_start is None:
+                chunk_start = bound[0]
+        current.append(index)
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _init_worker(torch_threads):
+    """Pool initializer: cap the intra-op threads of this worker so workers don't oversubscribe the cores"""
+    os.environ['OMP_NUM_THREADS'] = str(torch_threads)
+    os.environ['MKL_NUM_THREADS'] = str(torch_threads)
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+
+def _align_chunk(document, pipeline_str, lang, overrides):
+    """Run in a pool worker: align one sub-document with this worker's cached pipeline"""
+    from batch_processor.model_registry import get_pipeline
+    return get_pipeline(pipeline_str, lang, **overrides).process(document)
+
+def fa_processes():
+    return settings.BATCHALIGN_FA_PROCESSES or max(1, (os.cpu_count() or 1) // settings.BATCHALIGN_FA_THREADS_PER_PROCESS)
+
+def get_pool():
+    """The process-wide alignment pool, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            import multiprocessing
+            import multiprocessing.util
+            processes = fa_processes()
+            logger.info(f"Starting alignment pool with {processes} processes x "
+                        f"{settings.BATCHALIGN_FA_THREADS_PER_PROCESS} torch threads")
+            _pool = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(settings.BATCHALIGN_FA_THREADS_PER_PROCESS,)
+            )
+            # A multiprocessing child joins its children before concurrent.futures
+            # stops the pool, so stop it first or the exit never completes
+            multiprocessing.util.Finalize(None, shutdown_pool, exitpriority=10)
+        return _pool
+
+def pool_ready(timeout=None):
+    """Start the pool now and wait until one of its processes answers"""
+    return get_pool().submit(os.getpid).result(timeout)
+
+def shutdown_pool():
+    """Stop the pool's processes straight away, for a worker that is being terminated"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        for process in list((getattr(pool, '_processes', None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def parallel_chunks(document):
+    """
+    Utterance chunks for parallel alignment, or None when the document should
+    be aligned in one call (parallelism disabled, nothing timed, or a single chunk)
+    """
+    from batchalign.document import Utterance
+
+    if fa_processes() <= 1:
+        return None
+    utterances = [item for item in document.content if isinstance(item, Utterance)]
+    bounds = [utterance_bounds(utterance) for utterance in utterances]
+    if not any(bounds):
+        return None
+    chunks = plan_chunks(bounds, settings.BATCHALIGN_FA_CHUNK_SECONDS)
+    return chunks if len(chunks) > 1 else None
+
+def align_in_chunks(document, chunks, pipeline_str, lang, overrides=None, progress=None):
+    """Align the utterance chunks of `document` in the pool and merge them back in order"""
+    from batchalign.document import Utterance
+
+    overrides = overrides or {}
+    positions = [i for i, item in enumerate(document.content) if isinstance(item, Utterance)]
+    utterances = [document.content[i] for i in positions]
+
+    pool = get_pool()
+    futures = {}
+    for chunk in chunks:
+        sub_document = document.model_copy(update={'content': [utterances[i] for i in chunk]})
+        futures[pool.submit(_align_chunk, sub_document, pipeline_str, lang, overrides)] = chunk
+    logger.info(f"Aligning {len(utterances)} utterances in {len(chunks)} chunks")
+
+    content = list(document.content)
+    aligned_count = 0
+    for future in as_completed(futures):
+        chunk = futures[future]
+        aligned_utterances = [item for item in future.result().content if isinstance(item, Utterance)]
+        if len(aligned_utterances) != len(chunk):
+            raise ValueError(f"Chunk came back with {len(aligned_utterances)} utterances instead of {len(chunk)}")
+        for index, utterance in zip(chunk, aligned_utterances):
+            content[positions[index]] = utterance
+        aligned_count += len(chunk)
+        if progress is not None:
+            progress.utterances(aligned_count)
+
+    return document.model_copy(update={'content': content})
@@ -0,0 +1,86 @@
+"""
+Forced-alignment tasks run by the local worker pool.
+
+`start_alignment` only stores a PENDING task; the workers started by
+`python manage.py run_workers` claim it from the database (no external
+broker) and report the current stage and utterance progress on the row,
+which `check_alignment_status` returns.
+"""
+
+import logging
+import time
+
+from django.utils import timezone
+
+from .models import ForcedAlignmentTask
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between progress writes while aligning
+PROGRESS_SAVE_INTERVAL = 1.0
+
+def claim_next_task(worker):
+    """Atomically claim the oldest pending task, or return None"""
+    while True:
+        task = ForcedAlignmentTask.objects.filter(status='PENDING').order_by('created_at', 'id').first()
+        if task is None:
+            return None
+        claimed = ForcedAlignmentTask.objects.filter(id=task.id, status='PENDING').update(
+            status='PROCESSING',
+            stage='PREPARING',
+            worker=worker,
+            started_at=timezone.now(),
+            finished_at=None
+        )
+        if claimed:
+            task.refresh_from_db()
+            return task
+        # Another worker took it first, try the next one
+
+def requeue_stale_tasks():
+    """Put tasks left PROCESSING by a crashed worker back in the queue"""
+    count = ForcedAlignmentTask.objects.filter(status='PROCESSING').update(
+        status='PENDING', stage='QUEUED', worker='', started_at=None
+    )
+    if count:
+        logger.warning(f"Requeued {count} stale alignment tasks")
+    return count
+
+def run_task(task):
+    """Run a claimed task; process_alignment_task records the outcome on the row"""
+    # Imported here so the worker can load without batchalign until a task arrives
+    from .views import process_alignment_task
+    return process_alignment_task(task.id)
+
+class ProgressReporter:
+    """Writes stage and utterance progress to a task, throttling writes during alignment"""
+
+    def __init__(self, task):
+        self.task = task
+        self._last_save = 0.0
+
+    def _save(self, *fields):
+        ForcedAlignmentTask.objects.filter(id=self.task.id).update(
+            updated_at=timezone.now(), **{field: getattr(self.task, field) for field in fields}
+        )
+        self._last_save = time.monotonic()
+
+    def stage(self, stage):
+        self.task.stage = stage
+        self._save('stage')
+
+    def utterances(self, aligned, total=None):
+        if total is not None:
+            self.task.utterances_total = total
+        aligned = min(aligned, self.task.utterances_total)
+        if aligned == self.task.utterances_aligned and total is None:
+            return
+        self.task.utterances_aligned = aligned
+        if total is not None or aligned == self.task.utterances_total or \
+                time.monotonic() - self._last_save >= PROGRESS_SAVE_INTERVAL:
+            self._save('utterances_aligned', 'utterances_total')
+
+    def callback(self, completed, total, *args):
+        """batchalign progress callback: engines count utterance groups, scaled here to utterances"""
+        if total:
+            self.utterances(round(self.task.utterances_total * completed / total))
@@ -1,3 +1,360 @@
+import copy
+import types
+
+from django.conf import settings
 from django.test import TestCase
 
-# Create your tests here.
+from batch_processor.models import AudioFile, Transcript
+from batch_processor.tests import use_temp_media
+from .models import ForcedAlignmentTask
+
+
+def fake_batchalign_document():
+    """
+    Stand-in for batchalign.document with the behaviour the alignment code relies
+    on: model_copy writes updates to the instance as pydantic does (so the
+    read-only `alignment` property over `time` cannot be set through it)
+    """
+    class Model:
+        def __init__(self, **fields):
+            self.__dict__.update(fields)
+
+        def model_copy(self, update=None):
+            copied = copy.deepcopy(self)
+            copied.__dict__.update(update or {})
+            return copied
+
+    class Token(Model):
+        pass
+
+    class Utterance(Model):
+        @property
+        def alignment(self):
+            return self.time
+
+    class Document(Model):
+        @classmethod
+        def new(cls, text=None, media_path=None):
+            content = [Utterance(tokens=[Token(text=word, start_ms=None, end_ms=None) for word in line.split()],
+                                 time=None) for line in text or []]
+            return cls(content=content, media=types.SimpleNamespace(url=media_path))
+
+    return types.SimpleNamespace(Document=Document, Task=object, Utterance=Utterance, Token=Token)
+
+
+class WindowPipeline:
+    """Aligns, like the batchalign FA engines, only the utterances that have a time window"""
+
+    def process(self, document):
+        for utterance in document.content:
+            if utterance.time is None:
+                continue
+            start, end = utterance.time
+            step = (end - start) // len(utterance.tokens)
+            for i, token in enumerate(utterance.tokens):
+                token.start_ms, token.end_ms = start + i * step, start + (i + 1) * step
+        return document
+
+
+
+class AlignmentQueueTest(TestCase):
+    def setUp(self):
+        audio = AudioFile.objects.create(title="talk.mp3")
+        self.transcript = Transcript.objects.create(audio=audio, chat_content="@Begin\n@End")
+
+    def test_start_alignment_only_queues_the_task(self):
+        response = self.client.post(
+            "/forced-alignment/api/start/",
+            data={"transcript_id": self.transcript.id, "engine": "WAV2VEC"},
+            content_type="application/json"
+        )
+        task = ForcedAlignmentTask.objects.get(id=response.json()["task_id"])
+        self.assertEqual(task.status, "PENDING")
+        self.assertEqual(task.stage, "QUEUED")
+
+    def test_claim_and_progress_status(self):
+        from .tasks import claim_next_task, ProgressReporter
+        task = ForcedAlignmentTask.objects.create(original_transcript=self.transcript)
+
+        claimed = claim_next_task("worker-a")
+        self.assertEqual(claimed.id, task.id)
+        self.assertIsNone(claim_next_task("worker-b"))
+
+        progress = ProgressReporter(claimed)
+        progress.stage("ALIGNING")
+        progress.utterances(0, 10)
+        progress.callback(2, 4)
+
+        data = self.client.get(f"/forced-alignment/api/status/{task.id}/").json()
+        self.assertEqual(data["status"], "PROCESSING")
+        self.assertEqual(data["stage"], "ALIGNING")
+        self.assertEqual(data["utterances_total"], 10)
+        self.assertIsNotNone(data["elapsed_seconds"])
+
+
+class ChunkPlanTest(TestCase):
+    def test_chunks_split_at_utterance_boundaries(self):
+        from .parallel import plan_chunks
+        bounds = [(0, 4000), None, (4000, 9000), (9000, 12000), (12000, 30000), (30000, 31000)]
+        self.assertEqual(plan_chunks(bounds, max_seconds=10), [[0, 1, 2], [3], [4], [5]])
+        self.assertEqual(plan_chunks(bounds, max_seconds=60), [[0, 1, 2, 3, 4, 5]])
+
+
+class IncrementalPlanTest(TestCase):
+    def test_only_edited_utterances_are_realigned(self):
+        from .incremental import diff_utterances, contiguous_runs, word_bounds_by_utterance, run_window, splice
+        old_texts = ["hello there", "how are you", "fine thanks", "bye"]
+        new_texts = ["hello there", "how are you doing", "fine thanks", "see you", "bye"]
+        old_words = [
+            {"word": "hello", "start": 0.0, "end": 0.5, "utterance_id": 1},
+            {"word": "how", "start": 1.0, "end": 1.2, "utterance_id": 2},
+            {"word": "fine", "start": 2.0, "end": 2.4, "utterance_id": 3},
+            {"word": "bye", "start": 4.0, "end": 4.3, "utterance_id": 4},
+        ]
+
+        reused, changed = diff_utterances(old_texts, new_texts)
+        self.assertEqual(reused, {0: 0, 2: 2, 4: 3})
+        self.assertEqual(contiguous_runs(changed), [[1], [3]])
+
+        bounds = word_bounds_by_utterance(old_words)
+        self.assertEqual(run_window([3], reused, bounds, len(new_texts), margin=0.25, duration=10.0), (2.15, 4.25))
+
+        new_words = [{"word": "see", "start": 3.0, "end": 3.2, "utterance_id": 4}]
+        spliced = splice(old_words, reused, new_words)
+        self.assertEqual([(w["word"], w["utterance_id"]) for w in spliced],
+                         [("hello", 1), ("fine", 3), ("see", 4), ("bye", 5)])
+
+    def test_asr_timings_seed_the_alignment(self):
+        from batch_processor.asr_timings import asr_word_timings
+        from .incremental import plan_from_asr
+        document = {"content": [
+            {"name": "Comment", "content": "a header"},
+            {"content": [{"text": "Hello", "time": [0, 400]}, {"text": "there", "time": [400, 800]},
+                         {"text": ".", "time": None}]},
+            {"content": [{"text": "how", "time": [1500, 1400]}, {"text": "are", "time": [1600, 1800]}]},
+            {"content": [{"text": "bye", "time": [3000, 3300]}]},
+        ]}
+        asr_words = asr_word_timings(document)
+        self.assertEqual([u["text"] for u in asr_words], ["Hello there", "how are", "bye"])
+        self.assertEqual(asr_words[0]["words"][1], ["there", 0.4, 0.8])
+
+        # "how are" has a word ending before it starts, so it is aligned rather than reused
+        reused, runs, words = plan_from_asr(asr_words, ["hello there .", "how are", "bye"])
+        self.assertEqual(reused, {0: 0, 2: 2})
+        self.assertEqual(runs, [[1]])
+        self.assertEqual(words[-1], {"word": "bye", "start": 3.0, "end": 3.3, "utterance_id": 3})
+        self.assertIsNone(plan_from_asr(asr_words, ["something", "else", "entirely"]))
+
+
+    def realign(self, texts, baseline_words, reused, runs):
+        import sys
+        from unittest import mock
+        from .views import realign_changed_utterances
+        module = fake_batchalign_document()
+        document = module.Document.new(text=texts, media_path="/nonexistent/talk.wav")
+        with mock.patch.dict(sys.modules, {"batchalign.document": module}):
+            return realign_changed_utterances(WindowPipeline(), document, document.content, baseline_words,
+                                              reused, runs, document.media.url, mock.Mock())
+
+    def test_edited_utterances_are_aligned_within_their_window(self):
+        baseline_words = [
+            {"word": "hello", "start": 0.0, "end": 0.5, "utterance_id": 1},
+            {"word": "bye", "start": 4.0, "end": 4.3, "utterance_id": 2},
+        ]
+        words = self.realign(["hello", "how are you", "bye"], baseline_words, {0: 0, 2: 1}, [[1]])
+        edited = [word for word in words if word["utterance_id"] == 2]
+        self.assertEqual([word["word"] for word in edited], ["how", "are", "you"])
+        # Between the end of "hello" and the start of "bye", give or take the margin
+        margin = settings.BATCHALIGN_FA_INCREMENTAL_MARGIN
+        self.assertTrue(all(0.5 - margin <= word["start"] < word["end"] <= 4.0 + margin for word in edited))
+        self.assertEqual([word["word"] for word in words], ["hello", "how", "are", "you", "bye"])
+
+
+    def test_every_utterance_gets_words_from_the_asr_prior(self):
+        from .incremental import plan_from_asr
+        asr_words = [
+            {"text": "hello there", "start": 0.0, "end": 0.8, "words": [["hello", 0.0, 0.4], ["there", 0.4, 0.8]]},
+            {"text": "how are", "start": 1.4, "end": 1.8, "words": [["how", 1.5, 1.4], ["are", 1.6, 1.8]]},
+            {"text": "see you", "start": 2.0, "end": 2.6, "words": [["see", 2.0, 2.3], ["you", 2.3, 2.6]]},
+            {"text": "bye", "start": 3.0, "end": 3.3, "words": [["bye", 3.0, 3.3]]},
+        ]
+        # "how are" has inconsistent times and "see you" was edited; both are aligned between their neighbours
+        texts = ["hello there .", "how are", "see you soon", "bye"]
+        reused, runs, words = plan_from_asr(asr_words, texts)
+        self.assertEqual(runs, [[1, 2]])
+
+        words = self.realign(texts, words, reused, runs)
+        self.assertEqual({word["utterance_id"] for word in words}, {1, 2, 3, 4})
+        self.assertEqual([word["word"] for word in words if word["utterance_id"] == 3], ["see", "you", "soon"])
+
+
+class ProcessAlignmentTaskTest(TestCase):
+    ASR_WORDS = [
+        {"text": "hello there", "start": 0.0, "end": 0.8, "words": [["hello", 0.0, 0.4], ["there", 0.4, 0.8]]},
+        {"text": "bye", "start": 3.0, "end": 3.3, "words": [["bye", 3.0, 3.3]]},
+    ]
+    CHAT = "@Begin\n*PAR0:\thello there .\n*PAR0:\tbye .\n@End\n"
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        use_temp_media(self)
+        audio = AudioFile.objects.create(title="talk.mp3", audio_file=SimpleUploadedFile("talk.mp3", b"audio"),
+                                         content_hash="a" * 64)
+        self.transcript = Transcript.objects.create(audio=audio, asr_words=self.ASR_WORDS)
+        from batch_processor.cache import alignment_cache
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        # The cache is built once per process from the settings overridden below
+        alignment_cache.cache_clear()
+        self.addCleanup(alignment_cache.cache_clear)
+
+    def run_task(self, cha_file=None):
+        import os
+        import sys
+        from unittest import mock
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.test import override_settings
+        from .views import process_alignment_task
+        document_module = fake_batchalign_document()
+
+        class CHATFile:
+            def __init__(self, path):
+                with open(path) as f:
+                    lines = [line.split(":", 1)[1].strip() for line in f if line.startswith("*")]
+                self.doc = document_module.Document.new(text=lines)
+
+        task = ForcedAlignmentTask.objects.create(original_transcript=self.transcript)
+        if cha_file is not None:
+            task.cha_file = SimpleUploadedFile("talk.cha", cha_file.encode("utf-8"))
+            task.save()
+        modules = {"batchalign.document": document_module, "batchalign.formats": types.SimpleNamespace(CHATFile=CHATFile)}
+        with override_settings(BATCHALIGN_CACHE_DIR=self.cache_dir), mock.patch.dict(sys.modules, modules), \
+                mock.patch.dict(os.environ, {"REV_API_KEY": "test"}):
+            process_alignment_task(task.id)
+        return ForcedAlignmentTask.objects.get(id=task.id)
+
+    def test_second_run_is_served_from_the_cache(self):
+        # The first run takes its timings from the ASR words and caches them
+        first = self.run_task(cha_file=self.CHAT)
+
+        # Without the ASR words the second run would need an engine; the cache makes that unnecessary
+        Transcript.objects.filter(id=self.transcript.id).update(asr_words=None)
+        second = self.run_task(cha_file=self.CHAT)
+
+        self.assertFalse(first.from_cache)
+        self.assertTrue(second.from_cache)
+        self.assertEqual(second.status, "COMPLETED")
+        self.assertEqual(second.word_timestamps, first.word_timestamps)
+        self.assertEqual([word["word"] for word in second.word_timestamps], ["hello", "there", "bye"])
+
+    def test_linked_transcript_text_comes_from_its_chat(self):
+        from .incremental import plan_from_asr
+        self.assertIsNone(plan_from_asr(self.ASR_WORDS, []))
+
+        self.transcript.chat_content = self.CHAT
+        self.transcript.save()
+        task = self.run_task()
+        self.assertEqual(task.status, "COMPLETED", task.error_message)
+        self.assertEqual(task.utterance_texts, ["hello there .", "bye ."])
+        self.assertEqual({word["utterance_id"] for word in task.word_timestamps}, {1, 2})
+
+    def test_no_text_is_not_completed_from_the_asr_prior(self):
+        # Nothing to seed: the audio-only document needs an engine, which is not available here
+        task = self.run_task()
+        self.assertEqual(task.status, "FAILED")
+        self.assertIsNone(task.word_timestamps)
+
+
+class WordTimingsTest(TestCase):
+    def test_packed_timings_and_time_range_api(self):
+        from .timings import WordTimings
+        words = [
+            {"word": "bye", "start": 4.0, "end": 4.3, "utterance_id": 3},
+            {"word": "hello", "start": 0.0, "end": 0.5, "utterance_id": 1},
+            {"word": "hello", "start": 1.0, "end": 3.5, "utterance_id": 2},
+            {"word": "there", "start": 2.0, "end": 2.4, "utterance_id": 2},
+        ]
+        timings = WordTimings.from_bytes(WordTimings.from_dicts(words).to_bytes())
+        self.assertEqual(timings.vocabulary, ["hello", "there", "bye"])
+        self.assertEqual(timings.to_dicts(), sorted(words, key=lambda word: word["start"]))
+        # The long "hello" still overlaps 3.0s although "there" has ended
+        self.assertEqual(timings.window(3.0, 3.9), (1, 3))
+
+        task = ForcedAlignmentTask.objects.create(status="COMPLETED")
+        task.word_timestamps = words
+        task.save()
+        data = self.client.get(f"/forced-alignment/api/words/{task.id}/", {"start": 3.0, "end": 5}).json()
+        # A contiguous run, so "there" (ended before 3.0s) stays and indices line up with `first`
+        self.assertEqual([(w["word"], w["start"]) for w in data["words"]], [("hello", 1.0), ("there", 2.0), ("bye", 4.0)])
+        self.assertEqual((data["first"], data["total"]), (1, 4))
+
+    def test_migration_keeps_its_own_copy_of_the_format(self):
+        import importlib
+        from .timings import WordTimings
+        migration = importlib.import_module("forced_alignment.migrations.0008_columnar_word_timings")
+        words = [
+            {"word": "there", "start": 0.4, "end": 0.8, "utterance_id": 1},
+            {"word": "hello", "start": 0.0, "end": 0.4, "utterance_id": 1},
+            {"word": "hello", "start": 2.0, "end": 2.5, "utterance_id": None},
+        ]
+        blob = migration.pack(words)
+        self.assertEqual(blob, WordTimings.from_dicts(words).to_bytes())
+        self.assertEqual(migration.unpack(blob), WordTimings.from_bytes(blob).to_dicts())
+        self.assertEqual(migration.pack([]), WordTimings.from_dicts([]).to_bytes())
+        self.assertEqual(migration.unpack(migration.pack([])), [])
+
+    def test_detail_page_does_not_embed_words(self):
+        task = ForcedAlignmentTask.objects.create(status="COMPLETED")
+        task.word_timestamps = [{"word": f"w{i}", "start": i * 0.5, "end": i * 0.5 + 0.4, "utterance_id": 1}
+                                for i in range(1000)]
+        task.save()
+        page = self.client.get(f"/forced-alignment/task/{task.id}/").content.decode()
+        self.assertNotIn("w999", page)
+        self.assertIn(f"/forced-alignment/api/index/{task.id}/", page)
+
+        index = self.client.get(f"/forced-alignment/api/index/{task.id}/").json()
+        self.assertEqual(index["total"], 1000)
+        self.assertEqual(index["starts_ms"][:3], [0, 500, 1000])
+
+
+class AlignmentIndexTest(TestCase):
+    def test_index_and_transcript_picker_are_paginated(self):
+        from . import views
+        for i in range(3):
+            transcript = Transcript.objects.create(audio=AudioFile.objects.create(title=f"session{i}.mp3"))
+            task = ForcedAlignmentTask.objects.create(original_transcript=transcript, status="COMPLETED")
+            task.word_timestamps = [{"word": "hi", "start": 0.0, "end": 0.2, "utterance_id": 1}]
+            task.save()
+
+        with self.assertNumQueries(2):  # Count and one page of tasks with their titles
+            response = self.client.get("/forced-alignment/")
+        self.assertContains(response, "session2.mp3")
+        task = response.context["alignment_tasks"][0]
+        self.assertEqual(task.get_deferred_fields() & {"word_timings", "utterance_texts"}, {"word_timings", "utterance_texts"})
+
+        original_page_size = views.TRANSCRIPT_PICKER_PAGE_SIZE
+        views.TRANSCRIPT_PICKER_PAGE_SIZE = 2
+        self.addCleanup(setattr, views, "TRANSCRIPT_PICKER_PAGE_SIZE", original_page_size)
+        first = self.client.get("/forced-alignment/api/transcripts/").json()
+        self.assertEqual([t["title"] for t in first["transcripts"]], ["session2.mp3", "session1.mp3"])
+        self.assertTrue(first["has_next"])
+        second = self.client.get("/forced-alignment/api/transcripts/", {"page": 2}).json()
+        self.assertEqual([t["title"] for t in second["transcripts"]], ["session0.mp3"])
+        found = self.client.get("/forced-alignment/api/transcripts/", {"q": "SION1"}).json()
+        self.assertEqual([t["title"] for t in found["transcripts"]], ["session1.mp3"])
+
+
+class WorkerPoolTest(TestCase):
+    def test_worker_process_can_run_the_alignment_pool(self):
+        import multiprocessing
+        from batch_processor.management.commands.run_workers import start_worker
+        from .parallel import pool_ready
+        ctx = multiprocessing.get_context("spawn")
+
+        # Started as run_workers starts its workers (a daemonic one may not have children),
+        # the pool has to come up and the worker exit cleanly afterwards
+        worker = start_worker(ctx, pool_ready, (60,))
+        worker.join(90)
+        self.assertEqual(worker.exitcode, 0)
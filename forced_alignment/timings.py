@@ -0,0 +1,98 @@
+"""
+Compact storage for word-level alignment timings.
+
+Instead of a JSON list of {"word", "start", "end", "utterance_id"} dicts, a
+task's timings are kept as parallel arrays sorted by start time: float32
+starts and ends (seconds), int32 utterance ids and int32 indices into a table
+of distinct words. They are serialised into one binary blob:
+
+    header   b'WTS1', word count, vocabulary size (little-endian uint32)
+    arrays   starts, ends, utterance_ids, word_index
+    words    the vocabulary, UTF-8, NUL-separated
+
+A time window is found by binary search over the starts (and the running
+maximum of the ends), so a slice of a long session is read without building
+a dict per word.
+"""
+
+import struct
+
+import numpy as np
+
+MAGIC = b'WTS1'
+_HEADER = struct.Struct('<4sII')
+
+
+class WordTimings:
+    def __init__(self, starts, ends, utterance_ids, word_index, vocabulary):
+        self.starts = starts
+        self.ends = ends
+        self.utterance_ids = utterance_ids
+        self.word_index = word_index
+        self.vocabulary = vocabulary
+        self._max_ends = None
+
+    @classmethod
+    def from_dicts(cls, words):
+        """Build from a list of word dicts, sorting them by start time"""
+        words = sorted(words or [], key=lambda word: word['start'])
+        vocabulary = []
+        interned = {}
+        word_index = np.empty(len(words), dtype=np.int32)
+        for i, word in enumerate(words):
+            text = word['word']
+            if text not in interned:
+                interned[text] = len(vocabulary)
+                vocabulary.append(text)
+            word_index[i] = interned[text]
+        return cls(
+            np.array([word['start'] for word in words], dtype=np.float32),
+            np.array([word['end'] for word in words], dtype=np.float32),
+            np.array([word.get('utterance_id') or 0 for word in words], dtype=np.int32),
+            word_index,
+            vocabulary,
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)
+        magic, count, vocabulary_size = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a word timings blob")
+        offset = _HEADER.size
+        arrays = []
+        for dtype in ('<f4', '<f4', '<i4', '<i4'):
+            arrays.append(np.frombuffer(data, dtype=dtype, count=count, offset=offset))
+            offset += 4 * count
+        vocabulary = data[offset:].decode('utf-8').split('\0') if vocabulary_size else []
+        return cls(*arrays, vocabulary)
+
+    def to_bytes(self):
+        parts = [_HEADER.pack(MAGIC, len(self), len(self.vocabulary))]
+        parts.extend(np.ascontiguousarray(array, dtype=dtype).tobytes() for array, dtype in (
+            (self.starts, '<f4'), (self.ends, '<f4'), (self.utterance_ids, '<i4'), (self.word_index, '<i4')))
+        parts.append('\0'.join(self.vocabulary).encode('utf-8'))
+        return b''.join(parts)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def window(self, t0, t1):
+        """(first, last) index range of the words overlapping [t0, t1] seconds"""
+        if self._max_ends is None:
+            self._max_ends = np.maximum.accumulate(self.ends) if len(self) else self.ends
+        # Every word before `first` has ended before t0; every word from `last` on starts after t1
+        first = int(np.searchsorted(self._max_ends, t0, side='left'))
+        last = int(np.searchsorted(self.starts, t1, side='right'))
+        return first, max(first, last)
+
+    def to_dicts(self, first=0, last=None):
+        """Word dicts of the index range [first, last), times rounded to milliseconds"""
+        last = len(self) if last is None else last
+        vocabulary = self.vocabulary
+        return [
+            {'word': vocabulary[index], 'start': round(start, 3), 'end': round(end, 3), 'utterance_id': utterance_id}
+            for index, start, end, utterance_id in zip(
+                self.word_index[first:last].tolist(), self.starts[first:last].tolist(),
+                self.ends[first:last].tolist(), self.utterance_ids[first:last].tolist())
+        ]
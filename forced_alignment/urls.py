@@ -16,4 +16,13 @@ urlpatterns = [
     
     # API endpoint to check the status of an alignment task
     path('api/status/<int:task_id>/', views.check_alignment_status, name='check_status'),
+    
+    # API endpoint for the aligned words in a time range
+    path('api/words/<int:task_id>/', views.alignment_words, name='words'),
+    
+    # API endpoint for the sorted word start times used to follow playback
+    path('api/index/<int:task_id>/', views.alignment_index, name='word_index'),
+    
+    # API endpoint for the searchable, paginated transcript picker
+    path('api/transcripts/', views.transcript_choices, name='transcript_choices'),
 ]
@@ -1,46 +1,85 @@
 import os
 import json
+import inspect
 import logging
 from django.shortcuts import render, get_object_or_404, redirect
+from django.core.paginator import Paginator
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from django.contrib import messages
+from django.utils import timezone
 
 from batch_processor.models import Transcript
+from batch_processor.cache import alignment_cache, alignment_cache_key, file_sha256, normalized_text_hash
 from .models import ForcedAlignmentTask
+from .tasks import ProgressReporter
+from .incremental import plan_from_asr, plan_incremental, run_window, splice, utterance_text, word_bounds_by_utterance
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Rows per page of the task list and of the transcript picker
+TASKS_PAGE_SIZE = 25
+TRANSCRIPT_PICKER_PAGE_SIZE = 20
+
 def index(request):
     """
     Main page for forced alignment feature.
     Provides a form to upload audio and .cha files for alignment,
-    and shows a list of existing alignment tasks.
+    and shows a page of existing alignment tasks. Only the displayed columns
+    are loaded; transcripts for the picker come from transcript_choices.
     """
-    # Get all alignment tasks
-    alignment_tasks = ForcedAlignmentTask.objects.all()
-    
-    # Optionally get transcripts for reference
-    transcripts = Transcript.objects.all()
+    alignment_tasks = (
+        ForcedAlignmentTask.objects
+        .select_related('original_transcript__audio')
+        .only('id', 'title', 'status', 'engine_used', 'created_at',
+              'original_transcript__id', 'original_transcript__audio__id', 'original_transcript__audio__title')
+        .order_by('-created_at', '-id')
+    )
+    page = Paginator(alignment_tasks, TASKS_PAGE_SIZE).get_page(request.GET.get('page'))
     
     context = {
-        'transcripts': transcripts,
-        'alignment_tasks': alignment_tasks
+        'alignment_tasks': page,
+        'page': page
     }
     
     return render(request, 'forced_alignment/index.html', context)
 
+def transcript_choices(request):
+    """
+    Transcripts for the picker, newest first, as {id, title} pages:
+    ?q= filters by audio title, ?page= selects the page
+    """
+    transcripts = (
+        Transcript.objects
+        .select_related('audio')
+        .only('id', 'created_at', 'audio__id', 'audio__title')
+        .order_by('-created_at', '-id')
+    )
+    query = request.GET.get('q', '').strip()
+    if query:
+        transcripts = transcripts.filter(audio__title__icontains=query)
+    
+    page = Paginator(transcripts, TRANSCRIPT_PICKER_PAGE_SIZE).get_page(request.GET.get('page'))
+    return JsonResponse({
+        'status': 'success',
+        'page': page.number,
+        'has_next': page.has_next(),
+        'transcripts': [{'id': transcript.id, 'title': transcript.audio.title} for transcript in page]
+    })
+
 def alignment_detail(request, task_id):
     """
     Detail view for a specific alignment task.
-    Shows the results of the alignment with word-level timestamps.
+    Shows the results of the alignment with word-level timestamps; the words
+    themselves are loaded by the page a window at a time (alignment_words).
     """
-    task = get_object_or_404(ForcedAlignmentTask, id=task_id)
+    task = get_object_or_404(ForcedAlignmentTask.objects.defer('word_timings'), id=task_id)
     
     context = {
-        'task': task
+        'task': task,
+        'has_words': ForcedAlignmentTask.objects.filter(id=task_id, word_timings__isnull=False).exists()
     }
     
     return render(request, 'forced_alignment/detail.html', context)
@@ -66,6 +105,7 @@ def start_alignment(request):
                 title = request.POST.get('title', 'Unnamed Alignment')
                 engine = request.POST.get('engine', 'AUTO')
                 transcript_id = request.POST.get('transcript_id')
+                baseline_task_id = request.POST.get('baseline_task_id')
                 
                 # Make sure we have at least an audio file
                 if not audio_file:
@@ -84,6 +124,9 @@ def start_alignment(request):
                 if cha_file:
                     task.cha_file = cha_file
                 
+                # Re-align only what changed since a previous task, if one is given
+                task.baseline_task = get_baseline_task(baseline_task_id)
+                
                 # Link to existing transcript if provided
                 if transcript_id:
                     try:
@@ -92,29 +135,18 @@ def start_alignment(request):
                     except Transcript.DoesNotExist:
                         pass  # We'll continue without linking a transcript
                 
+                # Saved as PENDING; a run_workers process picks it up
                 task.save()
+                logger.info(f"Queued alignment task {task.id}")
                 
-                # Mark as processing and save
-                task.status = 'PROCESSING'
-                task.save()
-                
-                # Process the alignment (in production this would be a Celery task)
-                try:
-                    process_alignment_task(task.id)
-                    messages.success(request, 'Forced alignment task started successfully')
-                    return redirect('forced_alignment:detail', task_id=task.id)
-                except Exception as e:
-                    logger.error(f"Error in alignment process: {e}")
-                    task.status = 'FAILED'
-                    task.error_message = str(e)
-                    task.save()
-                    messages.error(request, f'Error in alignment process: {str(e)}')
-                    return redirect('forced_alignment:index')
+                messages.success(request, 'Forced alignment task queued')
+                return redirect('forced_alignment:detail', task_id=task.id)
             else:
                 # Handle JSON data for existing transcript (API request)
                 data = json.loads(request.body)
                 transcript_id = data.get('transcript_id')
                 engine = data.get('engine', 'AUTO')
+                baseline_task_id = data.get('baseline_task_id')
                 
                 if not transcript_id:
                     return JsonResponse({'status': 'error', 'message': 'Transcript ID is required when not uploading files'})
@@ -127,22 +159,12 @@ def start_alignment(request):
                     title=f"Alignment for {transcript.audio.title}",
                     original_transcript=transcript,
                     engine_used=engine,
+                    baseline_task=get_baseline_task(baseline_task_id),
                     status='PENDING'
                 )
-            
-                # Mark as processing and save
-                task.status = 'PROCESSING'
-                task.save()
+                logger.info(f"Queued alignment task {task.id}")
                 
-                # Process the alignment (in production this would be a Celery task)
-                try:
-                    process_alignment_task(task.id)
-                except Exception as e:
-                    logger.error(f"Error in alignment process: {e}")
-                    task.status = 'FAILED'
-                    task.error_message = str(e)
-                    task.save()
-                    
+                # A run_workers process picks the task up; poll check_alignment_status for progress
                 return JsonResponse({'status': 'success', 'task_id': task.id})
                 
         except Exception as e:
@@ -161,6 +183,12 @@ def start_alignment(request):
     else:
         return redirect('forced_alignment:index')
 
+def get_baseline_task(baseline_task_id):
+    """The completed task to re-align incrementally against, or None"""
+    if not baseline_task_id:
+        return None
+    return ForcedAlignmentTask.objects.filter(id=baseline_task_id, status='COMPLETED').first()
+
 def check_alignment_status(request, task_id):
     """
     API endpoint to check the status of an alignment task.
@@ -169,6 +197,13 @@ def check_alignment_status(request, task_id):
     
     response = {
         'status': task.status,
+        'stage': task.stage,
+        'stage_display': task.get_stage_display(),
+        'utterances_aligned': task.utterances_aligned,
+        'utterances_total': task.utterances_total,
+        'elapsed_seconds': task.elapsed_seconds,
+        'from_cache': task.from_cache,
+        'baseline_task_id': task.baseline_task_id,
         'created_at': task.created_at,
         'updated_at': task.updated_at
     }
@@ -178,18 +213,182 @@ def check_alignment_status(request, task_id):
     
     return JsonResponse(response)
 
+def alignment_words(request, task_id):
+    """
+    Words of a completed task around the window ?start=t0&end=t1 (seconds): the
+    contiguous run of the time-sorted word list that covers every word overlapping
+    it. Without a window every word is returned. `first` is the index of the first
+    returned word in that list, and `total` its length.
+    """
+    task = get_object_or_404(ForcedAlignmentTask, id=task_id)
+    timings = task.timings()
+    if timings is None:
+        return JsonResponse({'status': 'error', 'message': 'No word timings for this task'}, status=404)
+    
+    try:
+        t0 = float(request.GET.get('start', 0))
+        t1 = float(request.GET.get('end', 'inf'))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'start and end must be numbers of seconds'}, status=400)
+    
+    first, last = timings.window(t0, t1)
+    words = timings.to_dicts(first, last)
+    return JsonResponse({
+        'status': 'success',
+        'start': t0,
+        'end': t1 if t1 != float('inf') else None,
+        'first': first,
+        'total': len(timings),
+        'words': words
+    })
+
+def alignment_index(request, task_id):
+    """
+    Sorted start times (milliseconds) of every word of a completed task, for the
+    detail page to find the word under the playhead by binary search
+    """
+    task = get_object_or_404(ForcedAlignmentTask, id=task_id)
+    timings = task.timings()
+    if timings is None:
+        return JsonResponse({'status': 'error', 'message': 'No word timings for this task'}, status=404)
+    
+    return JsonResponse({
+        'status': 'success',
+        'total': len(timings),
+        'starts_ms': (timings.starts.astype('float64') * 1000).round().astype('int64').tolist()
+    })
+
+def extract_word_timestamps(aligned_document, utterance_ids=None):
+    """
+    Word-level timestamps (seconds) of an aligned batchalign Document, sorted by start.
+    utterance_id counts utterances from 1, or comes from `utterance_ids` when the
+    document holds a subset of the transcript's utterances.
+    """
+    from batchalign.document import Utterance
+    
+    word_timestamps = []
+    aligned_words_count = 0
+    utterance_count = 0
+    
+    # Iterate through each utterance in the aligned document
+    for utterance in aligned_document.content:
+        # Skip non-utterance items
+        if not isinstance(utterance, Utterance):
+            continue
+            
+        utterance_count += 1
+        
+        # Check if the utterance has tokens
+        if not hasattr(utterance, 'tokens') or not utterance.tokens:
+            logger.warning(f"Utterance found with no tokens: '{utterance}'")
+            continue
+        
+        # Track utterance start time for relative positioning
+        utterance_start_ms = None
+        if hasattr(utterance, 'start_ms') and utterance.start_ms is not None:
+            utterance_start_ms = utterance.start_ms
+        
+        # Process each token in the utterance
+        for token in utterance.tokens:
+            # Skip tokens without timing information
+            if not hasattr(token, 'start_ms') or not hasattr(token, 'end_ms'):
+                continue
+            
+            # Handle potential None values or missing attributes
+            if token.start_ms is None or token.end_ms is None:
+                continue
+            
+            # Skip punctuation and empty tokens
+            if not token.text or token.text.strip() in ".,;:!?\"'()[]{}":
+                continue
+                
+            # Convert milliseconds to seconds for the UI
+            start_sec = token.start_ms / 1000.0
+            end_sec = token.end_ms / 1000.0
+            
+            # Validate the timing (end should be after start)
+            if end_sec <= start_sec:
+                # Fix invalid timing by adding a small duration
+                end_sec = start_sec + 0.1
+            
+            # Add to our results
+            word_timestamps.append({
+                "word": token.text,
+                "start": start_sec,
+                "end": end_sec,
+                "utterance_id": utterance_ids[utterance_count - 1] if utterance_ids else utterance_count  # Track which utterance this belongs to
+            })
+            
+            aligned_words_count += 1
+            
+    # Sort by start time to ensure chronological order
+    word_timestamps.sort(key=lambda x: x['start'])
+            
+    # Log the results
+    logger.info(f"Successfully aligned {aligned_words_count} words across {utterance_count} utterances")
+    
+    return word_timestamps
+
+def realign_changed_utterances(pipeline, document, utterances, baseline_words, reused, runs, media_path, progress):
+    """
+    Align each run of changed utterances within the audio between its unchanged
+    neighbours, and splice the words into the baseline's word_timestamps
+    """
+    from batch_processor.pcm import PcmAudio
+    
+    try:
+        duration = PcmAudio(media_path).duration
+    except Exception:
+        duration = None  # Not the canonical PCM; the last run's window is bounded by the chunk length instead
+    old_bounds = word_bounds_by_utterance(baseline_words)
+    margin = settings.BATCHALIGN_FA_INCREMENTAL_MARGIN
+    progress.utterances(0, sum(len(run) for run in runs))
+    logger.info(f"Re-aligning {sum(len(run) for run in runs)} of {len(utterances)} utterances in {len(runs)} runs")
+    
+    new_words = []
+    aligned_count = 0
+    for run in runs:
+        start, end = run_window(run, reused, old_bounds, len(utterances), margin, duration)
+        if end is None:
+            end = start + margin + settings.BATCHALIGN_FA_CHUNK_SECONDS
+        window = (int(start * 1000), int(end * 1000))
+        # Every utterance of the run may fall anywhere in the window
+        selected = [utterances[index].model_copy(update={'time': window}) for index in run]
+        aligned = pipeline.process(document.model_copy(update={'content': selected}))
+        new_words.extend(extract_word_timestamps(aligned, [index + 1 for index in run]))
+        aligned_count += len(run)
+        progress.utterances(aligned_count)
+    
+    return splice(baseline_words, reused, new_words)
+
+def read_text(path):
+    """Contents of a transcript file, tolerating stray bytes"""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+def accepts_callback(method):
+    """Whether a batchalign pipeline method takes a progress `callback` argument"""
+    try:
+        parameters = inspect.signature(method).parameters
+    except (TypeError, ValueError):
+        return False
+    return 'callback' in parameters or any(p.kind == p.VAR_KEYWORD for p in parameters.values())
+
 def process_alignment_task(task_id):
     """
     Process a forced alignment task.
-    This function should be called asynchronously (e.g., by Celery).
+    Called by the run_workers pool (see tasks.py), reporting each stage on the task.
     """
     # Get the task
     task = ForcedAlignmentTask.objects.get(id=task_id)
+    progress = ProgressReporter(task)
     
     try:
         # Update task status
         task.status = 'PROCESSING'
-        task.save()
+        task.started_at = task.started_at or timezone.now()
+        task.save(update_fields=['status', 'started_at', 'updated_at'])
+        progress.stage('PREPARING')
         
         # Initialize variables
         audio_file_path = None
@@ -211,6 +410,16 @@ def process_alignment_task(task_id):
         if not os.path.exists(audio_file_path):
             raise FileNotFoundError(f"Audio file not found at path: {audio_file_path}")
         
+        # Align against the shared 16 kHz mono PCM so the engine reads it without decoding or resampling
+        try:
+            from batch_processor.pcm import prepare_pcm
+            media_path = prepare_pcm(audio_file_path)
+        except Exception as e:
+            logger.warning(f"Could not prepare PCM for {audio_file_path}, aligning the upload as is: {e}")
+            media_path = audio_file_path
+        
+        progress.stage('READING_TRANSCRIPT')
+        
         # Determine if we have a .cha file uploaded directly
         if task.cha_file:
             cha_file_path = task.cha_file.path
@@ -220,7 +429,11 @@ def process_alignment_task(task_id):
         if task.original_transcript:
             transcript = task.original_transcript
             transcript_format = transcript.format
-            transcript_text = transcript.get_segments()
+            if transcript_format == 'CHAT' and transcript.chat_content:
+                # The utterance tiers of the stored CHAT (get_segments() only reads list-shaped raw_content)
+                transcript_text = [{'text': utterance['text']} for utterance in transcript.parsed_chat()['utterances']]
+            else:
+                transcript_text = transcript.get_segments()
             logger.info(f"Using transcript text from linked transcript in {transcript_format} format")
         
         # Get the API keys
@@ -241,7 +454,8 @@ def process_alignment_task(task_id):
         
         # Import batchalign here to avoid loading issues
         from batchalign.document import Document, Task, Utterance
-        from batchalign.pipelines.dispatch import dispatch_pipeline
+        from batch_processor.model_registry import get_pipeline
+        from .parallel import parallel_chunks, align_in_chunks
         from batchalign.formats import CHATFile  # Import CHATFile for processing .cha files
         
         # Configure batchalign with the Rev.ai API key
@@ -249,6 +463,7 @@ def process_alignment_task(task_id):
         
         # Initialize document variable
         document = None
+        source_text = ''  # The text being aligned, for the result cache key
         
         # Priority 1: Use directly uploaded .cha file if available
         if cha_file_path:
@@ -257,8 +472,9 @@ def process_alignment_task(task_id):
                 # Use CHATFile to load the .cha file and get a Document
                 chatfile = CHATFile(path=cha_file_path)
                 document = chatfile.doc
+                source_text = read_text(cha_file_path)
                 # Update the media path since we need to explicitly set it
-                document.media.url = audio_file_path
+                document.media.url = media_path
             except Exception as e:
                 logger.error(f"Error loading .cha file: {e}")
                 raise Exception(f"Failed to load .cha file: {str(e)}")
@@ -278,8 +494,9 @@ def process_alignment_task(task_id):
                         # Use CHATFile to load the .cha file and get a Document
                         chatfile = CHATFile(path=cha_path)
                         document = chatfile.doc
+                        source_text = read_text(cha_path)
                         # Update the media path since we need to explicitly set it
-                        document.media.url = audio_file_path
+                        document.media.url = media_path
                         logger.info(f"Loaded .cha file from {cha_path}")
                         break
                     except Exception as e:
@@ -308,12 +525,13 @@ def process_alignment_task(task_id):
             
             if texts:
                 # Create the document with audio and text
-                document = Document.new(text=texts, media_path=audio_file_path)
+                document = Document.new(text=texts, media_path=media_path)
+                source_text = '\n'.join(texts)
             
         # Last resort: Just use the audio file alone (if we still don't have a document)
         if document is None:
             logger.warning("No .cha file or transcript text available, using audio file only")
-            document = Document.new(text=None, media_path=audio_file_path)
+            document = Document.new(text=None, media_path=media_path)
         
         # Choose the appropriate engine based on task.engine_used
         engine = task.engine_used
@@ -340,88 +558,102 @@ def process_alignment_task(task_id):
             fa_override = "wav2vec_fa"
             logger.info(f"Unknown engine type '{engine}', falling back to Wav2Vec")
         
+        # Utterance texts, recorded so a later task can re-align only what was edited since
+        utterances = [item for item in document.content if isinstance(item, Utterance)]
+        task.utterance_texts = [utterance_text(utterance) for utterance in utterances]
+        
+        # Same audio, text, engine and batchalign version as an earlier task: reuse its result
+        if task.original_transcript and task.original_transcript.audio.content_hash and not task.audio_file:
+            audio_hash = task.original_transcript.audio.content_hash
+        else:
+            audio_hash = file_sha256(audio_file_path)
+        cache_key = alignment_cache_key(audio_hash, normalized_text_hash(source_text), fa_override or 'auto', lang)
+        cached = alignment_cache().get(cache_key)
+        if cached is not None:
+            logger.info(f"Alignment cache hit for task {task.id}")
+            task.word_timestamps = cached['word_timestamps']
+            task.from_cache = True
+            task.utterances_aligned = task.utterances_total = len(utterances)
+            task.status = 'COMPLETED'
+            task.stage = 'DONE'
+            task.finished_at = timezone.now()
+            task.save()
+            return True
+        
+        # With a baseline task, only the utterances edited since then are aligned again
+        incremental_plan = None
+        if task.baseline_task_id:
+            incremental_plan = plan_incremental(task.baseline_task, task.utterance_texts)
+            if incremental_plan:
+                incremental_plan += (task.baseline_task.word_timestamps,)
+        
+        # Otherwise the transcript's ASR word timings are the baseline: consistent
+        # utterances keep them and the rest are aligned in the gaps between
+        if incremental_plan is None and task.original_transcript and not task.audio_file:
+            incremental_plan = plan_from_asr(task.original_transcript.asr_words, task.utterance_texts)
+            if incremental_plan:
+                logger.info(f"Reusing ASR timings for {len(incremental_plan[0])} of {len(utterances)} utterances")
+        
         try:
-            # Dispatch the pipeline
-            # The dispatch_pipeline function takes a pipeline string and language
-            if fa_override:
-                pipeline = dispatch_pipeline(pipeline_str, lang, fa=fa_override)
-            else:
-                pipeline = dispatch_pipeline(pipeline_str, lang)
-            
-            logger.info(f"Processing document with {pipeline_str} pipeline")
+            overrides = {'fa': fa_override} if fa_override else {}
+            chunks = None if incremental_plan else parallel_chunks(document)
             
-            # Process the document
-            aligned_document = pipeline.process(document)
+            if incremental_plan:
+                reused, runs, baseline_words = incremental_plan
+                pipeline = None
+                if runs:
+                    progress.stage('LOADING_ENGINE')
+                    pipeline = get_pipeline(pipeline_str, lang, **overrides)
+                progress.stage('ALIGNING')
+                word_timestamps = realign_changed_utterances(
+                    pipeline, document, utterances, baseline_words, reused, runs, media_path, progress
+                )
+                aligned_document = None
+            elif chunks:
+                # Long, already timed documents are split at utterance boundaries and aligned across cores
+                progress.stage('ALIGNING')
+                progress.utterances(0, sum(isinstance(item, Utterance) for item in document.content))
+                aligned_document = align_in_chunks(document, chunks, pipeline_str, lang, overrides, progress)
+            else:
+                progress.stage('LOADING_ENGINE')
+                
+                # Reuse this process's pipeline for the same (pipeline, language, engine),
+                # so the engine weights are only loaded by the first task
+                pipeline = get_pipeline(pipeline_str, lang, **overrides)
+                
+                logger.info(f"Processing document with {pipeline_str} pipeline")
+                progress.stage('ALIGNING')
+                progress.utterances(0, sum(isinstance(item, Utterance) for item in document.content))
+                
+                # Process the document, with progress reported back if the pipeline supports it
+                if accepts_callback(pipeline.process):
+                    aligned_document = pipeline.process(document, callback=progress.callback)
+                else:
+                    aligned_document = pipeline.process(document)
             logger.info("Document processing complete")
         except Exception as e:
             logger.error(f"Error in pipeline processing: {str(e)}")
             raise Exception(f"Batchalign pipeline error: {str(e)}")
         
-        # Extract the word-level timestamps from the aligned document
-        word_timestamps = []
-        aligned_words_count = 0
-        utterance_count = 0
+        progress.stage('SAVING')
         
-        # Iterate through each utterance in the aligned document
-        for utterance in aligned_document.content:
-            # Skip non-utterance items
-            if not isinstance(utterance, Utterance):
-                continue
-                
-            utterance_count += 1
-            
-            # Check if the utterance has tokens
-            if not hasattr(utterance, 'tokens') or not utterance.tokens:
-                logger.warning(f"Utterance found with no tokens: '{utterance}'")
-                continue
-            
-            # Track utterance start time for relative positioning
-            utterance_start_ms = None
-            if hasattr(utterance, 'start_ms') and utterance.start_ms is not None:
-                utterance_start_ms = utterance.start_ms
-            
-            # Process each token in the utterance
-            for token in utterance.tokens:
-                # Skip tokens without timing information
-                if not hasattr(token, 'start_ms') or not hasattr(token, 'end_ms'):
-                    continue
-                
-                # Handle potential None values or missing attributes
-                if token.start_ms is None or token.end_ms is None:
-                    continue
-                
-                # Skip punctuation and empty tokens
-                if not token.text or token.text.strip() in ".,;:!?\"'()[]{}":
-                    continue
-                    
-                # Convert milliseconds to seconds for the UI
-                start_sec = token.start_ms / 1000.0
-                end_sec = token.end_ms / 1000.0
-                
-                # Validate the timing (end should be after start)
-                if end_sec <= start_sec:
-                    # Fix invalid timing by adding a small duration
-                    end_sec = start_sec + 0.1
-                
-                # Add to our results
-                word_timestamps.append({
-                    "word": token.text,
-                    "start": start_sec,
-                    "end": end_sec,
-                    "utterance_id": utterance_count  # Track which utterance this belongs to
-                })
-                
-                aligned_words_count += 1
-                
-        # Sort by start time to ensure chronological order
-        word_timestamps.sort(key=lambda x: x['start'])
-                
-        # Log the results
-        logger.info(f"Successfully aligned {aligned_words_count} words across {utterance_count} utterances")
+        # Extract the word-level timestamps from the aligned document
+        if aligned_document is not None:
+            word_timestamps = extract_word_timestamps(aligned_document)
         
         # Update the task with the results
         task.word_timestamps = word_timestamps
+        
+        try:
+            # The cache stores JSON, so the words rather than the packed blob
+            alignment_cache().set(cache_key, {'word_timestamps': task.word_timestamps})
+        except Exception as e:
+            logger.warning(f"Could not cache alignment of task {task.id}: {e}")
+        
         task.status = 'COMPLETED'
+        task.stage = 'DONE'
+        task.utterances_aligned = task.utterances_total
+        task.finished_at = timezone.now()
         task.save()
         
         return True
@@ -430,5 +662,6 @@ def process_alignment_task(task_id):
         logger.error(f"Error in process_alignment_task: {e}")
         task.status = 'FAILED'
         task.error_message = str(e)
+        task.finished_at = timezone.now()
         task.save()
         return False